@@ -0,0 +1,345 @@
+# ==========================================================
+# STUDENT ANSWER EXTRACTION
+# Turns an uploaded answer script into answer objects:
+#
+#   {"question_id", "text": [], "equations": [], "flowcharts": [],
+#    "final_answer": None}
+#
+# PDFs are first cut into questions from their headers (Q3 / 3. /
+# Ans 3), then routed: an answer whose text layer PyMuPDF can read
+# (typed / digitally written) is parsed locally; scanned, handwritten
+# (ink strokes) or diagram regions go to the vision LLM as crops.
+# ==========================================================
+
+import os
+import re
+import threading
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from backend.llm_json import ANSWER_SCHEMA, call_json, validate_answer
+from backend.llm_router import complete
+from backend.page_artifacts import PageArtifact, PageArtifactCache
+
+# Routing thresholds
+MIN_TEXT_CHARS = int(os.environ.get("GRADER_MIN_TEXT_CHARS", 40))         # text layer worth parsing
+MAX_IMAGE_COVERAGE = 0.5     # share of the page covered by raster images (scans)
+MAX_DRAWINGS = int(os.environ.get("GRADER_MAX_DRAWINGS", 25))             # vector paths: pen ink / diagrams
+
+# Process-wide routing counters (how many vision calls the text layer saved)
+ROUTING_STATS = {"pages": 0, "questions": 0, "text_layer": 0, "vision": 0, "vision_pixels": 0}
+_stats_lock = threading.Lock()
+
+# ==========================================================
+# VISION LLM EXTRACTION
+# ==========================================================
+
+# Models, fallback endpoints, hedging and deadlines: backend.llm_router ("extractor" route)
+
+def build_extraction_prompt(question_id):
+    return f"""
+    You are an academic answer extractor.
+    The image contains a QUESTION and its ANSWER.
+
+    TASK:
+    1. Extract ONLY the student's answer for Question ID: {question_id}.
+    2. Separate content into:
+       "text": ["List all and any sentences or text explanations written by the student.",
+            "Split distinct points into separate strings."],
+       "equations": [" - Write ALL chemical formulas and equations in STANDARD ASCII TEXT.
+        - DO NOT use Unicode subscripts or superscripts.
+        - Convert subscripts explicitly to numbers.
+
+      Examples:
+        H₂SO₄ → H2SO4
+        CH₃COOH → CH3COOH
+        C₂H₅OH → C2H5OH
+        H₂O → H2O
+      Use standard text representation (e.g., 'x^2 + 2x = 5', 'H2 + O2 -> H2O').
+      - Use '->' for reactions (do NOT use →).
+      - If a catalyst is written above the arrow, format as:
+          Reactants -(<catalyst that is written above arrow in equation>)-> Products
+      - Write ions as:
+          Fe3+, Fe2+, e-, Fe3e+
+      - Preserve equation structure, but normalize symbols.
+
+      If the student writes unclear chemistry, make the closest reasonable interpretation."],
+       "flowcharts/graph": [" Analyze the flowchart carefully.
+          If some text is unclear, make your best reasonable guess. " return in format:
+            {{
+                "nodes": [{{"id": "n1", "text": "Start", "shape": "oval/rect/diamond"}}],
+                "edges": [{{"source": "n1", "target": "n2", "label": "Yes/No"}}]
+            }}
+       ],
+       "final_answer": "Extract final result (e.g., 'x=5'). Return null if not found."
+
+    3. Do NOT hallucinate. If section is empty, return empty list [].
+    4. OUTPUT STRICT JSON ONLY.
+
+    {{
+      "question_id": "{question_id}",
+      "text": [],
+      "equations": [],
+      "flowcharts": [],
+      "final_answer": null
+    }}
+    """
+
+def extract_answer_obj_from_image(image: Image.Image, question_id: str):
+    """Sends image to LLM to extract student answer as JSON."""
+    return extract_answer_obj(PageArtifact.from_image(image), question_id)
+
+def extract_answer_obj(artifact: PageArtifact, question_id: str):
+    """Same, from an already encoded page artifact (no re-encoding)."""
+    prompt = build_extraction_prompt(question_id)
+
+    def request():
+        return complete("extractor", prompt, images=[artifact], schema=("student_answer", ANSWER_SCHEMA))
+
+    try:
+        # Repaired locally when possible; the vision call is repeated only if that fails
+        data = call_json(request, validate_answer)
+        data["question_id"] = data.get("question_id") or question_id
+        return data
+
+    except Exception as e:
+        # This prints the specific error to your terminal for debugging
+        print(f"Extraction Error: {e}")
+        return {"error": str(e), "question_id": question_id}
+
+# ==========================================================
+# TEXT-LAYER PARSING (NO LLM)
+# ==========================================================
+
+_SUBSCRIPTS = str.maketrans("₀₁₂₃₄₅₆₇₈₉⁰¹²³⁴⁵⁶⁷⁸⁹⁺⁻", "01234567890123456789+-")
+_SYMBOLS = [("→", "->"), ("⟶", "->"), ("⇌", "<->"), ("−", "-"), ("×", "*"), ("÷", "/"), ("·", "*")]
+
+_FINAL = re.compile(r"^\s*(?:(?:final\s+)?(?:answer|ans|result)\s*[:=\-–]|∴)\s*(.+)$", re.I)
+_EQUATION = re.compile(r"(->|<->|=)")
+_WORD = re.compile(r"[A-Za-z]{4,}")
+
+def normalize_math(line):
+    line = line.translate(_SUBSCRIPTS)
+    for src, dst in _SYMBOLS:
+        line = line.replace(src, dst)
+    return re.sub(r"\s+", " ", line).strip()
+
+def _is_equation(line):
+    """An '=' / '->' line that is mostly symbols, not a sentence that happens to contain '='."""
+    if not _EQUATION.search(line):
+        return False
+    words = _WORD.findall(line)
+    return len(words) <= 2 and len(" ".join(words)) < 0.4 * len(line)
+
+def parse_text_answer(raw_text, question_id):
+    """Text-layer lines → answer object (same shape as the vision extractor's output)."""
+    ans = {"question_id": question_id, "text": [], "equations": [], "flowcharts": [], "final_answer": None}
+    paragraph = []
+
+    def flush():
+        if paragraph:
+            ans["text"].append(" ".join(paragraph))
+            paragraph.clear()
+
+    for raw in raw_text.splitlines():
+        line = raw.strip()
+        if not line:
+            flush()
+            continue
+        final = _FINAL.match(line)
+        if final and len(final.group(1)) <= 80:    # a labelled result, not a paragraph
+            flush()
+            ans["final_answer"] = normalize_math(final.group(1))
+            continue
+        math_line = normalize_math(line)
+        if _is_equation(math_line):
+            flush()
+            ans["equations"].append(math_line)
+            continue
+        paragraph.append(line)
+        # A line ending a sentence closes the point
+        if line.endswith((".", "?", "!")):
+            flush()
+    flush()
+    return ans
+
+# ==========================================================
+# PAGE ROUTING
+# ==========================================================
+
+def page_layout(page):
+    """Raster image boxes and vector drawing boxes of a page (for routing its regions)."""
+    images = [fitz.Rect(info["bbox"]) & page.rect for info in page.get_image_info()]
+    drawings = [fitz.Rect(d["rect"]) for d in page.get_drawings()]
+    return images, drawings
+
+def _overlaps(rect, clip):
+    # Drawn lines have zero-height rects, so no Rect.intersects()
+    return rect.x0 <= clip.x1 and rect.x1 >= clip.x0 and rect.y0 <= clip.y1 and rect.y1 >= clip.y0
+
+def needs_vision(layout, clip):
+    """True when the region is a scan (mostly raster image) or pen ink / a drawn diagram."""
+    images, drawings = layout
+    image_area = sum(abs(img & clip) for img in images)
+    if image_area / (abs(clip) or 1.0) > MAX_IMAGE_COVERAGE:
+        return True    # scan with an OCR layer: trust the image, not the OCR
+    return sum(1 for d in drawings if _overlaps(d, clip)) > MAX_DRAWINGS
+
+def route_page(page, clip=None):
+    """
+    "text_layer" when the page's (or clip's) own text can be parsed,
+    otherwise "vision". Returns (route, text).
+    """
+    clip = clip or page.rect
+    text = page.get_text("text", clip=clip)
+    if len(text.strip()) < MIN_TEXT_CHARS or needs_vision(page_layout(page), clip):
+        return "vision", text
+    return "text_layer", text
+
+# ==========================================================
+# QUESTION BOUNDARIES
+# Headers ("Q3", "Question 3", "Ans 3", or a bare "3." at the left
+# margin) are found in the text layer and cut the document into
+# regions; each question gets all of its regions, across pages.
+# ==========================================================
+
+# "Q3." / "Question 3:" / "Ans 3)" / a bare "Q3" line; not "q2 = 3 uC" (an answer using q2)
+_HEADER = re.compile(
+    r"^\s*(?:(?:q(?:uestion)?|ans(?:wer)?)\s*\.?\s*(\d{1,3})\s*(?:[.):]|$)(?!\s*[=+*/^<>])"
+    r"|(\d{1,3})\s*[.)](?=\s|$))", re.I)
+HEADER_INDENT = 20   # pt from the left text margin for a bare "3." to count as a header
+HEADER_PAD = 4       # pt kept above a header line when cutting
+
+def _lines(page):
+    """[(rect, text)] of the page's text lines, top to bottom."""
+    lines = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                lines.append((fitz.Rect(line["bbox"]), text))
+    lines.sort(key=lambda l: (round(l[0].y0), l[0].x0))
+    return lines
+
+def find_question_headers(doc):
+    """
+    [(page_no, y, number)] in reading order. Explicit "Q"/"Ans" headers win;
+    bare numbers are only used when there are none, and must count up by
+    one so numbered steps inside an answer are not taken for questions.
+    """
+    explicit, bare = [], []
+    for pno, page in enumerate(doc):
+        lines = _lines(page)
+        margin = min((r.x0 for r, _ in lines), default=0)
+        for rect, text in lines:
+            m = _HEADER.match(text)
+            if not m:
+                continue
+            if m.group(1):
+                explicit.append((pno, rect.y0, int(m.group(1))))
+            elif rect.x0 - margin <= HEADER_INDENT:
+                bare.append((pno, rect.y0, int(m.group(2))))
+
+    headers, current = [], None
+    for pno, y, n in explicit or bare:
+        if n == current:
+            continue    # "Q3 (contd.)"
+        if current is not None and (n < current if explicit else n != current + 1):
+            continue    # numbers only go up: a lower one is part of an answer
+        headers.append((pno, y, n))
+        current = n
+    return headers
+
+def question_regions(doc, headers):
+    """
+    {question_id: [(page_no, clip_rect)]} in order of first appearance.
+    Without any headers every page is its own question (Page i = Q{i+1}).
+    Content before the first header (name, roll number...) is skipped.
+    """
+    if not headers:
+        return {f"Q{p+1}": [(p, doc[p].rect)] for p in range(len(doc))}
+
+    cuts = {}
+    for pno, y, n in headers:
+        cuts.setdefault(pno, []).append((y, n))
+
+    regions, current = {}, None
+    for pno, page in enumerate(doc):
+        box = page.rect
+        top = box.y0
+        for y, n in cuts.get(pno, []):
+            cut = max(box.y0, y - HEADER_PAD)
+            if current is not None and cut - top > 1:
+                regions[current].append((pno, fitz.Rect(box.x0, top, box.x1, cut)))
+            current, top = f"Q{n}", cut
+            regions.setdefault(current, [])
+        if current is not None:
+            regions[current].append((pno, fitz.Rect(box.x0, top, box.x1, box.y1)))
+    return regions
+
+def _strip_header(text, question_id):
+    """Drops the "Q3." label from a region's first line (not a "2." step continuing an answer)."""
+    first, _, rest = text.lstrip().partition("\n")
+    m = _HEADER.match(first)
+    if m and f"Q{int(m.group(1) or m.group(2))}" == question_id:
+        first = first[m.end():].lstrip(" .:)-")
+    return f"{first}\n{rest}"
+
+# ==========================================================
+# PDF EXTRACTION
+# ==========================================================
+
+def _count(stats):
+    with _stats_lock:
+        for key in ROUTING_STATS:
+            ROUTING_STATS[key] += stats.get(key, 0)
+
+def extract_pdf_answers(pdf_bytes, on_question=None, artifacts=None):
+    """
+    One answer object per detected question. A question whose pages all
+    have a usable text layer is parsed locally; otherwise its crops are
+    stacked and sent to the vision model in one call.
+    `on_question(i, n, question_id, route)` is called before each question.
+    `artifacts` (PageArtifactCache of this file) receives every question's
+    crop, so preview and upload reuse what extraction rendered.
+    Returns (answers, stats).
+    """
+    artifacts = artifacts or PageArtifactCache(pdf_bytes)
+    doc = artifacts.doc
+    headers = find_question_headers(doc)
+    regions = question_regions(doc, headers)
+    layouts = {}
+    answers = []
+    stats = {"pages": len(doc), "questions": len(regions), "text_layer": 0, "vision": 0, "vision_pixels": 0}
+
+    for i, (qid, parts) in enumerate(regions.items()):
+        texts = [doc[pno].get_text("text", clip=clip) for pno, clip in parts]
+        if headers:
+            texts = [_strip_header(t, qid) for t in texts]
+        for pno, _ in parts:
+            if pno not in layouts:
+                layouts[pno] = page_layout(doc[pno])
+        scanned = any(needs_vision(layouts[pno], clip) for pno, clip in parts)
+        # A detected header already proves the text layer is real: any answer text will do
+        min_chars = 1 if headers else MIN_TEXT_CHARS
+        route = "vision" if scanned or len("".join(texts).strip()) < min_chars else "text_layer"
+        if on_question:
+            on_question(i, len(regions), qid, route)
+
+        artifacts.register(qid, parts)
+        if route == "text_layer":
+            data = parse_text_answer("\n".join(texts), qid)
+        else:
+            artifact = artifacts.get(qid)
+            stats["vision_pixels"] += artifact.width * artifact.height
+            data = extract_answer_obj(artifact, qid)
+        data["extraction"] = route
+        data["source_pages"] = sorted({pno for pno, _ in parts})
+        answers.append(data)
+        stats[route] += 1
+
+    # The old flow made one vision call per page
+    stats["vision_calls_avoided"] = max(0, stats["pages"] - stats["vision"])
+    _count(stats)
+    return answers, stats
@@ -0,0 +1,27 @@
+# ==========================================================
+# BLOB STORAGE
+# Answer-script images are stored on ImgBB; the DB keeps only the
+# public URL (answers[i]["source_image"]). Key: IMGBB_API_KEY
+# (environment or secrets.toml).
+# ==========================================================
+
+import requests
+
+from backend.config import get_secret
+
+IMGBB_URL = "https://api.imgbb.com/1/upload"
+UPLOAD_TIMEOUT_S = 60
+
+def upload_image(image_bytes):
+    """Uploads encoded image bytes and returns the public URL (None without a key)."""
+    api_key = get_secret("IMGBB_API_KEY")
+    if not api_key:
+        return None
+    payload = {
+        "key": api_key,
+        "expiration": 0  # 0 = Never expire
+    }
+    response = requests.post(IMGBB_URL, data=payload, files={"image": image_bytes}, timeout=UPLOAD_TIMEOUT_S)
+    if response.status_code != 200:
+        raise RuntimeError(f"Upload failed ({response.status_code}): {response.text[:200]}")
+    return response.json()["data"]["url"]
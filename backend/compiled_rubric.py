@@ -0,0 +1,122 @@
+# ==========================================================
+# COMPILED RUBRIC
+# Everything the grader can derive from the teacher's rubric alone
+# (intents and node matchers for flowchart rules, equation type, normalised
+# reactions, parsed expected expressions, concept embeddings) is
+# computed once per test and reused for every student.
+# ==========================================================
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from backend import math_service
+from backend.embedding_cache import encode_cached
+from backend.grade_cache import GradeCache
+from backend.flowchart_pipeline import classify_intent
+from backend.node_matcher import NodeMatcher
+from backend.text_pipeline import prepare_equation_key
+
+CACHE_SIZE = 32
+
+# ==========================================================
+# COMPILED OBJECTS
+# ==========================================================
+
+class CompiledRule:
+    """One flowchart evaluation rule (node_check / connection_check) with pre-classified intents."""
+    __slots__ = ("raw", "type", "concept", "marks", "expected_intent", "from_intent", "to_intent")
+
+    def __init__(self, rule, subject=None):
+        self.raw = rule
+        self.type = rule.get("type")
+        self.concept = rule.get("concept", "")
+        self.marks = rule.get("marks", 0)
+        self.expected_intent = classify_intent(rule["expected_text"], subject) if "expected_text" in rule else None
+        self.from_intent = classify_intent(rule["from_text"], subject) if "from_text" in rule else None
+        self.to_intent = classify_intent(rule["to_text"], subject) if "to_text" in rule else None
+
+class CompiledKeyPoint:
+    """
+    A rubric key point plus its pre-normalised / pre-parsed expectations.
+    `raw` is the original dict, so existing code can still read any field.
+    """
+    __slots__ = ("raw", "id", "concept", "marks", "modalities", "is_flowchart", "subject",
+                 "equation", "final_expr", "rules", "matcher", "_concept_embedding")
+
+    def __init__(self, kp, subject=None):
+        self.raw = kp
+        self.subject = subject
+        self.id = kp["id"]
+        self.concept = kp["concept"]
+        self.marks = kp["marks"]
+        self.modalities = frozenset(kp.get("acceptable_modalities", []))
+        self.is_flowchart = "flowchart" in self.modalities
+
+        expected_eq = kp.get("expected_equation")
+        self.equation = prepare_equation_key(expected_eq) if expected_eq else None
+
+        expected_final = str(kp.get("expected_final_answer")).strip()
+        self.final_expr = math_service.parse_raw(expected_final) if "final_answer" in self.modalities else None
+
+        self.rules = tuple(CompiledRule(r, subject) for r in kp.get("evaluation_rules", []))
+        self.matcher = NodeMatcher(self.rules, subject) if self.rules else None
+        self._concept_embedding = None
+
+    def concept_embedding(self, embedder):
+        """Embedding of the concept text, computed on first use (models load lazily)."""
+        if self._concept_embedding is None:
+            self._concept_embedding = encode_cached(embedder, [self.concept])[0]
+        return self._concept_embedding
+
+class CompiledQuestion:
+    __slots__ = ("question_id", "max_marks", "key_points")
+
+    def __init__(self, question, subject=None):
+        self.question_id = question["question_id"]
+        self.max_marks = question["max_marks"]
+        self.key_points = tuple(CompiledKeyPoint(kp, subject) for kp in question.get("key_points", []))
+
+class CompiledRubric:
+    __slots__ = ("test_id", "version", "subject", "questions", "results")
+
+    def __init__(self, test, version):
+        self.test_id = test.get("test_id")
+        self.version = version
+        # Flowchart intent tables are configurable per subject
+        self.subject = test.get("subject")
+        self.questions = {q["question_id"]: CompiledQuestion(q, self.subject) for q in test.get("rubric", [])}
+        # Key point results by (question, evidence hash), shared by every student of this rubric version
+        self.results = GradeCache()
+
+# ==========================================================
+# CACHE (test_id + rubric version)
+# ==========================================================
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def rubric_version(test):
+    """An explicit `rubric_version` if the test has one, otherwise a hash of the rubric content."""
+    if test.get("rubric_version") is not None:
+        return str(test["rubric_version"])
+    # The subject selects the flowchart intent table, so it is part of the version too
+    payload = json.dumps([test.get("subject"), test.get("rubric", [])], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def get_compiled_rubric(test):
+    """Returns the CompiledRubric for `test`, building it only when the rubric changed."""
+    key = (test.get("test_id"), rubric_version(test))
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None:
+            _cache.move_to_end(key)
+            return compiled
+
+    compiled = CompiledRubric(test, key[1])
+    with _cache_lock:
+        _cache[key] = compiled
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return compiled
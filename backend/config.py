@@ -0,0 +1,27 @@
+# ==========================================================
+# CONFIG / SECRETS
+# Backend modules read API keys through `get_secret` so they work
+# both inside the Streamlit app (st.secrets) and headless
+# (environment variables, e.g. `python -m backend.grade`).
+# Streamlit is never imported from here: st.secrets is only
+# consulted when the app has already loaded it.
+# ==========================================================
+
+import os
+import sys
+
+def get_secret(name, default=None):
+    """Environment variable first, then st.secrets when running under Streamlit."""
+    value = os.environ.get(name)
+    if value:
+        return value
+    st = sys.modules.get("streamlit")
+    if st is not None:
+        try:
+            value = st.secrets.get(name)
+        except Exception:
+            # No secrets.toml: st.secrets raises on access
+            value = None
+        if value:
+            return value
+    return default
@@ -1,32 +1,296 @@
 # Create a file named 'backend/db_handler.py'
+import gzip
+import hashlib
 import json
 import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
 
 DB_FILE = "school_data.json"
 
-def load_db():
-    """Loads the database from the JSON file."""
+# I/O counters (read by the benchmarks)
+DB_STATS = {"reads": 0, "writes": 0, "bytes_read": 0, "bytes_written": 0, "cache_hits": 0, "segment_reads": 0}
+
+# ==========================================================
+# READ-ONLY SNAPSHOTS
+# load_db() parses each partition once per change and hands every caller
+# the same frozen snapshot (a page rerun reads it many times).
+# Writers take a mutable copy with thaw(load_db()) and save_db() it.
+# ==========================================================
+
+class ReadOnlyError(TypeError):
+    """A DB snapshot was modified in place."""
+
+def _read_only(self, *args, **kwargs):
+    raise ReadOnlyError("DB snapshots are read-only: edit thaw(load_db()) and save_db() it")
+
+class FrozenDict(dict):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+class FrozenList(list):
+    __slots__ = ()
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+    def __copy__(self):
+        return list(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+def _freeze_value(value):
+    # Objects are frozen by the decoder hook as they are parsed; only lists are left
+    if type(value) is list:
+        return FrozenList(_freeze_value(v) for v in value)
+    return value
+
+def _freeze_object(obj):
+    return FrozenDict((k, _freeze_value(v)) for k, v in obj.items())
+
+def freeze(data):
+    """Read-only copy of plain JSON data (frozen parts are shared, not copied)."""
+    if isinstance(data, (FrozenDict, FrozenList)):
+        return data
+    if isinstance(data, dict):
+        return FrozenDict((k, freeze(v)) for k, v in data.items())
+    if isinstance(data, list):
+        return FrozenList(freeze(v) for v in data)
+    return data
+
+def thaw(data):
+    """Mutable (plain dict/list) deep copy of a snapshot or any part of it."""
+    if isinstance(data, dict):
+        return {k: thaw(v) for k, v in data.items()}
+    if isinstance(data, list):
+        return [thaw(v) for v in data]
+    return data
+
+_EMPTY_DB = {"tests": [], "submissions": []}
+
+# ==========================================================
+# PARTITIONED STORAGE
+# DB_FILE is a manifest; each test lives in its own partition
+# (the test + its submissions) under "<DB_FILE stem>.d/":
+#
+#   tests/<test>.json        active: what load_db() assembles
+#   archive/<test>.json.gz   archived: compressed, read-only,
+#                            loaded on demand (student results)
+#
+# Manifest: {"format", "active": [test_id, ...] (test order),
+#            "archived": {test_id: {file, test_name, students, ...}}}
+# A monolithic school_data.json is split up the first time it is
+# loaded (the original is kept as <DB_FILE>.monolithic.bak).
+#
+#   GRADER_ARCHIVE_CACHE=8    archived segments kept in memory
+# ==========================================================
+
+MANIFEST_FORMAT = "partitioned-v1"
+ARCHIVE_CACHE = int(os.environ.get("GRADER_ARCHIVE_CACHE", 8))
+
+# Bumped by every save in this process; other processes' saves change the files' stat
+_version = 0
+_cache = {"key": None, "db": None}
+_manifest = {"key": None, "manifest": None}
+_parts = {}                    # test_id -> {"key": stat, "part": frozen partition, "index": {student_id: i}}
+_segments = OrderedDict()      # test_id -> (stat, frozen archived partition), LRU
+_cache_lock = threading.RLock()
+
+def db_version():
+    return _version
+
+def _store_dir():
+    return f"{os.path.splitext(DB_FILE)[0]}.d"
+
+def _file_name(test_id):
+    if test_id is None:
+        return "_unassigned"
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(test_id))[:40]
+    return f"{safe}-{hashlib.sha1(str(test_id).encode()).hexdigest()[:8]}"
+
+def _part_path(test_id):
+    return os.path.join(_store_dir(), "tests", _file_name(test_id) + ".json")
+
+def _segment_path(test_id):
+    return os.path.join(_store_dir(), "archive", _file_name(test_id) + ".json.gz")
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+def _write_atomic(path, raw):
+    """A crash mid-write leaves the previous file intact."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    data = raw.encode() if isinstance(raw, str) else raw
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    DB_STATS["writes"] += 1
+    DB_STATS["bytes_written"] += len(data)
+
+def _read(path):
+    with open(path, "r") as f:
+        raw = f.read()
+    DB_STATS["reads"] += 1
+    DB_STATS["bytes_read"] += len(raw)
+    return raw
+
+def _empty_manifest():
+    return {"format": MANIFEST_FORMAT, "active": [], "archived": {}}
+
+def _write_manifest(manifest):
+    _write_atomic(DB_FILE, json.dumps(manifest, indent=4))
+    _manifest["key"], _manifest["manifest"] = _stat(DB_FILE), freeze(manifest)
+
+def _load_manifest():
     if not os.path.exists(DB_FILE):
         # Create the file if it doesn't exist
-        init_data = {"tests": [], "submissions": []}
-        with open(DB_FILE, "w") as f:
-            json.dump(init_data, f, indent=4)
-        return init_data
-    
+        _write_manifest(_empty_manifest())
+    key = _stat(DB_FILE)
+    if _manifest["key"] == key:
+        return _manifest["manifest"]
     try:
-        with open(DB_FILE, "r") as f:
-            return json.load(f)
+        data = json.loads(_read(DB_FILE), object_hook=_freeze_object)
     except json.JSONDecodeError:
-        return {"tests": [], "submissions": []}
+        data = freeze(_empty_manifest())
+    if data.get("format") != MANIFEST_FORMAT:
+        return _migrate(data)
+    _manifest["key"], _manifest["manifest"] = key, data
+    return data
+
+def _migrate(legacy):
+    """Splits a monolithic {"tests", "submissions"} file into partitions."""
+    shutil.copy2(DB_FILE, f"{DB_FILE}.monolithic.bak")
+    _save(legacy, {"active": [], "archived": {}})
+    return _manifest["manifest"]
+
+def _load_part(test_id):
+    """Cached frozen partition of an active test ({"test", "submissions"})."""
+    path = _part_path(test_id)
+    key = _stat(path)
+    entry = _parts.get(test_id)
+    if entry is None or entry["key"] != key:
+        part = freeze({"test": None, "submissions": []})
+        if key is not None:
+            try:
+                part = json.loads(_read(path), object_hook=_freeze_object)
+            except json.JSONDecodeError:
+                pass
+        entry = _parts[test_id] = {"key": key, "part": part, "index": None}
+    return entry
+
+def _part_index(entry):
+    if entry["index"] is None:
+        # A duplicate left by older builds: the last one wins
+        entry["index"] = {s.get("student_id"): i for i, s in enumerate(entry["part"]["submissions"])}
+    return entry["index"]
+
+def _write_part(test_id, part):
+    """Saves one partition unless it is unchanged on disk."""
+    path = _part_path(test_id)
+    entry = _parts.get(test_id)
+    if entry is not None and entry["key"] == _stat(path) and entry["part"] == part:
+        return
+    _write_atomic(path, json.dumps(part, indent=4))
+    _parts[test_id] = {"key": _stat(path), "part": freeze(part), "index": None}
+
+def _check_writable(manifest, test_id):
+    if test_id is not None and test_id in manifest["archived"]:
+        raise ReadOnlyError(f"Test '{test_id}' is archived: restore_test() it before changing it")
+
+def load_db():
+    """
+    The active tests and their submissions as a read-only snapshot,
+    re-assembled only when a partition changed (mtime / size / inode)
+    or this process saved. Archived tests are not included.
+    """
+    with _cache_lock:
+        manifest = _load_manifest()
+        key = (_manifest["key"], tuple(_stat(_part_path(t)) for t in manifest["active"]), _version)
+        if _cache["key"] == key:
+            DB_STATS["cache_hits"] += 1
+            return _cache["db"]
+        parts = [_load_part(t)["part"] for t in manifest["active"]]
+        db = FrozenDict(
+            tests=FrozenList(p["test"] for p in parts if p["test"] is not None),
+            submissions=FrozenList(s for p in parts for s in p["submissions"]),
+        )
+        _cache["key"], _cache["db"] = key, db
+        _cache.pop("by_student", None)
+        return db
+
+def _save(data, manifest):
+    global _version
+    parts = {}
+    for t in data.get("tests", []):
+        parts.setdefault(t.get("test_id"), {"test": None, "submissions": []})["test"] = t
+    for s in data.get("submissions", []):
+        parts.setdefault(s.get("test_id"), {"test": None, "submissions": []})["submissions"].append(s)
+    for test_id in parts:
+        _check_writable(manifest, test_id)
+
+    # Partitions first, then the manifest that lists them, then the dropped ones
+    for test_id, part in parts.items():
+        _write_part(test_id, part)
+    dropped = [t for t in manifest["active"] if t not in parts]
+    if list(parts) != list(manifest["active"]) or manifest.get("format") != MANIFEST_FORMAT:
+        manifest = thaw(manifest)
+        manifest["format"], manifest["active"] = MANIFEST_FORMAT, list(parts)
+        _write_manifest(manifest)
+    for test_id in dropped:
+        _remove_part(test_id)
+    _version += 1
+
+def _remove_part(test_id):
+    if os.path.exists(_part_path(test_id)):
+        os.remove(_part_path(test_id))
+    _parts.pop(test_id, None)
 
 def save_db(data):
-    with open(DB_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    """
+    Saves {"tests", "submissions"} (the active DB) partition by partition:
+    only tests whose data changed are rewritten.
+    """
+    with _cache_lock:
+        _save(data, _load_manifest())
+
+def _save_partition(test_id, part):
+    global _version
+    manifest = _load_manifest()
+    _check_writable(manifest, test_id)
+    _write_part(test_id, part)
+    if test_id not in manifest["active"]:
+        manifest = thaw(manifest)
+        manifest["active"].append(test_id)
+        _write_manifest(manifest)
+    _version += 1
 
 def publish_test(test_obj):
-    db = load_db()
-    db["tests"].append(test_obj)
-    save_db(db)
+    with _cache_lock:
+        load_db()
+        entry = _load_part(test_obj.get("test_id"))
+        _save_partition(test_obj.get("test_id"), {"test": test_obj, "submissions": entry["part"]["submissions"]})
 
 def get_active_test():
     db = load_db()
@@ -34,20 +298,198 @@ def get_active_test():
         return db["tests"][-1] # Return the most recent test
     return None
 
+def get_test(test_id):
+    """An active or archived test, or None."""
+    with _cache_lock:
+        manifest = _load_manifest()
+        if test_id in manifest["active"]:
+            return _load_part(test_id)["part"]["test"]
+    segment = load_archived(test_id)
+    return segment["test"] if segment else None
+
+def get_submissions_for_test(test_id):
+    """One test's submissions: reads only its partition (or archived segment)."""
+    with _cache_lock:
+        manifest = _load_manifest()
+        if test_id in manifest["active"]:
+            return _load_part(test_id)["part"]["submissions"]
+    segment = load_archived(test_id)
+    return segment["submissions"] if segment else FrozenList()
+
+def save_submissions_for_test(test_id, submissions):
+    """Replaces one active test's submissions; no other partition is touched."""
+    with _cache_lock:
+        load_db()
+        entry = _load_part(test_id)
+        _save_partition(test_id, {"test": entry["part"]["test"], "submissions": list(submissions)})
+
+# ==========================================================
+# KEYED SUBMISSIONS
+# Submissions are keyed on (student_id, test_id): the test picks the
+# partition, whose index (student → position) is built once per
+# version, so lookup, upsert and delete never scan other tests.
+# ==========================================================
+
+def get_submission(student_id, test_id):
+    """One submission of an active test, or None."""
+    with _cache_lock:
+        load_db()
+        if test_id not in _load_manifest()["active"]:
+            return None
+        entry = _load_part(test_id)
+        i = _part_index(entry).get(student_id)
+        return None if i is None else entry["part"]["submissions"][i]
+
+def get_submissions_for_student(student_id, include_archived=False):
+    """
+    A student's submissions (one per test) from the current snapshot;
+    with include_archived, archived tests come first, each segment
+    loaded only if the manifest lists the student in it.
+    """
+    with _cache_lock:
+        load_db()
+        manifest = _load_manifest()
+        if "by_student" not in _cache:
+            by_student = {}
+            for test_id in manifest["active"]:
+                for sid in _part_index(_load_part(test_id)):
+                    by_student.setdefault(sid, []).append(test_id)
+            _cache["by_student"] = by_student
+        active = []
+        for test_id in _cache["by_student"].get(student_id, []):
+            entry = _load_part(test_id)
+            active.append(entry["part"]["submissions"][_part_index(entry)[student_id]])
+        archived = [t for t, meta in manifest["archived"].items() if student_id in meta.get("students", [])] \
+            if include_archived else []
+
+    out = []
+    for test_id in archived:
+        segment = load_archived(test_id)
+        out += [s for s in (segment["submissions"] if segment else []) if s.get("student_id") == student_id]
+    return out + active
+
+def upsert_submission(submission_obj):
+    """Adds a submission, replacing the same student's earlier one for that test."""
+    test_id = submission_obj.get("test_id")
+    with _cache_lock:
+        load_db()
+        entry = _load_part(test_id)
+        i = _part_index(entry).get(submission_obj["student_id"])
+        subs = list(entry["part"]["submissions"])
+        if i is None:
+            subs.append(submission_obj)
+        else:
+            subs[i] = submission_obj
+        _save_partition(test_id, {"test": entry["part"]["test"], "submissions": subs})
+
+def delete_submission(student_id, test_id):
+    with _cache_lock:
+        load_db()
+        if test_id not in _load_manifest()["active"]:
+            return False
+        entry = _load_part(test_id)
+        i = _part_index(entry).get(student_id)
+        if i is None:
+            return False
+        subs = list(entry["part"]["submissions"])
+        del subs[i]
+        _save_partition(test_id, {"test": entry["part"]["test"], "submissions": subs})
+
+    # Near-duplicate index is advisory: never fail a delete over it
+    try:
+        from backend.near_duplicates import remove_submission
+        remove_submission(student_id, test_id)
+    except Exception as e:
+        print(f"⚠️ Near-duplicate index cleanup failed: {e}")
+    return True
+
 def submit_student_answers(submission_obj):
-    db = load_db()
-    # Optional: Check if student already submitted to avoid duplicates
-    # (Simple logic: remove old submission from same student if exists)
-    db["submissions"] = [
-        s for s in db["submissions"] 
-        if s["student_id"] != submission_obj["student_id"]
-    ]
-    
-    # Add new submission
-    db["submissions"].append(submission_obj)
-    save_db(db)
+    # A resubmission replaces the student's earlier submission to the same test only
+    upsert_submission(submission_obj)
+
+    # Near-duplicate index is advisory: never fail a submission over it
+    try:
+        from backend.near_duplicates import index_submission
+        index_submission(submission_obj)
+    except Exception as e:
+        print(f"⚠️ Near-duplicate indexing failed: {e}")
     return True
 
+# ==========================================================
+# ARCHIVE
+# Closed tests move out of the active set into a gzip segment;
+# they stay readable (get_test / get_submissions_for_*) but are
+# no longer loaded, indexed or rewritten by day-to-day operations.
+# ==========================================================
+
+def list_archived():
+    """{test_id: {"test_name", "submissions", "archived_at", ...}} from the manifest."""
+    with _cache_lock:
+        return _load_manifest()["archived"]
+
+def load_archived(test_id):
+    """An archived test's frozen {"test", "submissions"}, or None."""
+    with _cache_lock:
+        if test_id not in _load_manifest()["archived"]:
+            return None
+        path = _segment_path(test_id)
+        key = _stat(path)
+        cached = _segments.get(test_id)
+        if cached and cached[0] == key:
+            _segments.move_to_end(test_id)
+            return cached[1]
+        with open(path, "rb") as f:
+            raw = f.read()
+        DB_STATS["segment_reads"] += 1
+        DB_STATS["bytes_read"] += len(raw)
+        segment = json.loads(gzip.decompress(raw), object_hook=_freeze_object)
+        _segments[test_id] = (key, segment)
+        while len(_segments) > ARCHIVE_CACHE:
+            _segments.popitem(last=False)
+        return segment
+
+def archive_test(test_id):
+    """Moves an active test and its submissions into a read-only segment."""
+    global _version
+    with _cache_lock:
+        load_db()
+        manifest = _load_manifest()
+        if test_id is None or test_id not in manifest["active"]:
+            return False
+        part = _load_part(test_id)["part"]
+        _write_atomic(_segment_path(test_id), gzip.compress(json.dumps(part, separators=(",", ":")).encode()))
+
+        manifest = thaw(manifest)
+        manifest["active"].remove(test_id)
+        manifest["archived"][test_id] = {
+            "file": os.path.relpath(_segment_path(test_id), _store_dir()),
+            "test_name": (part["test"] or {}).get("test_name", ""),
+            "submissions": len(part["submissions"]),
+            "students": sorted({s.get("student_id") for s in part["submissions"] if s.get("student_id")}),
+            "archived_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        _write_manifest(manifest)
+        _remove_part(test_id)
+        _version += 1
+        return True
+
+def restore_test(test_id):
+    """Makes an archived test active (and writable) again."""
+    global _version
+    with _cache_lock:
+        segment = load_archived(test_id)
+        if segment is None:
+            return False
+        _write_part(test_id, segment)
+        manifest = thaw(_load_manifest())
+        del manifest["archived"][test_id]
+        manifest["active"].append(test_id)
+        _write_manifest(manifest)
+        os.remove(_segment_path(test_id))
+        _segments.pop(test_id, None)
+        _version += 1
+        return True
+
 def get_submissions_for_teacher():
     db = load_db()
     return db["submissions"]
@@ -55,11 +497,11 @@ def get_submissions_for_teacher():
 
 def assign_paper_to_teacher(student_id, test_id, teacher_id):
     """Updates a submission with an assigned teacher ID."""
-    db = load_db()
-    for sub in db["submissions"]:
-        if sub["student_id"] == student_id and sub["test_id"] == test_id:
-            sub["assigned_teacher_id"] = teacher_id
-            sub["status"] = "Assigned" # Update status text
-            save_db(db)
-            return True
-    return False
\ No newline at end of file
+    sub = get_submission(student_id, test_id)
+    if sub is None:
+        return False
+    sub = thaw(sub)
+    sub["assigned_teacher_id"] = teacher_id
+    sub["status"] = "Assigned" # Update status text
+    upsert_submission(sub)
+    return True
@@ -0,0 +1,130 @@
+# ==========================================================
+# EMBEDDING CACHE
+# Student answer segments are embedded once per model, however
+# many key points (or students, for copied answers) reference
+# them. In-memory LRU keyed by (model, text hash); optionally
+# backed by SQLite so embeddings survive restarts:
+#
+#   GRADER_EMBED_CACHE_SIZE=50000
+#   GRADER_EMBED_CACHE_DB=.cache/embeddings.sqlite
+# ==========================================================
+
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from backend.tracing import count
+
+CACHE_SIZE = int(os.environ.get("GRADER_EMBED_CACHE_SIZE", 50000))
+CACHE_DB = os.environ.get("GRADER_EMBED_CACHE_DB")   # unset = memory only
+SQL_CHUNK = 500    # host parameters per IN (...); SQLite builds before 3.32 allow 999
+
+def model_key(embedder):
+    """Stable name of the embedding model; falls back to the object identity (memory only)."""
+    name = getattr(embedder, "model_name", None)
+    if name is None:
+        try:
+            name = embedder[0].auto_model.config._name_or_path   # SentenceTransformer
+        except Exception:
+            return f"{type(embedder).__name__}@{id(embedder):x}", False
+    return str(name), True
+
+def _text_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, maxsize=CACHE_SIZE, db_path=CACHE_DB):
+        self.maxsize = maxsize
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+    # --- persistent layer ---
+    def _conn(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings "
+                             "(model TEXT, hash TEXT, vec BLOB, PRIMARY KEY (model, hash))")
+        return self._db
+
+    def _load(self, model, hashes):
+        found = {}
+        for i in range(0, len(hashes), SQL_CHUNK):
+            chunk = hashes[i:i + SQL_CHUNK]
+            rows = self._conn().execute(
+                f"SELECT hash, vec FROM embeddings WHERE model = ? AND hash IN ({','.join('?' * len(chunk))})",
+                [model, *chunk]).fetchall()
+            found.update((h, np.frombuffer(v, dtype=np.float32)) for h, v in rows)
+        return found
+
+    def _store(self, model, items):
+        with self._conn() as db:
+            db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                           [(model, h, v.astype(np.float32).tobytes()) for h, v in items])
+
+    # --- public ---
+    def encode(self, embedder, texts):
+        """(len(texts), dim) float32 array; only texts never seen for this model are encoded."""
+        texts = [str(t) for t in texts]
+        model, persistent = model_key(embedder)
+        persistent = persistent and bool(self.db_path)
+        hashes = [_text_hash(t) for t in texts]
+
+        found = {}
+        with self._lock:
+            for h in set(hashes):
+                vec = self._entries.get((model, h))
+                if vec is not None:
+                    self._entries.move_to_end((model, h))
+                    found[h] = vec
+
+            missing = [h for h in dict.fromkeys(hashes) if h not in found]
+            if missing and persistent:
+                for h, vec in self._load(model, missing).items():
+                    found[h] = vec
+                    self._entries[(model, h)] = vec
+
+        hits = sum(1 for h in hashes if h in found)
+        if hits:
+            count("cache_hits", hits)
+        todo = list(dict.fromkeys(t for t, h in zip(texts, hashes) if h not in found))
+        if todo:
+            vecs = np.asarray(embedder.encode(todo, convert_to_numpy=True), dtype=np.float32)
+            count("model_calls")
+            new = [(_text_hash(t), v) for t, v in zip(todo, vecs)]
+            found.update(new)
+            with self._lock:
+                for h, v in new:
+                    self._entries[(model, h)] = v
+                if persistent:
+                    self._store(model, new)
+
+        with self._lock:
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[h] for h in hashes])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+_cache = EmbeddingCache()
+
+def encode_cached(embedder, texts):
+    """Embeds `texts` through the shared cache."""
+    return _cache.encode(embedder, texts)
+
+def get_embedding_cache():
+    return _cache
@@ -7,16 +7,19 @@ import os
 import re
 import json
 from collections import defaultdict, deque
+from functools import lru_cache
 from PIL import Image
 
-from google import genai
-from google.genai import types  # type: ignore
+from backend.llm_json import GRAPH_SCHEMA, RUBRIC_SCHEMA, LLMJSONError, call_json, validate_graph, validate_rubric
+from backend.llm_router import complete
+from backend.page_artifacts import PageArtifact
+from backend.tracing import stage
 
 # ==========================================================
 # CONFIGURATION & PROMPTS
 # ==========================================================
 
-MODEL_ID = "models/gemini-2.5-flash"
+# Model, fallback endpoints, hedging and deadlines: backend.llm_router ("flowchart" route)
 
 STUDENT_PROMPT = """
 Analyze this flowchart carefully.
@@ -111,67 +114,100 @@ Your task is to extract a **Grading Rubric (Checklist)** that can be used to gra
 }
 """
 
-# ==========================================================
-# ROBUST GEMINI RESPONSE EXTRACTION
-# ==========================================================
-
-def extract_text_from_response(response):
-    # Case 1: shortcut
-    if hasattr(response, "text") and response.text:
-        return response.text.strip()
-
-    # Case 2: candidates structure
-    try:
-        parts = response.candidates[0].content.parts
-        texts = [p.text for p in parts if hasattr(p, "text") and p.text]
-        return "\n".join(texts).strip()
-    except Exception:
-        return ""
-
 # ==========================================================
 # INTENT CLASSIFIER (HUMAN-EXAMINER LOGIC)
 # ==========================================================
 
-def normalize(t):
-    return re.sub(r"\s+", " ", str(t).lower().strip())
-
-def classify_intent(text):
-    t = normalize(text)
-
-    if any(k in t for k in ["start", "begin", "init"]):
-        return "START"
-    if any(k in t for k in ["end", "stop", "exit", "finish"]):
-        return "END"
-    if any(k in t for k in ["print", "output", "display", "show", "write"]):
-        return "OUTPUT"
-    if any(k in t for k in ["input", "read", "get", "scan", "enter"]):
-        return "INPUT"
+_WS = re.compile(r"\s+")
 
-    if "++" in t or re.search(r"\w+\s*=\s*\w+\s*\+\s*1", t):
-        return "INCREMENT"
-    if "--" in t or re.search(r"\w+\s*=\s*\w+\s*-\s*1", t):
-        return "DECREMENT"
-
-    if re.search(r"[<>]=?|==|!=", t):
-        return "CONDITION"
-    if "=" in t:
-        return "ASSIGNMENT"
+def normalize(t):
+    return _WS.sub(" ", str(t).lower().strip())
+
+# Ordered by priority: the first intent whose keyword/pattern occurs anywhere wins.
+# Keywords match at the start of a word ("init" hits "initialise", "end" no longer hits "weekend").
+DEFAULT_INTENT_TABLE = [
+    {"intent": "START", "keywords": ["start", "begin", "init"]},
+    {"intent": "END", "keywords": ["end", "stop", "exit", "finish"]},
+    {"intent": "OUTPUT", "keywords": ["print", "output", "display", "show", "write"]},
+    {"intent": "INPUT", "keywords": ["input", "read", "get", "scan", "enter"]},
+    {"intent": "INCREMENT", "patterns": [r"\+\+", r"\b\w+\s*=\s*\w+\s*\+\s*1"]},
+    {"intent": "DECREMENT", "patterns": [r"--", r"\b\w+\s*=\s*\w+\s*-\s*1"]},
+    {"intent": "CONDITION", "patterns": [r"[<>]=?|==|!="]},
+    {"intent": "ASSIGNMENT", "patterns": [r"="]},
+]
+
+class IntentClassifier:
+    """
+    Compiles an intent table into ONE regex: a zero-width lookahead over an
+    alternation with a named group per intent, so a single scan sees every
+    position (matches never consume each other) and the highest-priority
+    intent found wins. Results are memoised per raw text.
+    """
 
-    return "UNKNOWN"
+    def __init__(self, table):
+        self.intents = [row["intent"] for row in table]
+        groups = []
+        for i, row in enumerate(table):
+            alts = [r"\b" + re.escape(k.lower()) for k in row.get("keywords", [])]
+            alts += list(row.get("patterns", []))
+            groups.append(f"(?P<i{i}>{'|'.join(alts)})")
+        self.regex = re.compile("(?=(?:" + "|".join(groups) + "))")
+        self.classify = lru_cache(maxsize=16384)(self._classify)
+
+    def _classify(self, text):
+        best = len(self.intents)
+        for m in self.regex.finditer(normalize(text)):
+            best = min(best, int(m.lastgroup[1:]))
+            if best == 0:
+                break
+        return self.intents[best] if best < len(self.intents) else "UNKNOWN"
+
+    def __call__(self, text):
+        return self.classify(str(text))
+
+INTENT_TABLES = {"default": DEFAULT_INTENT_TABLE}
+_classifiers = {}
+
+def register_intent_table(subject, table):
+    """Adds / replaces the intent table used for a subject (case-insensitive)."""
+    INTENT_TABLES[subject.lower()] = table
+    _classifiers.pop(subject.lower(), None)
+
+def _load_intent_tables(path):
+    """JSON file: {"<subject>": [{"intent": ..., "keywords": [...], "patterns": [...]}, ...]}"""
+    with open(path, "r") as f:
+        for subject, table in json.load(f).items():
+            register_intent_table(subject, table)
+
+if os.environ.get("GRADER_INTENT_TABLES"):
+    _load_intent_tables(os.environ["GRADER_INTENT_TABLES"])
+
+def get_intent_classifier(subject=None):
+    key = (subject or "default").lower()
+    if key not in INTENT_TABLES:
+        key = "default"
+    if key not in _classifiers:
+        _classifiers[key] = IntentClassifier(INTENT_TABLES[key])
+    return _classifiers[key]
+
+def classify_intent(text, subject=None):
+    return get_intent_classifier(subject)(text)
 
 # ==========================================================
 # GRAPH UTILITIES
 # ==========================================================
 
-def build_graph(student_graph):
+def build_graph(student_graph, subject=None):
     intents = {}
     adj = defaultdict(list)
+    classify = get_intent_classifier(subject)
 
-    for n in student_graph.get("nodes", []):
-        intents[n["id"]] = classify_intent(n["text"])
+    with stage("flowchart_graph"):
+        for n in student_graph.get("nodes", []):
+            intents[n["id"]] = classify(n["text"])
 
-    for e in student_graph.get("edges", []):
-        adj[e["source"]].append(e["target"])
+        for e in student_graph.get("edges", []):
+            adj[e["source"]].append(e["target"])
 
     return intents, adj
 
@@ -190,50 +226,49 @@ def has_path(start_nodes, target_nodes, adj):
     return False
 
 # ==========================================================
-# GEMINI IMAGE → JSON
+# IMAGE → JSON (VISION LLM)
 # ==========================================================
 
 def generate_json_from_image(image, mode, api_key):
     for k in ["HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY"]:
         os.environ.pop(k, None)
 
-    client = genai.Client(
-        api_key=api_key,
-        http_options=types.HttpOptions(api_version="v1beta")
-    )
-
     prompt = STUDENT_PROMPT if mode == "student" else TEACHER_PROMPT
+    validator = validate_graph if mode == "student" else validate_rubric
+    schema = ("graph", GRAPH_SCHEMA) if mode == "student" else ("rubric", RUBRIC_SCHEMA)
+    artifact = PageArtifact.from_image(image)
 
-    response = client.models.generate_content(
-        model=MODEL_ID,
-        contents=[prompt, image]
-    )
-
-    raw_text = extract_text_from_response(response)
+    def request():
+        with stage("llm"):
+            return complete("flowchart", prompt, images=[artifact], schema=schema,
+                            api_keys={"gemini": api_key})
 
-    if not raw_text:
+    try:
+        # Repaired and schema-checked locally; the image is re-sent only if that fails
+        return call_json(request, validator)
+    except LLMJSONError as e:
         raise RuntimeError(
-            "Gemini returned empty response. Image unclear or prompt too strict."
-        )
-
-    clean = re.sub(r"```json|```", "", raw_text).strip()
-    return json.loads(clean)
+            f"The model returned no usable JSON ({e}). Image unclear or prompt too strict."
+        ) from e
 
 # ==========================================================
 # SCORING ENGINE
 # ==========================================================
 
-def score_node_check(key, node_intents):
-    expected_intent = classify_intent(key["expected_text"])
+def score_node_check(key, node_intents, expected_intent=None):
+    if expected_intent is None:
+        expected_intent = classify_intent(key["expected_text"])
 
     if expected_intent in node_intents.values():
         return key["marks"], f"Intent matched: {expected_intent}"
 
     return 0, f"Missing concept: {key['concept']}"
 
-def score_connection_check(key, node_intents, adj):
-    from_intent = classify_intent(key["from_text"])
-    to_intent = classify_intent(key["to_text"])
+def score_connection_check(key, node_intents, adj, from_intent=None, to_intent=None):
+    if from_intent is None:
+        from_intent = classify_intent(key["from_text"])
+    if to_intent is None:
+        to_intent = classify_intent(key["to_text"])
 
     from_nodes = [n for n, i in node_intents.items() if i == from_intent]
     to_nodes = [n for n, i in node_intents.items() if i == to_intent]
@@ -0,0 +1,212 @@
+# ==========================================================
+# HEADLESS BATCH GRADING
+#
+#   python -m backend.grade --test-id <id> --workers 8
+#   python -m backend.grade --test-id <id> --all          # regrade everything
+#   python -m backend.grade --list
+#
+# Grades submissions in parallel with `auto_grade_submission`,
+# without Streamlit. The OpenRouter key comes from the environment
+# (OPENROUTER_API_KEY) when st.secrets is not available.
+#
+# Every finished paper is appended (fsync'd) to a journal next to
+# the DB; results are merged into the DB every --checkpoint papers
+# with an atomic write. If the run is interrupted, the next run for
+# the same test replays the journal and skips what it already did.
+# ==========================================================
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backend import db_handler
+from backend.master_grader import auto_grade_submission
+from backend.tracing import summarize_perf
+
+# ==========================================================
+# JOURNAL (write-ahead log of finished papers)
+# ==========================================================
+
+def journal_path(test_id):
+    safe = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(test_id))
+    return f"{os.path.splitext(db_handler.DB_FILE)[0]}.grade-{safe}.journal"
+
+def read_journal(path):
+    """{student_id: graded_result} from a previous (interrupted) run."""
+    done = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    done[rec["student_id"]] = rec["graded_result"]
+                except (ValueError, KeyError):
+                    continue   # torn last line
+    return done
+
+class Journal:
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "a")
+
+    def append(self, student_id, graded_result):
+        self._f.write(json.dumps({"student_id": student_id, "graded_result": graded_result}) + "\n")
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        self._f.close()
+
+# ==========================================================
+# DB COMMIT
+# ==========================================================
+
+def commit(test_id, results):
+    """Merges {student_id: graded_result} into a fresh copy of the test's partition and saves it atomically."""
+    if not results:
+        return 0
+    subs = db_handler.thaw(db_handler.get_submissions_for_test(test_id))
+    merged = 0
+    for sub in subs:
+        if sub.get("student_id") in results:
+            sub["graded_result"] = results[sub["student_id"]]
+            merged += 1
+    db_handler.save_submissions_for_test(test_id, subs)
+    return merged
+
+# ==========================================================
+# RUN
+# ==========================================================
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))] if ordered else 0.0
+
+def _grade_one(sub, test):
+    t0 = time.perf_counter()
+    result = auto_grade_submission(sub.get("answers", []), test, sub.get("student_id"))
+    return sub["student_id"], result, time.perf_counter() - t0
+
+def run(test_id, workers=4, regrade_all=False, checkpoint=25, resume=True):
+    db = db_handler.load_db()
+    test = next((t for t in db.get("tests", []) if t.get("test_id") == test_id), None)
+    if test is None:
+        if test_id in db_handler.list_archived():
+            print(f"❌ Test '{test_id}' is archived (restore it to regrade)")
+        else:
+            print(f"❌ Test '{test_id}' not found in {db_handler.DB_FILE}")
+        return 2
+
+    path = journal_path(test_id)
+    done = read_journal(path) if resume else {}
+    if not resume and os.path.exists(path):
+        os.remove(path)
+    if done:
+        print(f"↩️  Resuming: {len(done)} paper(s) recovered from {os.path.basename(path)}")
+        commit(test_id, done)
+
+    todo = [
+        s for s in db_handler.get_submissions_for_test(test_id)
+        if s.get("student_id") not in done
+        and (regrade_all or not s.get("graded_result")) and "pending_upload" not in s
+    ]
+    print(f"📝 {test.get('test_name', test_id)}: {len(todo)} paper(s) to grade with {workers} worker(s)")
+    if not todo:
+        if os.path.exists(path):
+            os.remove(path)
+        return 0
+
+    # Load models once before the workers start
+    if any("flowchart" not in kp.get("acceptable_modalities", [])
+           for q in test.get("rubric", []) for kp in q.get("key_points", [])):
+        from backend.text_pipeline import get_models
+        get_models()
+
+    journal = Journal(path)
+    pending, latencies, graded_results, failures = {}, [], [], 0
+    t0 = time.perf_counter()
+    status = 0
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        futures = {pool.submit(_grade_one, s, test): s["student_id"] for s in todo}
+        for fut in as_completed(futures):
+            sid = futures[fut]
+            try:
+                sid, result, elapsed = fut.result()
+            except Exception as e:
+                failures += 1
+                print(f"⚠️ Error grading {sid}: {e}")
+                continue
+            journal.append(sid, result)
+            pending[sid] = result
+            latencies.append(elapsed)
+            graded_results.append(result)
+
+            if len(pending) >= checkpoint:
+                commit(test_id, pending)
+                pending = {}
+            n = len(latencies)
+            if n % max(1, checkpoint) == 0 or n + failures == len(todo):
+                rate = n / (time.perf_counter() - t0)
+                print(f"   {n}/{len(todo)} graded  ({rate:.2f} papers/s)")
+    except KeyboardInterrupt:
+        print("\n⏸️  Interrupted: saving finished papers, rerun the same command to resume.")
+        pool.shutdown(wait=False, cancel_futures=True)
+        status = 130
+    finally:
+        pool.shutdown(wait=False)
+        commit(test_id, pending)
+        journal.close()
+
+    wall = time.perf_counter() - t0
+    if status == 0 and not failures:
+        os.remove(path)
+
+    totals, per_stage, _ = summarize_perf(graded_results)
+    n = len(latencies)
+    print(f"✅ Graded {n} paper(s) in {wall:.1f}s — {n / wall if wall else 0:.2f} papers/s"
+          f" | latency p50 {_percentile(latencies, 50):.2f}s p95 {_percentile(latencies, 95):.2f}s")
+    print(f"   LLM calls {int(totals.get('llm_calls', 0))} | tokens {int(totals.get('tokens', 0))}"
+          f" | reused {int(totals.get('dedup_hits', 0))} | cache hits {int(totals.get('cache_hits', 0))}")
+    if per_stage:
+        print("   stages: " + ", ".join(f"{k} {v / 1000:.1f}s" for k, v in sorted(per_stage.items(), key=lambda kv: -kv[1])))
+    if failures:
+        print(f"⚠️ {failures} paper(s) failed; rerun to retry them (finished papers are kept).")
+        status = status or 1
+    return status
+
+def list_tests():
+    db = db_handler.load_db()
+    for t in db.get("tests", []):
+        subs = db_handler.get_submissions_for_test(t.get("test_id"))
+        graded = sum(1 for s in subs if s.get("graded_result"))
+        print(f"{t.get('test_id')}  {t.get('test_name', '')!r}  {graded}/{len(subs)} graded")
+    for test_id, meta in db_handler.list_archived().items():
+        print(f"{test_id}  {meta.get('test_name', '')!r}  archived {meta.get('archived_at', '')} ({meta.get('submissions', 0)} papers)")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade submissions without the Streamlit app.")
+    parser.add_argument("--test-id", help="Test to grade")
+    parser.add_argument("--workers", type=int, default=4, help="Papers graded in parallel")
+    parser.add_argument("--all", action="store_true", help="Regrade already graded papers too")
+    parser.add_argument("--checkpoint", type=int, default=25, help="Papers per DB write")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the journal of an interrupted run")
+    parser.add_argument("--db", help=f"DB file (default: {db_handler.DB_FILE})")
+    parser.add_argument("--list", action="store_true", help="List tests and grading progress")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db_handler.DB_FILE = args.db
+    if args.list:
+        return list_tests()
+    if not args.test_id:
+        parser.error("--test-id is required (see --list)")
+    return run(args.test_id, workers=args.workers, regrade_all=args.all,
+               checkpoint=args.checkpoint, resume=not args.no_resume)
+
+if __name__ == "__main__":
+    sys.exit(main())
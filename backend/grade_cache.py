@@ -0,0 +1,79 @@
+# ==========================================================
+# CROSS-STUDENT GRADE CACHE
+# Many students submit identical final answers, equations or
+# flowcharts. Each key point result is keyed by a hash of the
+# normalised evidence the grader actually reads, so identical
+# evidence is graded once per test (per rubric version) and the
+# result is reused with a provenance marker.
+# ==========================================================
+
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+CACHE_SIZE = int(os.environ.get("GRADER_DEDUP_CACHE_SIZE", 100000))   # entries per compiled rubric
+
+_WS = re.compile(r"\s+")
+
+# ==========================================================
+# EVIDENCE NORMALISATION
+# ==========================================================
+
+def _norm_text(s):
+    # Only runs of whitespace are folded: the embedder and NLI model are cased
+    return _WS.sub(" ", str(s)).strip()
+
+def _norm_math(s):
+    # Case matters in maths / chemistry (Co vs CO), spacing does not
+    return _WS.sub("", str(s))
+
+def evidence_key(kp, answer_obj):
+    """
+    Hash of everything the grader reads for `kp` (a CompiledKeyPoint):
+    the flowcharts for flowchart key points, otherwise text + equations +
+    final answer (all three go into the LLM context).
+    """
+    if kp.is_flowchart:
+        evidence = ["flowchart", answer_obj.get("flowcharts", [])]
+    else:
+        final = answer_obj.get("final_answer")
+        evidence = [
+            "answer",
+            [_norm_text(t) for t in answer_obj.get("text", []) or []],
+            [_norm_math(e) for e in answer_obj.get("equations", []) or []],
+            None if final is None else _norm_math(final),
+        ]
+    payload = json.dumps([kp.id, evidence], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+# ==========================================================
+# CACHE (one per CompiledRubric)
+# ==========================================================
+
+class GradeCache:
+    """LRU of evidence hash -> (awarded_marks, reason, source student)."""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, score, reason, source=None):
+        with self._lock:
+            self._entries[key] = (score, reason, source)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
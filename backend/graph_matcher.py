@@ -0,0 +1,205 @@
+# ==========================================================
+# FLOWCHART GRAPH MATCHING
+# Maps the rubric's rule texts onto the nodes of every flowchart the
+# student drew and keeps the best-scoring graph.
+#
+#   per graph : branch-and-bound over variable -> node mappings
+#               (node_check variables on distinct nodes, connection
+#               rules satisfied by a directed path), seeded with the
+#               optimal node_check assignment as the incumbent
+#   per answer: graphs ordered by an optimistic bound; a graph whose
+#               bound cannot beat the best score so far is skipped
+#
+# The search is anytime: past the time budget it returns the best
+# mapping found so far.
+# ==========================================================
+
+import os
+import time
+from collections import deque
+
+import numpy as np
+
+from backend.node_matcher import optimal_assignment
+from backend.tracing import count
+
+SEARCH_BUDGET_MS = float(os.environ.get("GRADER_FLOWCHART_BUDGET_MS", 50))   # per key point, all graphs
+MAX_CANDIDATES = int(os.environ.get("GRADER_FLOWCHART_MAX_CANDIDATES", 6))   # nodes tried per variable
+
+class _BudgetExceeded(Exception):
+    pass
+
+# ==========================================================
+# ONE STUDENT GRAPH
+# ==========================================================
+
+class _GraphProblem:
+    """The matching problem for one student graph against one NodeMatcher."""
+
+    def __init__(self, matcher, graph, embedder=None):
+        self.matcher = matcher
+        if not isinstance(graph, dict):
+            graph = {}
+        # Extractor output is sometimes wrapped as {"graph": {...}}
+        graph = graph.get("graph", graph) if "nodes" not in graph else graph
+        nodes = graph.get("nodes", [])
+        position = {n["id"]: j for j, n in enumerate(nodes)}
+        texts = [str(n.get("text", "")) for n in nodes]
+        self.succ = [[] for _ in nodes]
+        for e in graph.get("edges", []):
+            if e.get("source") in position and e.get("target") in position:
+                self.succ[position[e["source"]]].append(position[e["target"]])
+        self._reach = {}
+
+        sim, accepted = matcher.acceptance(texts, [matcher.classify(t) for t in texts], embedder)
+        self.sim = sim
+        # Candidate nodes per variable, most similar first, capped
+        self.domains = []
+        for row in matcher.var_rows:
+            cand = np.flatnonzero(accepted[row])
+            cand = cand[np.argsort(-sim[row, cand], kind="stable")][:MAX_CANDIDATES]
+            self.domains.append(cand.tolist())
+
+        marks = [rule.marks for rule in matcher.rules]
+        self.possible = [all(self.domains[v] for v in vs) and bool(vs) for vs in matcher.rule_vars]
+        self.upper_bound = sum(m for m, ok in zip(marks, self.possible) if ok)
+
+    def reaches(self, a, b):
+        """Directed path a ->* b (a node reaches itself, as in has_path)."""
+        seen = self._reach.get(a)
+        if seen is None:
+            seen = {a}
+            q = deque([a])
+            while q:
+                for nxt in self.succ[q.popleft()]:
+                    if nxt not in seen:
+                        seen.add(nxt)
+                        q.append(nxt)
+            self._reach[a] = seen
+        return b in seen
+
+    def rule_satisfied(self, i, mapping):
+        vs = self.matcher.rule_vars[i]
+        ends = [mapping[v] for v in vs]
+        if not ends or any(n is None for n in ends):
+            return False
+        if self.matcher.rules[i].type == "connection_check":
+            return self.reaches(ends[0], ends[1])
+        return True
+
+    def evaluate(self, mapping):
+        return sum(rule.marks for i, rule in enumerate(self.matcher.rules) if self.rule_satisfied(i, mapping))
+
+    def greedy_mapping(self):
+        """Optimal assignment for node_check variables, most similar node for the rest."""
+        m = self.matcher
+        mapping = [None] * len(m.var_rows)
+        injective = [v for v, inj in enumerate(m.var_injective) if inj]
+        n_nodes = self.sim.shape[1]
+        if injective and n_nodes:
+            gain = np.zeros((len(injective), n_nodes))
+            for r, v in enumerate(injective):
+                for j in self.domains[v]:
+                    gain[r, j] = 1.0 + self.sim[m.var_rows[v], j]
+            for r, j in optimal_assignment(gain).items():
+                if gain[r, j] > 0:
+                    mapping[injective[r]] = j
+        for v, inj in enumerate(m.var_injective):
+            if not inj and self.domains[v]:
+                mapping[v] = self.domains[v][0]
+        return mapping
+
+    def search(self, deadline, floor=0):
+        """Best (score, mapping) with score > floor, or (floor, None) if none is found."""
+        m = self.matcher
+        n_vars = len(m.var_rows)
+        best_mapping = self.greedy_mapping()
+        best = self.evaluate(best_mapping)
+        if best <= floor:
+            best, best_mapping = floor, None
+        if best >= self.upper_bound:
+            return best, best_mapping
+
+        # Most constrained variables first; rules are scored at the depth their last variable is set
+        order = sorted(range(n_vars), key=lambda v: (len(self.domains[v]), v))
+        depth_of = {v: d for d, v in enumerate(order)}
+        closes_at = [[] for _ in range(n_vars + 1)]
+        for i, vs in enumerate(m.rule_vars):
+            if vs:
+                closes_at[max(depth_of[v] for v in vs)].append(i)
+        remaining = [0] * (n_vars + 1)
+        for d in range(n_vars - 1, -1, -1):
+            remaining[d] = remaining[d + 1] + sum(m.rules[i].marks for i in closes_at[d] if self.possible[i])
+
+        mapping = [None] * n_vars
+        used = set()
+        expanded = 0
+
+        def dfs(d, current):
+            nonlocal best, best_mapping, expanded
+            expanded += 1
+            if expanded % 256 == 0 and time.perf_counter() > deadline:
+                raise _BudgetExceeded
+            if current + remaining[d] <= best:
+                return
+            if d == n_vars:
+                best, best_mapping = current, list(mapping)
+                return
+            v = order[d]
+            for node in self.domains[v] + [None]:
+                if node is not None and m.var_injective[v]:
+                    if node in used:
+                        continue
+                    used.add(node)
+                mapping[v] = node
+                gain = sum(m.rules[i].marks for i in closes_at[d] if self.rule_satisfied(i, mapping))
+                dfs(d + 1, current + gain)
+                mapping[v] = None
+                if node is not None and m.var_injective[v]:
+                    used.discard(node)
+
+        try:
+            dfs(0, 0)
+        except _BudgetExceeded:
+            count("graph_match_timeouts")
+        return best, best_mapping
+
+    def feedback(self, mapping):
+        items = []
+        for i, rule in enumerate(self.matcher.rules):
+            if mapping is not None and self.rule_satisfied(i, mapping):
+                continue
+            if rule.type == "node_check":
+                items.append(f"Missing concept: {rule.concept}")
+            elif rule.type == "connection_check":
+                ends = [mapping[v] for v in self.matcher.rule_vars[i]] if mapping is not None else [None]
+                if any(n is None for n in ends):
+                    items.append("Missing nodes for logical flow")
+                else:
+                    items.append(f"Logic break between {rule.raw['from_text']} → {rule.raw['to_text']}")
+        return items
+
+# ==========================================================
+# ALL STUDENT GRAPHS
+# ==========================================================
+
+def best_graph_match(matcher, graphs, embedder=None, budget_ms=None):
+    """
+    Scores every student graph against the key point's rules.
+    Returns (score, feedback_items, graph_index) for the best graph.
+    """
+    deadline = time.perf_counter() + (SEARCH_BUDGET_MS if budget_ms is None else budget_ms) / 1000.0
+    problems = [(_GraphProblem(matcher, g, embedder), k) for k, g in enumerate(graphs)]
+    # Most promising graph first, so weaker ones are pruned by the bound alone
+    problems.sort(key=lambda pk: -pk[0].upper_bound)
+
+    best, best_mapping, best_problem, best_index = 0, None, problems[0][0], problems[0][1]
+    for problem, k in problems:
+        if best_mapping is not None and problem.upper_bound <= best:
+            count("graphs_pruned")
+            continue
+        score, mapping = problem.search(deadline, floor=best if best_mapping is not None else -1)
+        if mapping is not None and (best_mapping is None or score > best):
+            best, best_mapping, best_problem, best_index = score, mapping, problem, k
+
+    return best, best_problem.feedback(best_mapping), best_index
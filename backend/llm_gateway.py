@@ -0,0 +1,264 @@
+# ==========================================================
+# LLM PROVIDER GATEWAY
+# Rate limiting, retry/backoff, concurrency cap & daily budgets
+# shared by every Gemini / OpenRouter call in the grader.
+# ==========================================================
+
+import os
+import random
+import threading
+import time
+from datetime import date
+
+from backend.llm_replay import get_active_cassette
+from backend.tracing import count
+
+# ==========================================================
+# CONFIGURATION (override with environment variables)
+# ==========================================================
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+PROVIDER_DEFAULTS = {
+    # OpenRouter ":free" models are limited to ~20 requests/minute
+    "openrouter": {
+        "requests_per_minute": 20,
+        "burst": 5,
+        "max_concurrency": 4,
+        "daily_token_budget": 0,      # 0 = unlimited
+        "daily_cost_budget": 0.0,     # USD, 0 = unlimited
+        "cost_per_1k_tokens": 0.0,
+    },
+    # Gemini free tier for flash models is ~10 requests/minute
+    "gemini": {
+        "requests_per_minute": 10,
+        "burst": 3,
+        "max_concurrency": 2,
+        "daily_token_budget": 0,
+        "daily_cost_budget": 0.0,
+        "cost_per_1k_tokens": 0.0,
+    },
+}
+
+MAX_RETRIES = int(_env_float("GRADER_LLM_MAX_RETRIES", 5))
+BASE_BACKOFF = _env_float("GRADER_LLM_BASE_BACKOFF", 1.0)   # seconds
+MAX_BACKOFF = _env_float("GRADER_LLM_MAX_BACKOFF", 30.0)    # seconds
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class BudgetExceeded(RuntimeError):
+    """Raised when a provider's daily token or cost budget is used up."""
+
+class CallCancelled(RuntimeError):
+    """Raised instead of sending a request whose caller gave up (hedge lost / deadline passed)."""
+
+# ==========================================================
+# TOKEN BUCKET
+# ==========================================================
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens/second, up to `capacity` stored."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens=1.0, deadline=None):
+        """Blocks until `tokens` are available, then consumes them; False if `deadline` comes first."""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return True
+                wait = (tokens - self.tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+# ==========================================================
+# ERROR INSPECTION
+# ==========================================================
+
+def get_status_code(exc):
+    """Best-effort HTTP status for OpenAI / google-genai / requests errors."""
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+def is_retryable(exc):
+    status = get_status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # Connection resets / timeouts carry no status code
+    name = type(exc).__name__.lower()
+    return "timeout" in name or "connection" in name
+
+def _retry_after(exc):
+    """Honours a `Retry-After` header (seconds) when the provider sends one."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def usage_tokens(response):
+    """Total tokens reported by an OpenAI-style or Gemini response (0 if unknown)."""
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None):
+        return int(usage.total_tokens)
+    meta = getattr(response, "usage_metadata", None)
+    if meta is not None and getattr(meta, "total_token_count", None):
+        return int(meta.total_token_count)
+    return 0
+
+# ==========================================================
+# GATEWAY
+# ==========================================================
+
+class ProviderGateway:
+    """
+    One gateway per provider. Every call goes through:
+    budget check → concurrency cap → per-key token bucket → call,
+    with exponential backoff + full jitter on 429/5xx (Retry-After
+    honoured up to MAX_BACKOFF; no concurrency slot is held meanwhile).
+    """
+
+    def __init__(self, name, requests_per_minute, burst, max_concurrency,
+                 daily_token_budget=0, daily_cost_budget=0.0, cost_per_1k_tokens=0.0):
+        self.name = name
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self.daily_token_budget = daily_token_budget
+        self.daily_cost_budget = daily_cost_budget
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+        self.day = date.today()
+        self.tokens_today = 0
+        self.cost_today = 0.0
+        self.stats = {"calls": 0, "retries": 0, "failures": 0}
+
+    def _bucket(self, api_key):
+        with self.lock:
+            if api_key not in self.buckets:
+                self.buckets[api_key] = TokenBucket(self.rate, self.burst)
+            return self.buckets[api_key]
+
+    def _check_budget(self):
+        with self.lock:
+            if date.today() != self.day:
+                self.day = date.today()
+                self.tokens_today = 0
+                self.cost_today = 0.0
+            if self.daily_token_budget and self.tokens_today >= self.daily_token_budget:
+                raise BudgetExceeded(f"{self.name}: daily token budget of {self.daily_token_budget} reached")
+            if self.daily_cost_budget and self.cost_today >= self.daily_cost_budget:
+                raise BudgetExceeded(f"{self.name}: daily cost budget of ${self.daily_cost_budget:.2f} reached")
+
+    def record_usage(self, tokens):
+        cost = tokens / 1000.0 * self.cost_per_1k_tokens
+        with self.lock:
+            self.tokens_today += tokens
+            self.cost_today += cost
+        count("tokens", tokens)
+        if cost:
+            count("cost_usd", cost)
+
+    def _check_live(self, deadline, cancel):
+        if cancel is not None and cancel.is_set():
+            raise CallCancelled(f"{self.name}: cancelled")
+        if deadline is not None and time.monotonic() >= deadline:
+            raise CallCancelled(f"{self.name}: deadline passed")
+
+    def call(self, api_key, fn, *args, deadline=None, cancel=None, **kwargs):
+        """
+        Runs `fn(*args, **kwargs)` under the gateway's limits and returns its result.
+        `deadline` (time.monotonic()) and `cancel` (threading.Event) stop a call
+        that is still waiting for a slot, a token or a retry from being sent.
+        """
+        cassette = get_active_cassette()
+        if cassette is not None and cassette.mode == "replay":
+            # Offline: served from the cassette, no limits apply
+            count("llm_calls")
+            return cassette.replay(self.name, kwargs)
+
+        self._check_budget()
+        bucket = self._bucket(api_key)
+
+        for attempt in range(MAX_RETRIES + 1):
+            # A concurrency slot is held for the request only, not through its backoff
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self.semaphore.acquire(timeout=timeout):
+                raise CallCancelled(f"{self.name}: deadline passed waiting for a slot")
+            try:
+                if not bucket.acquire(deadline=deadline):
+                    raise CallCancelled(f"{self.name}: deadline passed waiting for the rate limit")
+                self._check_live(deadline, cancel)
+                try:
+                    response, error = fn(*args, **kwargs), None
+                except Exception as e:
+                    error = e
+            finally:
+                self.semaphore.release()
+
+            if error is None:
+                with self.lock:
+                    self.stats["calls"] += 1
+                count("llm_calls")
+                tokens = usage_tokens(response)
+                self.record_usage(tokens)
+                if cassette is not None:
+                    cassette.record(self.name, kwargs, response, tokens)
+                return response
+
+            delay = _retry_after(error)
+            if delay is None:
+                delay = random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+            delay = min(delay, MAX_BACKOFF)    # a provider's Retry-After is capped too
+            out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+            if attempt >= MAX_RETRIES or not is_retryable(error) or out_of_time:
+                with self.lock:
+                    self.stats["failures"] += 1
+                raise error
+            print(f"⏳ {self.name}: HTTP {get_status_code(error)} – retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+            with self.lock:
+                self.stats["retries"] += 1
+            count("llm_retries")
+            if cancel is not None:
+                cancel.wait(delay)
+            else:
+                time.sleep(delay)
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+def get_gateway(provider):
+    """Returns the shared gateway for 'openrouter' or 'gemini'."""
+    with _gateways_lock:
+        if provider not in _gateways:
+            cfg = dict(PROVIDER_DEFAULTS[provider])
+            prefix = f"GRADER_{provider.upper()}_"
+            for key, default in cfg.items():
+                cfg[key] = type(default)(_env_float(prefix + key.upper(), default))
+            _gateways[provider] = ProviderGateway(provider, **cfg)
+        return _gateways[provider]
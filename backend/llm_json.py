@@ -0,0 +1,294 @@
+# ==========================================================
+# LLM JSON RESPONSES
+# Every model reply that should be JSON goes through here:
+#
+#   1. structured output  - a JSON-schema `response_format` is sent
+#      where the provider accepts it (remembered per model if not)
+#   2. local repair       - fences / prose around the object,
+#      trailing commas, Python literals, truncated strings/arrays
+#   3. compiled schemas   - answer, flowchart, rubric and score
+#      shapes are checked (and defaults filled) by validators built
+#      once at import
+#
+# A new model call is made only when repair + validation fail.
+#
+#   GRADER_STRUCTURED_OUTPUT=1     send response_format
+#   GRADER_JSON_RETRIES=1          extra calls after an unrepairable reply
+# ==========================================================
+
+import json
+import os
+import re
+
+from backend.llm_gateway import get_status_code
+from backend.tracing import count
+
+STRUCTURED_OUTPUT = os.environ.get("GRADER_STRUCTURED_OUTPUT", "1") == "1"
+JSON_RETRIES = int(os.environ.get("GRADER_JSON_RETRIES", 1))
+
+class LLMJSONError(ValueError):
+    """The reply could not be repaired into JSON matching the expected schema."""
+
+# ==========================================================
+# REPAIR
+# ==========================================================
+
+_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = {"None": "null", "True": "true", "False": "false"}
+_CLOSE = {"{": "}", "[": "]"}
+
+def _outermost(text):
+    """
+    The first top-level JSON object/array in `text`, cut at its closing
+    bracket (trailing prose dropped) or, if truncated, closed off.
+    """
+    start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise LLMJSONError("No JSON object in model reply")
+
+    out, stack = [], []
+    in_string = escaped = False
+    i = start
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            out.append(ch)
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+            out.append(ch)
+        elif ch in _CLOSE:
+            stack.append(_CLOSE[ch])
+            out.append(ch)
+        elif ch in "}]":
+            if stack and ch == stack[-1]:
+                stack.pop()
+                out.append(ch)
+                if not stack:
+                    return "".join(out), False
+            # stray closer: skip it
+        else:
+            word = re.match(r"(None|True|False)\b", text[i:])
+            if word and not (text[i - 1].isalnum() or text[i - 1] == "_"):
+                out.append(_PY_LITERALS[word.group()])
+                i += len(word.group())
+                continue
+            out.append(ch)
+        i += 1
+
+    # Truncated reply: close the open string, drop a dangling key/comma, close brackets
+    body = "".join(out)
+    if in_string:
+        body += '"'
+    body = body.rstrip()
+    if stack and stack[-1] == "}":
+        body = re.sub(r'([{,])\s*"[^"]*"\s*:?\s*$', r"\1", body)   # key without a value
+    body = re.sub(r"[,:]\s*$", "", body)
+    return body + "".join(reversed(stack)), True
+
+def repair_json(text):
+    """Best-effort JSON text from a model reply (see module header)."""
+    body, _ = _outermost(_FENCE.sub("", text or ""))
+    return _TRAILING_COMMA.sub(r"\1", body)
+
+def loads_lenient(text):
+    """json.loads, falling back to `repair_json` (counted as "json_repairs")."""
+    cleaned = _FENCE.sub("", text or "").strip()
+    try:
+        return json.loads(cleaned)
+    except ValueError:
+        pass
+    try:
+        value = json.loads(repair_json(cleaned))
+    except ValueError as e:
+        raise LLMJSONError(f"Unrepairable JSON: {e}") from e
+    count("json_repairs")
+    return value
+
+# ==========================================================
+# COMPILED SCHEMAS (JSON-Schema subset)
+# type / properties / required / items / enum / minimum / default
+# ==========================================================
+
+_TYPES = {
+    "object": dict, "array": list, "string": str, "boolean": bool, "null": type(None),
+    "number": (int, float), "integer": int,
+}
+
+def compile_schema(schema, path="$"):
+    """Builds a validator `fn(value) -> value` (defaults filled, numeric strings coerced) once."""
+    types = schema.get("type")
+    types = [types] if isinstance(types, str) else list(types or [])
+    enum = schema.get("enum")
+    minimum = schema.get("minimum")
+    props = {k: compile_schema(v, f"{path}.{k}") for k, v in schema.get("properties", {}).items()}
+    defaults = {k: v["default"] for k, v in schema.get("properties", {}).items() if "default" in v}
+    required = [k for k in schema.get("required", []) if k not in defaults]
+    items = compile_schema(schema["items"], f"{path}[]") if "items" in schema else None
+    py_types = tuple(t for name in types for t in (_TYPES[name] if isinstance(_TYPES[name], tuple) else (_TYPES[name],)))
+    # "5" → 5 only where a string is not itself acceptable
+    numeric = ("number" in types or "integer" in types) and "string" not in types
+
+    def validate(value):
+        if numeric and isinstance(value, str):
+            try:
+                value = float(value.strip())
+            except ValueError:
+                pass
+        if py_types and (not isinstance(value, py_types) or (isinstance(value, bool) and bool not in py_types)):
+            raise LLMJSONError(f"{path}: expected {'/'.join(types)}, got {type(value).__name__}")
+        if enum is not None and value not in enum:
+            raise LLMJSONError(f"{path}: {value!r} not in {enum}")
+        if minimum is not None and isinstance(value, (int, float)) and value < minimum:
+            raise LLMJSONError(f"{path}: {value} < {minimum}")
+        if isinstance(value, dict):
+            for key in required:
+                if key not in value:
+                    raise LLMJSONError(f"{path}: missing '{key}'")
+            for key, default in defaults.items():
+                if value.get(key) is None and default is not None:
+                    value[key] = json.loads(json.dumps(default))
+                value.setdefault(key, default)
+            for key, check in props.items():
+                if key in value:
+                    value[key] = check(value[key])
+        elif isinstance(value, list) and items is not None:
+            value = [items(v) for v in value]
+        return value
+
+    return validate
+
+_STRINGS = {"type": "array", "items": {"type": "string"}, "default": []}
+
+ANSWER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question_id": {"type": ["string", "null"]},   # the caller knows it anyway
+        "text": _STRINGS,
+        "equations": _STRINGS,
+        "flowcharts": {"type": "array", "default": []},
+        "final_answer": {"type": ["string", "number", "null"], "default": None},
+    },
+}
+
+GRAPH_SCHEMA = {
+    "type": "object",
+    "required": ["graph"],
+    "properties": {
+        "question_id": {"type": ["string", "null"]},
+        "student_id": {"type": ["string", "null"]},
+        "graph": {
+            "type": "object",
+            "properties": {
+                "nodes": {"type": "array", "default": [], "items": {
+                    "type": "object", "required": ["id", "text"],
+                    "properties": {"id": {"type": ["string", "number"]}, "text": {"type": "string"}, "shape": {"type": ["string", "null"]}},
+                }},
+                "edges": {"type": "array", "default": [], "items": {
+                    "type": "object", "required": ["source", "target"],
+                    "properties": {"source": {"type": ["string", "number"]}, "target": {"type": ["string", "number"]}, "label": {"type": ["string", "null"]}},
+                }},
+            },
+        },
+    },
+}
+
+RUBRIC_SCHEMA = {
+    "type": "object",
+    "required": ["key_points"],
+    "properties": {
+        "question_id": {"type": ["string", "null"]},
+        "max_marks": {"type": "number", "minimum": 0},
+        "key_points": {"type": "array", "items": {
+            "type": "object", "required": ["id", "concept", "type", "marks"],
+            "properties": {
+                "id": {"type": "string"},
+                "concept": {"type": "string"},
+                "type": {"type": "string", "enum": ["node_check", "connection_check"]},
+                "expected_text": {"type": "string"},
+                "from_text": {"type": "string"},
+                "to_text": {"type": "string"},
+                "marks": {"type": "number", "minimum": 0},
+            },
+        }},
+    },
+}
+
+SCORE_SCHEMA = {
+    "type": "object",
+    "required": ["awarded_marks"],
+    "properties": {
+        "awarded_marks": {"type": "number", "minimum": 0},
+        "reasoning": {"type": "string", "default": ""},
+    },
+}
+
+validate_answer = compile_schema(ANSWER_SCHEMA)
+validate_graph = compile_schema(GRAPH_SCHEMA)
+validate_rubric = compile_schema(RUBRIC_SCHEMA)
+validate_score = compile_schema(SCORE_SCHEMA)
+
+def parse_llm_json(text, validator=None):
+    """Model reply → validated object; raises LLMJSONError."""
+    value = loads_lenient(text)
+    return validator(value) if validator else value
+
+# ==========================================================
+# STRUCTURED OUTPUT + RETRY
+# ==========================================================
+
+_no_structured = set()   # models whose provider rejected response_format
+
+def _strip_defaults(schema):
+    """OpenAI-style json_schema: no 'default', no custom keywords."""
+    out = {k: v for k, v in schema.items() if k != "default"}
+    if "properties" in out:
+        out["properties"] = {k: _strip_defaults(v) for k, v in out["properties"].items()}
+    if "items" in out:
+        out["items"] = _strip_defaults(out["items"])
+    return out
+
+def structured(create, name, schema):
+    """
+    Wraps an OpenAI-compatible `create(**kwargs)` so it asks for
+    `schema` as structured output, falling back to a plain request
+    (and not asking again for that model) if the provider rejects it.
+    """
+    def call(**kwargs):
+        model = kwargs.get("model")
+        if STRUCTURED_OUTPUT and model not in _no_structured:
+            fmt = {"type": "json_schema", "json_schema": {"name": name, "schema": _strip_defaults(schema)}}
+            try:
+                return create(response_format=fmt, **kwargs)
+            except Exception as e:
+                if get_status_code(e) not in (400, 422):
+                    raise
+                _no_structured.add(model)
+                count("structured_output_fallbacks")
+        return create(**kwargs)
+    return call
+
+def call_json(request, validator=None, retries=None):
+    """
+    `request()` returns the model's reply text. It is parsed, repaired
+    and validated; the request is repeated only if that fails.
+    """
+    retries = JSON_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        text = request()
+        if not text:
+            error = LLMJSONError("Model generated empty text.")
+        else:
+            try:
+                return parse_llm_json(text, validator)
+            except LLMJSONError as e:
+                error = e
+        if attempt < retries:
+            count("json_retries")
+    raise error
@@ -0,0 +1,173 @@
+# ==========================================================
+# LLM RECORD / REPLAY
+# Captures provider request/response pairs to cassette files so
+# grading can be replayed offline (no API keys, no network).
+#
+#   GRADER_LLM_CASSETTE=cassettes/run.jsonl GRADER_LLM_MODE=record  → live calls, saved
+#   GRADER_LLM_CASSETTE=cassettes/run.jsonl GRADER_LLM_MODE=replay  → served from file
+#
+# A cassette is JSONL: each recorded interaction is appended as one
+# line (the last line per request wins). Older single-document
+# cassettes ({"version": 1, "interactions": [...]}) are still read,
+# and rewritten as JSONL the first time they are recorded into.
+# ==========================================================
+
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when a request was never recorded."""
+
+# ==========================================================
+# REQUEST FINGERPRINTING
+# ==========================================================
+
+def _normalize(value):
+    """Makes a request payload JSON-serialisable and stable across runs."""
+    if isinstance(value, dict):
+        return {str(k): _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if hasattr(value, "tobytes"):  # PIL images, numpy arrays
+        return "bytes:" + hashlib.sha1(value.tobytes()).hexdigest()
+    return repr(value)
+
+def request_fingerprint(provider, request):
+    payload = json.dumps({"provider": provider, "request": _normalize(request)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# ==========================================================
+# RESPONSE (DE)SERIALISATION
+# ==========================================================
+
+def response_text(response):
+    """Text content of an OpenAI-style or Gemini response."""
+    choices = getattr(response, "choices", None)
+    if choices:
+        return choices[0].message.content or ""
+    text = getattr(response, "text", None)
+    if text:
+        return text
+    try:
+        parts = response.candidates[0].content.parts
+        return "\n".join(p.text for p in parts if getattr(p, "text", None))
+    except Exception:
+        return ""
+
+def make_response(text, tokens=0):
+    """
+    Minimal stand-in exposing both response shapes the pipelines read:
+    `.choices[0].message.content` (OpenAI) and `.text` (Gemini).
+    """
+    message = SimpleNamespace(content=text)
+    return SimpleNamespace(
+        text=text,
+        choices=[SimpleNamespace(message=message, finish_reason="stop")],
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[SimpleNamespace(text=text)]))],
+        usage=SimpleNamespace(total_tokens=tokens),
+        usage_metadata=SimpleNamespace(total_token_count=tokens),
+    )
+
+# ==========================================================
+# CASSETTE
+# ==========================================================
+
+class Cassette:
+    def __init__(self, path, mode="replay"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.interactions = {}
+        self.hits = 0
+        self.misses = 0
+
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                text = f.read()
+            try:
+                data = json.loads(text)
+            except ValueError:
+                data = None
+            legacy = isinstance(data, dict) and "interactions" in data
+            for item in data["interactions"] if legacy else self._lines(text):
+                self.interactions[item["key"]] = item
+            if legacy and mode == "record":
+                self._rewrite()
+
+    @staticmethod
+    def _lines(text):
+        for line in text.splitlines():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue   # torn last line after a crash
+
+    def replay(self, provider, request):
+        key = request_fingerprint(provider, request)
+        with self.lock:
+            item = self.interactions.get(key)
+            if item is None:
+                self.misses += 1
+                raise CassetteMiss(f"No recorded {provider} response for request {key[:12]} in {self.path}")
+            self.hits += 1
+        return make_response(item["response"]["text"], item["response"].get("tokens", 0))
+
+    def record(self, provider, request, response, tokens=0):
+        key = request_fingerprint(provider, request)
+        item = {
+            "key": key,
+            "provider": provider,
+            "model": request.get("model"),
+            "response": {"text": response_text(response), "tokens": tokens},
+        }
+        with self.lock:
+            self.interactions[key] = item
+            self._append(item)
+
+    def _makedirs(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def _append(self, item):
+        self._makedirs()
+        with open(self.path, "a") as f:
+            f.write(json.dumps(item) + "\n")
+
+    def _rewrite(self):
+        """Converts a version-1 cassette to JSONL in place."""
+        self._makedirs()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.writelines(json.dumps(item) + "\n" for item in self.interactions.values())
+        os.replace(tmp, self.path)
+
+# ==========================================================
+# ACTIVE CASSETTE
+# ==========================================================
+
+_active = None
+if os.environ.get("GRADER_LLM_CASSETTE"):
+    _active = Cassette(os.environ["GRADER_LLM_CASSETTE"], os.environ.get("GRADER_LLM_MODE", "replay"))
+
+def get_active_cassette():
+    return _active
+
+@contextmanager
+def use_cassette(path, mode="replay"):
+    """Activates a cassette for the duration of a `with` block (tests, benchmarks)."""
+    global _active
+    previous = _active
+    _active = Cassette(path, mode)
+    try:
+        yield _active
+    finally:
+        _active = previous
@@ -0,0 +1,316 @@
+# ==========================================================
+# LLM ROUTER
+# Every model call names a task ("grader", "extractor",
+# "flowchart"). A task's route is an ordered list of endpoints
+# (provider : model @ base URL) and one call:
+#
+#   1. is sent to the first endpoint
+#   2. gets a hedged duplicate on the next endpoint if no reply has
+#      come after that endpoint's p95 latency (clamped); the first
+#      reply wins and the other request is cancelled
+#   3. fails over to the next endpoint at once on an error
+#   4. gives up at its deadline, however many endpoints are left
+#
+# Each request still goes through the provider's gateway (rate
+# limits, retries, budgets, cassettes). A loser still waiting there
+# is never sent; one already in flight is abandoned and cut off by
+# its HTTP timeout (the time left until the deadline).
+#
+#   GRADER_LLM_ROUTE_<TASK>="openrouter:<model>@<base url>, gemini:<model>"
+#   GRADER_LLM_PAID_FALLBACK=0     1 = the grader's free model fails
+#                                  over / hedges to a paid one
+#   GRADER_LLM_DEADLINE_S=60       per call, all attempts included
+#   GRADER_LLM_HEDGE_S=10          hedge delay until p95 is known
+#   GRADER_LLM_HEDGE_MIN_S=0.5     clamp on the p95 hedge delay
+#   GRADER_LLM_HEDGE_MAX_S=20
+#   GRADER_LLM_MAX_HEDGES=1        0 = failover only
+# ==========================================================
+
+import base64
+import contextvars
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from openai import OpenAI
+
+from backend.config import get_secret
+from backend.llm_gateway import _env_float, get_gateway
+from backend.llm_json import STRUCTURED_OUTPUT, structured
+from backend.llm_replay import response_text
+from backend.tracing import count
+
+GRADER_MODEL = "meta-llama/llama-3.3-70b-instruct:free"
+VISION_MODEL = "google/gemini-2.0-flash-001"
+GEMINI_MODEL = "models/gemini-2.5-flash"
+
+# Point at `python -m backend.llm_stub_server` to run offline
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+GEMINI_BASE_URL = os.environ.get("GEMINI_BASE_URL")
+
+# Off by default: a free-tier outage would otherwise bill every grading call
+PAID_FALLBACK = os.environ.get("GRADER_LLM_PAID_FALLBACK", "0") == "1"
+
+DEFAULT_ROUTES = {
+    "grader": f"openrouter:{GRADER_MODEL}" + (f", openrouter:{VISION_MODEL}" if PAID_FALLBACK else ""),
+    "extractor": f"openrouter:{VISION_MODEL}, gemini:{GEMINI_MODEL}",
+    "flowchart": f"gemini:{GEMINI_MODEL}, openrouter:{VISION_MODEL}",
+}
+
+API_KEYS = {
+    "openrouter": ("OPENROUTER_API_KEY", "OPENROUTER_LLAMA_API_KEY"),
+    "gemini": ("GEMINI_API_KEY", "GOOGLE_API_KEY"),
+}
+
+DEADLINE_S = _env_float("GRADER_LLM_DEADLINE_S", 60.0)
+HEDGE_S = _env_float("GRADER_LLM_HEDGE_S", 10.0)
+HEDGE_MIN_S = _env_float("GRADER_LLM_HEDGE_MIN_S", 0.5)
+HEDGE_MAX_S = _env_float("GRADER_LLM_HEDGE_MAX_S", 20.0)
+MAX_HEDGES = int(_env_float("GRADER_LLM_MAX_HEDGES", 1))
+LATENCY_WINDOW = 200      # recent successful calls per endpoint
+MIN_SAMPLES = 20          # before p95 replaces HEDGE_S
+
+# Process-wide counters (the same names are counted on the key point trace)
+ROUTER_STATS = {"calls": 0, "llm_hedges": 0, "llm_hedge_wins": 0, "llm_failovers": 0, "llm_deadline_exceeded": 0}
+_stats_lock = threading.Lock()
+
+class LLMUnavailable(RuntimeError):
+    """No endpoint of the route could be called (missing keys)."""
+
+class LLMDeadlineExceeded(TimeoutError):
+    """No endpoint replied before the call's deadline."""
+
+def _count(name):
+    with _stats_lock:
+        ROUTER_STATS[name] += 1
+    count(name)
+
+# ==========================================================
+# ENDPOINTS
+# ==========================================================
+
+_openai_clients = {}
+_gemini_clients = {}
+_clients_lock = threading.Lock()
+
+class Endpoint:
+    """One provider / model / base URL of a route."""
+
+    __slots__ = ("provider", "model", "base_url", "key")
+
+    def __init__(self, provider, model, base_url=None):
+        if provider not in API_KEYS:
+            raise ValueError(f"Unknown LLM provider '{provider}'")
+        self.provider = provider
+        self.model = model
+        self.base_url = base_url or (OPENROUTER_BASE_URL if provider == "openrouter" else GEMINI_BASE_URL)
+        self.key = f"{provider}:{model}" + (f"@{base_url}" if base_url else "")
+
+    @classmethod
+    def parse(cls, spec):
+        """e.g. openrouter:meta-llama/llama-3.3-70b-instruct:free@http://127.0.0.1:8765/api/v1"""
+        spec, _, base_url = spec.strip().partition("@")
+        provider, _, model = spec.partition(":")
+        return cls(provider.strip(), model.strip(), base_url.strip() or None)
+
+    def __repr__(self):
+        return f"Endpoint({self.key})"
+
+    def api_key(self, overrides=None):
+        if overrides and overrides.get(self.provider):
+            return overrides[self.provider]
+        return next(filter(None, (get_secret(name) for name in API_KEYS[self.provider])), None)
+
+    def complete(self, api_key, prompt, images, schema, deadline, cancel):
+        """Reply text (None if empty); the HTTP timeout is the time left until `deadline`."""
+        call = self._openrouter if self.provider == "openrouter" else self._gemini
+        return call(api_key, prompt, images, schema, deadline, cancel)
+
+    def _openrouter(self, api_key, prompt, images, schema, deadline, cancel):
+        with _clients_lock:
+            client = _openai_clients.get((self.base_url, api_key))
+            if client is None:
+                # The gateway retries; the SDK's own retries would outlive the deadline
+                client = OpenAI(base_url=self.base_url, api_key=api_key, max_retries=0)
+                _openai_clients[(self.base_url, api_key)] = client
+
+        def create(**kwargs):
+            return client.chat.completions.create(timeout=max(0.1, deadline - time.monotonic()), **kwargs)
+
+        content = prompt
+        if images:
+            content = [{"type": "text", "text": prompt}] + [
+                {"type": "image_url", "image_url": {"url": f"data:{img.mime};base64,{base64.b64encode(img.data).decode('utf-8')}"}}
+                for img in images
+            ]
+        response = get_gateway("openrouter").call(
+            api_key,
+            structured(create, *schema) if schema else create,
+            model=self.model,
+            messages=[{"role": "user", "content": content}],
+            temperature=0,
+            deadline=deadline,
+            cancel=cancel,
+        )
+        if not response or not getattr(response, "choices", None):
+            return None
+        return response.choices[0].message.content
+
+    def _gemini(self, api_key, prompt, images, schema, deadline, cancel):
+        from google import genai
+        from google.genai import types  # type: ignore
+
+        with _clients_lock:
+            client = _gemini_clients.get((self.base_url, api_key))
+            if client is None:
+                client = genai.Client(
+                    api_key=api_key,
+                    http_options=types.HttpOptions(api_version="v1beta", base_url=self.base_url)
+                )
+                _gemini_clients[(self.base_url, api_key)] = client
+
+        # Gemini JSON mode: no fences or prose around the object
+        config = types.GenerateContentConfig(response_mime_type="application/json") if schema and STRUCTURED_OUTPUT else None
+
+        def generate(config=None, **kwargs):
+            # Timeout added here, not in kwargs: cassette fingerprints stay stable
+            timeout = types.HttpOptions(timeout=int(max(0.1, deadline - time.monotonic()) * 1000))
+            config = config.model_copy(update={"http_options": timeout}) if config else types.GenerateContentConfig(http_options=timeout)
+            return client.models.generate_content(config=config, **kwargs)
+
+        response = get_gateway("gemini").call(
+            api_key,
+            generate,
+            model=self.model,
+            contents=[prompt] + [img.image() for img in images],
+            config=config,
+            deadline=deadline,
+            cancel=cancel,
+        )
+        return response_text(response).strip() or None
+
+_parsed_routes = {}
+
+def get_route(task):
+    """The task's endpoints, in order (GRADER_LLM_ROUTE_<TASK> overrides the default)."""
+    spec = os.environ.get(f"GRADER_LLM_ROUTE_{task.upper()}") or DEFAULT_ROUTES[task]
+    if spec not in _parsed_routes:
+        _parsed_routes[spec] = [Endpoint.parse(part) for part in spec.split(",") if part.strip()]
+    return _parsed_routes[spec]
+
+# ==========================================================
+# LATENCY (p95 → hedge delay)
+# ==========================================================
+
+_latencies = {}
+_latency_lock = threading.Lock()
+
+def record_latency(endpoint, seconds):
+    with _latency_lock:
+        _latencies.setdefault(endpoint.key, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+def _p95(samples):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+def _hedge_delay(samples):
+    if len(samples) < MIN_SAMPLES:
+        return HEDGE_S
+    return min(HEDGE_MAX_S, max(HEDGE_MIN_S, _p95(samples)))
+
+def hedge_delay(endpoint):
+    """Seconds to wait for `endpoint` before hedging: its recent p95, clamped."""
+    with _latency_lock:
+        samples = list(_latencies.get(endpoint.key, ()))
+    return _hedge_delay(samples)
+
+def latency_snapshot():
+    """{endpoint: {"n", "p95_s", "hedge_s"}} for dashboards and benchmarks."""
+    with _latency_lock:
+        windows = {key: list(samples) for key, samples in _latencies.items()}
+    return {
+        key: {"n": len(samples), "p95_s": round(_p95(samples), 3), "hedge_s": round(_hedge_delay(samples), 3)}
+        for key, samples in windows.items()
+    }
+
+# ==========================================================
+# HEDGED CALL
+# ==========================================================
+
+def complete(task, prompt, images=(), schema=None, api_keys=None, deadline_s=None):
+    """
+    Reply text of the first endpoint of `task`'s route to answer (see
+    module header). `images` are PageArtifacts, `schema` a
+    (name, JSON schema) pair for structured output, `api_keys`
+    per-provider overrides ({"gemini": key}).
+    """
+    keyed = [(ep, ep.api_key(api_keys)) for ep in get_route(task)]
+    endpoints = [(ep, key) for ep, key in keyed if key]
+    if not endpoints:
+        names = sorted({API_KEYS[ep.provider][0] for ep, _ in keyed})
+        raise LLMUnavailable(f"No API key for the '{task}' route ({', '.join(names)})")
+
+    with _stats_lock:
+        ROUTER_STATS["calls"] += 1
+    deadline = time.monotonic() + (deadline_s or DEADLINE_S)
+    cancel = threading.Event()
+    results = queue.Queue()
+
+    def attempt(endpoint, api_key, hedge):
+        t0 = time.monotonic()
+        try:
+            text = endpoint.complete(api_key, prompt, images, schema, deadline, cancel)
+        except Exception as e:
+            results.put((endpoint, hedge, False, e))
+            return
+        record_latency(endpoint, time.monotonic() - t0)
+        results.put((endpoint, hedge, True, text))
+
+    def launch(endpoint, api_key, hedge=False):
+        # Copied context: stage()/count() inside still land on the caller's key point
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(attempt, endpoint, api_key, hedge), daemon=True,
+                         name=f"llm-{task}").start()
+
+    launch(*endpoints[0])
+    primary, next_up, in_flight, hedges = endpoints[0][0], 1, 1, 0
+    hedge_at = time.monotonic() + hedge_delay(primary) if MAX_HEDGES else float("inf")
+    error = None
+
+    try:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                _count("llm_deadline_exceeded")
+                raise LLMDeadlineExceeded(
+                    f"No reply for '{task}' within {deadline_s or DEADLINE_S:.0f}s" + (f" (last error: {error})" if error else "")
+                )
+            try:
+                endpoint, hedged, ok, value = results.get(timeout=max(0.0, min(deadline, hedge_at) - now))
+            except queue.Empty:
+                if time.monotonic() < hedge_at:
+                    continue    # the deadline: raised above
+                # Slow reply: duplicate it on the next endpoint (or the same one if it is the only one)
+                launch(*endpoints[next_up % len(endpoints)], hedge=True)
+                next_up, in_flight, hedges = next_up + 1, in_flight + 1, hedges + 1
+                _count("llm_hedges")
+                hedge_at = time.monotonic() + hedge_delay(primary) if hedges < MAX_HEDGES else float("inf")
+                continue
+
+            in_flight -= 1
+            if ok:
+                if hedged:
+                    _count("llm_hedge_wins")
+                return value
+            error = value
+            if next_up < len(endpoints):
+                print(f"⚠️ {endpoint.key} failed ({type(value).__name__}: {value}); trying {endpoints[next_up][0].key}")
+                launch(*endpoints[next_up])
+                next_up, in_flight = next_up + 1, in_flight + 1
+                _count("llm_failovers")
+            elif in_flight == 0:
+                raise error
+    finally:
+        cancel.set()    # losers still queued in the gateway are never sent
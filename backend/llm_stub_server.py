@@ -0,0 +1,229 @@
+# ==========================================================
+# LOCAL LLM STAND-IN SERVER
+# Mimics the OpenRouter chat API and the Gemini generate_content
+# API so the grading pipeline can be load-tested with no network.
+#
+#   python -m backend.llm_stub_server --port 8765 --latency 0.4 --error-rate 0.05
+#   python -m backend.llm_stub_server --port 8766 --stall-rate 0.05 --stall 30
+#
+# Every random draw (score, delay, injected error) comes from a
+# random.Random seeded with --seed, the request's fingerprint and how
+# often that request was seen, so runs and cassettes are reproducible.
+#
+#   OPENROUTER_BASE_URL=http://127.0.0.1:8765/api/v1
+#   GEMINI_BASE_URL=http://127.0.0.1:8765
+# ==========================================================
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==========================================================
+# CANNED RESPONSES
+# ==========================================================
+
+def _grader_reply(prompt, rng):
+    """Answers the `_classify_alignment_llm` prompt with a plausible score."""
+    m = re.search(r"FULL MARKS \(([\d.]+)\)", prompt)
+    max_m = float(m.group(1)) if m else 1.0
+    awarded = rng.choice([0.0, max_m / 2, max_m])
+    return json.dumps({"awarded_marks": awarded, "reasoning": "Stub grader response."})
+
+def _extractor_reply(prompt):
+    """Answers the student answer extraction prompt with a minimal answer object."""
+    m = re.search(r"Question ID: (\S+?)\.?\s", prompt)
+    qid = m.group(1) if m else "Q1"
+    return json.dumps({
+        "question_id": qid,
+        "text": ["Stub answer text extracted offline."],
+        "equations": ["x = 5"],
+        "flowcharts": [],
+        "final_answer": "x=5",
+    })
+
+STUDENT_GRAPH = {
+    "question_id": "Q_AUTO",
+    "student_id": "stub",
+    "graph": {
+        "nodes": [
+            {"id": "n1", "text": "Start", "shape": "oval"},
+            {"id": "n2", "text": "Input N", "shape": "rect"},
+            {"id": "n3", "text": "Is N > 0?", "shape": "diamond"},
+            {"id": "n4", "text": "Print N", "shape": "rect"},
+            {"id": "n5", "text": "End", "shape": "oval"},
+        ],
+        "edges": [
+            {"source": "n1", "target": "n2", "label": ""},
+            {"source": "n2", "target": "n3", "label": ""},
+            {"source": "n3", "target": "n4", "label": "Yes"},
+            {"source": "n4", "target": "n5", "label": ""},
+        ],
+    },
+}
+
+TEACHER_RUBRIC = {
+    "question_id": "Q_AUTO",
+    "max_marks": 3,
+    "key_points": [
+        {"id": "k1", "concept": "Start Node", "type": "node_check", "expected_text": "Start", "marks": 1},
+        {"id": "k2", "concept": "Input Step", "type": "node_check", "expected_text": "Input N", "marks": 1},
+        {"id": "k3", "concept": "Input to decision", "type": "connection_check",
+         "from_text": "Input N", "to_text": "Is N > 0?", "marks": 1},
+    ],
+}
+
+def canned_reply(prompt, rng=None):
+    if "academic grader" in prompt:
+        return _grader_reply(prompt, rng or random.Random(prompt))
+    if "academic answer extractor" in prompt:
+        return _extractor_reply(prompt)
+    if "Teacher's Solution" in prompt:
+        return json.dumps(TEACHER_RUBRIC)
+    if "Analyze this flowchart" in prompt:
+        return json.dumps(STUDENT_GRAPH)
+    return "{}"
+
+# ==========================================================
+# HTTP HANDLER
+# ==========================================================
+
+def _openai_prompt(body):
+    texts = []
+    for msg in body.get("messages", []):
+        content = msg.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        elif isinstance(content, list):
+            texts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    return "\n".join(texts)
+
+def _gemini_prompt(body):
+    texts = []
+    for content in body.get("contents", []):
+        texts.extend(part.get("text", "") for part in content.get("parts", []) if "text" in part)
+    return "\n".join(texts)
+
+def make_handler(latency, jitter, error_rate, stall_rate=0.0, stall=0.0, seed=0):
+    seen = {}
+    seen_lock = threading.Lock()
+
+    def request_rng(path, raw):
+        """Same seed + same request (and repeat number) -> same draws, whatever the thread order."""
+        fingerprint = hashlib.sha1(path.encode() + b"\0" + raw).hexdigest()
+        with seen_lock:
+            n = seen[fingerprint] = seen.get(fingerprint, -1) + 1
+        return random.Random(f"{seed}:{fingerprint}:{n}")
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out as separate writes: avoid Nagle / delayed-ACK stalls
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status, payload):
+            raw = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(raw)))
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.end_headers()
+            try:
+                self.wfile.write(raw)
+            except (BrokenPipeError, ConnectionResetError):
+                pass    # client gave up (timeout / hedge lost)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            raw = self.rfile.read(length)
+            try:
+                body = json.loads(raw or b"{}")
+            except json.JSONDecodeError:
+                return self._send(400, {"error": {"message": "Invalid JSON body"}})
+
+            path = self.path.split("?", 1)[0]
+            rng = request_rng(path, raw)
+            delay = latency + rng.uniform(-jitter, jitter)
+            if rng.random() < stall_rate:
+                delay += stall    # the tail the router's hedging is there for
+            time.sleep(max(0.0, delay))
+
+            if rng.random() < error_rate:
+                status = rng.choice([429, 503])
+                return self._send(status, {"error": {"code": status, "message": "Stub injected error", "status": "UNAVAILABLE"}})
+
+            if path.endswith("/chat/completions"):
+                prompt = _openai_prompt(body)
+                text = canned_reply(prompt, rng)
+                tokens = len(prompt) // 4 + len(text) // 4
+                return self._send(200, {
+                    "id": "stub-" + str(rng.randint(0, 10 ** 9)),
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4, "total_tokens": tokens},
+                })
+
+            if path.endswith(":generateContent"):
+                prompt = _gemini_prompt(body)
+                text = canned_reply(prompt, rng)
+                return self._send(200, {
+                    "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+                    "usageMetadata": {
+                        "promptTokenCount": len(prompt) // 4,
+                        "candidatesTokenCount": len(text) // 4,
+                        "totalTokenCount": len(prompt) // 4 + len(text) // 4,
+                    },
+                })
+
+            return self._send(404, {"error": {"message": f"Unknown endpoint {path}"}})
+
+    return StubHandler
+
+# ==========================================================
+# ENTRY POINTS
+# ==========================================================
+
+def start_stub_server(port=0, latency=0.0, jitter=0.0, error_rate=0.0, stall_rate=0.0, stall=0.0, seed=0):
+    """Starts the server on a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port),
+                                 make_handler(latency, jitter, error_rate, stall_rate, stall, seed))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenRouter and Gemini APIs.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean response delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter on the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429/503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="Fraction of requests delayed by --stall")
+    parser.add_argument("--stall", type=float, default=30.0, help="Extra delay of a stalled request in seconds")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for scores, delays and injected errors")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                 make_handler(args.latency, args.jitter, args.error_rate,
+                                              args.stall_rate, args.stall, args.seed))
+    print(f"🧪 LLM stub server on http://127.0.0.1:{args.port}")
+    print(f"   OPENROUTER_BASE_URL=http://127.0.0.1:{args.port}/api/v1")
+    print(f"   GEMINI_BASE_URL=http://127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
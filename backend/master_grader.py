@@ -8,110 +8,130 @@ except ImportError:
     print("⚠️ Error: Could not import 'evaluate_key_point_llm' from backend.text_pipeline")
     def evaluate_key_point_llm(ans, kp): return {"awarded_marks": 0, "reason": "Backend Error"}
 
-try:
-    from backend.flowchart_pipeline import build_graph, score_node_check, score_connection_check
-except ImportError:
-    print("⚠️ Error: Could not import 'build_graph' from backend.flowchart_pipeline")
-    def build_graph(g): return {}, {}
+from backend.compiled_rubric import CompiledKeyPoint, get_compiled_rubric
+from backend.db_handler import get_submissions_for_test, load_db, save_submissions_for_test, thaw
+from backend.grade_cache import evidence_key
+from backend.graph_matcher import best_graph_match
+from backend.node_matcher import USE_NODE_EMBEDDINGS
+from backend.tracing import count, stage, trace_key_point
+
+def _node_embedder():
+    """Sentence embedder for node matching, only when enabled (GRADER_NODE_EMBEDDINGS=1)."""
+    if not USE_NODE_EMBEDDINGS:
+        return None
+    from backend.text_pipeline import get_models
+    return get_models()[0]
+
+def grade_flowchart_key_point(kp, student_graph_data):
+    """Scores one flowchart key point (dict or CompiledKeyPoint) against the student's flowcharts."""
+    if not isinstance(kp, CompiledKeyPoint):
+        kp = CompiledKeyPoint(kp)
+
+    # 1. Parse Student Graph
+    if not student_graph_data:
+        return 0, "No flowchart found in student answer."
+
+    # 2. Get Teacher's Extracted Rules
+    if not kp.rules:
+        # Fallback if no rules exist (e.g. manual entry without image)
+        return kp.marks, "Flowchart present (Generic Check)"
+
+    # 3. CHECKLIST EVALUATION
+    # Every flowchart in the answer is matched against the rules; the best one counts
+    with stage("flowchart_rules"):
+        rule_score_accumulated, feedback_items, best_index = best_graph_match(
+            kp.matcher, student_graph_data, _node_embedder())
+
+    if not feedback_items:
+        reason = "✅ All logic checks passed."
+    else:
+        reason = "⚠️ Issues: " + "; ".join(feedback_items)
+    if len(student_graph_data) > 1:
+        reason = f"Flowchart {best_index + 1} of {len(student_graph_data)}: " + reason
 
-def auto_grade_submission(student_answer_list, teacher_rubric):
+    return rule_score_accumulated, reason
+
+def auto_grade_submission(student_answer_list, teacher_rubric, student_id=None):
     graded_results = []
     
-    # Create lookup for rubric questions
-    rubric_list = teacher_rubric.get("rubric", [])
-    rubric_map = {q["question_id"]: q for q in rubric_list}
+    # Rubric lookups, intents, parsed expectations: built once per test (cached)
+    compiled = get_compiled_rubric(teacher_rubric)
 
     for ans in student_answer_list:
         q_id = ans.get("question_id")
+        rubric_item = compiled.questions.get(q_id)
         
-        if q_id in rubric_map:
-            rubric_item = rubric_map[q_id]
-            
-            # Prepare Flowchart Data (Parse Once if available)
+        if rubric_item is not None:
             student_graph_data = ans.get("flowcharts", [])
-            node_intents, adj = ({}, {})
-            if student_graph_data:
-                # Use the first flowchart found
-                node_intents, adj = build_graph(student_graph_data[0])
 
             total_score = 0
             breakdown = []
 
             # --- ITERATE EVERY KEY POINT INDIVIDUALLY ---
-            for kp in rubric_item["key_points"]:
+            for kp in rubric_item.key_points:
                 
-                # A. FLOWCHART GRADING
-                if "flowchart" in kp.get("acceptable_modalities", []):
-                    # 1. Parse Student Graph
-                    if student_graph_data:
-                        # Convert Student JSON to Graph Structure
-                        # We use the first flowchart found in the student's answer
-                        node_intents, adj = build_graph(student_graph_data[0])
-                        
-                        # 2. Get Teacher's Extracted Rules
-                        rules = kp.get("evaluation_rules", [])
-                        
-                        if not rules:
-                            # Fallback if no rules exist (e.g. manual entry without image)
-                            score = kp["marks"]
-                            reason = "Flowchart present (Generic Check)"
-                        else:
-                            # 3. CHECKLIST EVALUATION
-                            # Iterate through every rule (node_check, connection_check) from the teacher's image
-                            rule_score_accumulated = 0
-                            feedback_items = []
-                            
-                            for rule in rules:
-                                rule_type = rule.get("type")
-                                
-                                if rule_type == "node_check":
-                                    s, r = score_node_check(rule, node_intents)
-                                    rule_score_accumulated += s
-                                    if s == 0: feedback_items.append(r)
-                                        
-                                elif rule_type == "connection_check":
-                                    s, r = score_connection_check(rule, node_intents, adj)
-                                    rule_score_accumulated += s
-                                    if s == 0: feedback_items.append(r)
-
-                            score = rule_score_accumulated
-                            
-                            if not feedback_items:
-                                reason = "✅ All logic checks passed."
-                            else:
-                                reason = "⚠️ Issues: " + "; ".join(feedback_items)
+                with trace_key_point() as trace:
+                    # Identical evidence for this key point was already graded for another student
+                    key = (q_id, evidence_key(kp, ans))
+                    cached = compiled.results.get(key)
+
+                    if cached is not None:
+                        score, reason, source = cached
+                        provenance = f"reused:{source}"
+                        count("dedup_hits")
 
+                    # A. FLOWCHART GRADING
+                    elif kp.is_flowchart:
+                        score, reason = grade_flowchart_key_point(kp, student_graph_data)
+                        provenance = "graded"
+                        compiled.results.put(key, score, reason, student_id)
+
+                    # B. TEXT / EQUATION GRADING
                     else:
-                        score = 0
-                        reason = "No flowchart found in student answer."
-                    
-                    total_score += score
-                    breakdown.append({
-                        "key_id": kp["id"],
-                        "criteria": kp["concept"],
-                        "awarded_marks": score,
-                        "max_marks": kp["marks"],
-                        "reason": reason
-                    })
-
-                # B. TEXT / EQUATION GRADING
-                else:
-                    # Use the text pipeline for this specific key point
-                    res = evaluate_key_point_llm(ans, kp)
-                    total_score += res["awarded_marks"]
-                    breakdown.append({
-                        "key_id": kp["id"],
-                        "criteria": kp["concept"],
-                        "awarded_marks": res["awarded_marks"],
-                        "max_marks": kp["marks"],
-                        "reason": res.get("reason", "")
-                    })
+                        # Use the text pipeline for this specific key point
+                        res = evaluate_key_point_llm(ans, kp.raw, kp)
+                        score, reason = res["awarded_marks"], res.get("reason", "")
+                        provenance = "graded"
+                        if not res.get("llm_error"):
+                            compiled.results.put(key, score, reason, student_id)
+
+                total_score += score
+                breakdown.append({
+                    "key_id": kp.id,
+                    "criteria": kp.concept,
+                    "awarded_marks": score,
+                    "max_marks": kp.marks,
+                    "reason": reason,
+                    "provenance": provenance,
+                    "perf": trace.to_dict()
+                })
 
             graded_results.append({
                 "question_id": q_id,
                 "score": round(total_score, 2),
-                "max_score": rubric_item["max_marks"],
+                "max_score": rubric_item.max_marks,
                 "breakdown": breakdown
             })
         
-    return graded_results
\ No newline at end of file
+    return graded_results
+
+def bulk_grade_test(test_id):
+    """
+    Grades every pending submission of a test and saves its partition once.
+    Returns the number of papers graded.
+    """
+    active_test = next((t for t in load_db()["tests"] if t["test_id"] == test_id), None)
+    if not active_test: return 0
+
+    subs = thaw(get_submissions_for_test(test_id))
+    graded = 0
+    for sub in subs:
+        if not sub.get("graded_result") and "pending_upload" not in sub:    # still being extracted
+            try:
+                sub["graded_result"] = auto_grade_submission(sub.get("answers", []), active_test, sub.get("student_id"))
+                graded += 1
+            except Exception as e:
+                print(f"Error grading {sub['student_id']}: {e}")
+
+    save_submissions_for_test(test_id, subs)
+    return graded
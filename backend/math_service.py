@@ -0,0 +1,318 @@
+# ==========================================================
+# MATH EVALUATION SERVICE
+# Sandboxed, time-limited SymPy parsing/simplification for
+# student-provided expressions, with LRU caches so the teacher's
+# expected expression is only parsed once per grading run.
+#
+# Heavy work runs in a small process pool (spawned, so no Streamlit
+# or torch state is forked). A worker that exceeds its deadline is
+# killed and the pool is rebuilt, so one pathological answer can
+# never hang a grading run.
+# ==========================================================
+
+import multiprocessing
+import os
+import re
+import threading
+from functools import lru_cache
+
+import numpy as np
+from sympy import Pow, cancel, lambdify, simplify
+from sympy.parsing.sympy_parser import convert_xor, parse_expr, standard_transformations
+
+from backend.tracing import count
+
+MATH_TIMEOUT = float(os.environ.get("GRADER_MATH_TIMEOUT", 2.0))   # seconds per expression
+MATH_WORKERS = int(os.environ.get("GRADER_MATH_WORKERS", 2))       # 0 = evaluate in-process
+MAX_EXPR_LEN = 500
+CACHE_SIZE = 4096
+
+# Numeric probe: sample points per sign region, tolerances, minimum usable points.
+# Points outside the tolerance prove inequivalence; agreement within it proves nothing.
+PROBE_POINTS = 32
+PROBE_RTOL = 1e-7
+PROBE_ATOL = 1e-9
+PROBE_MIN_VALID = 8
+# Exact in-process check: skipped for powers that expand() would blow up
+EXACT_MAX_EXPONENT = 32
+
+# ==========================================================
+# INPUT SANITISATION
+# ==========================================================
+
+# Maths, LaTeX and chemistry notation only: no quotes (so no string literals),
+# semicolons, backticks or '@'
+_ALLOWED = re.compile(r"^[\w\s+\-*/^().,=<>!\\{}\[\]|:%]*$")
+_FORBIDDEN = re.compile(
+    r"__|\.\s*[A-Za-z_]|"   # dunders and attribute access (decimals like 1.5 are fine)
+    r"\b(import|lambda|exec|eval|open|compile|globals|locals|getattr|setattr|delattr|"
+    r"vars|dir|input|breakpoint|os|sys|subprocess|builtins)\b"
+)
+
+def is_safe_expression(expr):
+    expr = str(expr)
+    return len(expr) <= MAX_EXPR_LEN and bool(_ALLOWED.match(expr)) and not _FORBIDDEN.search(expr)
+
+# The only names an expression can reach. Everything else becomes a Symbol (or an
+# undefined Function when called), so helpers that re-evaluate strings with real
+# builtins (sympify, parse_expr, ...) are never in scope.
+_NAMESPACE = (
+    # used by parse_expr's own transformations
+    "Symbol", "Function", "Integer", "Float", "Rational", "factorial",
+    # constants
+    "pi", "E", "I", "oo",
+    # elementary functions
+    "sqrt", "root", "exp", "log", "ln", "Abs", "sign", "floor", "ceiling",
+    "sin", "cos", "tan", "cot", "sec", "csc", "asin", "acos", "atan", "acot", "atan2",
+    "sinh", "cosh", "tanh", "coth", "asinh", "acosh", "atanh",
+)
+
+def _safe_globals():
+    """Allow-listed SymPy names without Python builtins, used as parse_expr's global_dict."""
+    import sympy
+    namespace = {name: getattr(sympy, name) for name in _NAMESPACE}
+    namespace["__builtins__"] = {}
+    return namespace
+
+_GLOBALS = None
+
+def _parse(expr):
+    """Same grammar as `sympify` (incl. ^ → **), evaluated against a builtin-free namespace."""
+    global _GLOBALS
+    if _GLOBALS is None:
+        _GLOBALS = _safe_globals()
+    return parse_expr(expr, global_dict=dict(_GLOBALS),
+                      transformations=standard_transformations + (convert_xor,))
+
+# ==========================================================
+# WORKER FUNCTIONS (run inside the pool)
+# ==========================================================
+
+def _w_canonical(expr):
+    """Parses (SymPy syntax, then LaTeX) and simplifies; None if unparseable."""
+    try:
+        return simplify(_parse(expr))
+    except Exception:
+        pass
+    try:
+        from latex2sympy2 import latex2sympy
+        return simplify(latex2sympy(expr))
+    except Exception:
+        return None
+
+def _w_parse_raw(expr):
+    try:
+        return _parse(expr)
+    except Exception:
+        return None
+
+def _w_is_number(expr):
+    try:
+        return bool(_parse(expr).is_number)
+    except Exception:
+        return False
+
+def _w_difference_is_zero(a, b):
+    try:
+        return simplify(a - b) == 0
+    except Exception:
+        return False
+
+# ==========================================================
+# POOL MANAGEMENT
+# ==========================================================
+
+_pool = None
+_pool_lock = threading.Lock()
+# One in-flight task per worker, so the deadline measures SymPy time, not queueing
+# behind other grading threads' expressions
+_slots = threading.BoundedSemaphore(max(1, MATH_WORKERS))
+
+def _w_ping(_=None):
+    return True
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            ctx = multiprocessing.get_context("spawn")
+            _pool = ctx.Pool(processes=MATH_WORKERS, maxtasksperchild=500)
+            # Spawned workers import SymPy first: don't charge that to the first expression
+            _pool.map(_w_ping, range(MATH_WORKERS))
+        return _pool
+
+def _reset_pool(pool):
+    """Kills a pool whose worker blew its deadline; the next call builds a fresh one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.terminate()
+
+def _run(fn, *args, default=None):
+    """Runs `fn(*args)` with the per-expression deadline; returns `default` on timeout."""
+    if MATH_WORKERS <= 0:
+        return fn(*args)
+    for attempt in range(2):
+        with _slots:
+            pool = _get_pool()
+            try:
+                return pool.apply_async(fn, args).get(timeout=MATH_TIMEOUT)
+            except multiprocessing.TimeoutError:
+                if pool is not _pool and attempt == 0:
+                    # Another thread's expression timed out and took this pool down: retry once
+                    continue
+                print(f"⏱️ SymPy timed out after {MATH_TIMEOUT}s on {str(args)[:80]!r}")
+                count("sympy_timeouts")
+                _reset_pool(pool)
+                return default
+            except Exception as e:
+                print(f"⚠️ SymPy worker error: {e}")
+                return default
+    return default
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.terminate()
+            _pool = None
+
+# ==========================================================
+# PUBLIC API (cached)
+# ==========================================================
+
+def _cached(fn):
+    """lru_cache that also reports hits to the grading trace."""
+    cached = lru_cache(maxsize=CACHE_SIZE)(fn)
+
+    def wrapper(*args):
+        hits = cached.cache_info().hits
+        result = cached(*args)
+        if cached.cache_info().hits > hits:
+            count("cache_hits")
+        return result
+
+    wrapper.cache_info = cached.cache_info
+    wrapper.cache_clear = cached.cache_clear
+    return wrapper
+
+@_cached
+def canonical(expr):
+    """Simplified SymPy form of `expr` (string), or None if unsafe, unparseable or too slow."""
+    expr = str(expr)
+    if not expr or not is_safe_expression(expr):
+        return None
+    return _run(_w_canonical, expr)
+
+@_cached
+def parse_raw(expr):
+    """Unsimplified SymPy form of `expr` (string), or None."""
+    expr = str(expr)
+    if not expr or not is_safe_expression(expr):
+        return None
+    return _run(_w_parse_raw, expr)
+
+@_cached
+def is_number(expr):
+    expr = str(expr)
+    if not expr or not is_safe_expression(expr):
+        return False
+    return _run(_w_is_number, expr, default=False)
+
+@_cached
+def difference_is_zero(a, b):
+    """True if SymPy proves a - b == 0 within the deadline (a, b are SymPy objects)."""
+    if a is None or b is None:
+        return False
+    return _run(_w_difference_is_zero, a, b, default=False)
+
+# ==========================================================
+# NUMERIC PROBING (FAST PATH)
+# ==========================================================
+
+_rng = np.random.default_rng(20240601)
+# Positive and negative samples away from 0, so log/sqrt/1/x domains are still probed
+_SAMPLES = np.concatenate([
+    _rng.uniform(0.1, 3.0, size=(PROBE_POINTS, 8)),
+    -_rng.uniform(0.1, 3.0, size=(PROBE_POINTS, 8)),
+])
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compiled(expr, symbols):
+    return lambdify(symbols, expr, modules="numpy")
+
+def _evaluate(expr, symbols):
+    values = _compiled(expr, symbols)(*[_SAMPLES[:, i] for i in range(len(symbols))])
+    return np.broadcast_to(np.asarray(values, dtype=complex), (_SAMPLES.shape[0],))
+
+def numeric_equivalent(a, b):
+    """
+    Constants are compared exactly. Otherwise both expressions are evaluated
+    on a vectorised batch of random points, which can only rule equivalence
+    out: False when they clearly differ, None when the probe is inconclusive
+    (values agree to float precision, too few points inside both domains,
+    unsupported functions, > 8 symbols) and SymPy has to decide.
+    """
+    if a is None or b is None:
+        return None
+    try:
+        diff = a - b
+        if diff.is_number:
+            zero = diff.is_zero
+            return None if zero is None else bool(zero)
+    except Exception:
+        return None
+    symbols = tuple(sorted(a.free_symbols | b.free_symbols, key=str))
+    if len(symbols) > _SAMPLES.shape[1]:
+        return None
+    try:
+        with np.errstate(all="ignore"):
+            ya, yb = _evaluate(a, symbols), _evaluate(b, symbols)
+    except Exception:
+        return None
+
+    # Mask points outside either expression's domain (nan / inf)
+    valid = np.isfinite(ya) & np.isfinite(yb)
+    if valid.sum() < PROBE_MIN_VALID:
+        return None
+
+    close = np.isclose(ya[valid], yb[valid], rtol=PROBE_RTOL, atol=PROBE_ATOL)
+    if close.all():
+        return None    # close is not equal: 123456789 vs 123456788, x + 1e-10 vs x
+    # A handful of mismatches is more likely float trouble than a real difference
+    if (~close).mean() < 0.05:
+        return None
+    return False
+
+def exact_zero(a, b):
+    """
+    True when a - b cancels to 0 as a rational function (expand + cancel,
+    in-process: no pool round trip). None when that cannot decide, e.g.
+    trig / log identities, or exponents too large to expand cheaply.
+    """
+    try:
+        diff = a - b
+        if any(p.exp.is_Integer and abs(p.exp) > EXACT_MAX_EXPONENT for p in diff.atoms(Pow)):
+            return None
+        return True if cancel(diff.expand()) == 0 else None
+    except Exception:
+        return None
+
+def equivalent(a, b):
+    """
+    Numeric probe first (it only proves inequivalence), then an exact
+    in-process cancel (proves the common correct answers); the pooled
+    symbolic simplify only for what neither decides.
+    """
+    if a is None or b is None:
+        return False
+    verdict = numeric_equivalent(a, b)
+    if verdict is not None:
+        count("numeric_probes")
+        return verdict
+    if exact_zero(a, b):
+        count("exact_checks")
+        return True
+    count("symbolic_fallbacks")
+    return difference_is_zero(a, b)
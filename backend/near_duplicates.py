@@ -0,0 +1,278 @@
+# ==========================================================
+# NEAR-DUPLICATE ANSWER INDEX (MinHash + LSH)
+# Each student's text answer to a question is shingled (word
+# 3-grams), MinHash-signed, and banded into LSH buckets, so
+# near-identical answers are found without comparing every pair.
+#
+#   index_submission(submission)   called by submit_student_answers
+#   remove_submission(sid, tid)    called by delete_submission
+#   find_clusters(test_id, subs)   {question_id: [cluster, ...]}
+#
+# Signatures are appended to a JSONL log next to the DB file (last
+# line per student/question wins; "sig": null is a tombstone for a
+# deleted or emptied answer) and buckets are rebuilt on load. Each
+# signature keeps a digest of its answer text, so an answer changed
+# behind the index's back is re-signed instead of trusted.
+# ==========================================================
+
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import zlib
+from collections import defaultdict
+
+import numpy as np
+
+from backend import db_handler
+
+NUM_PERM = 128
+BANDS = 32                       # 32 bands x 4 rows: a 0.7-Jaccard pair collides with p > 0.999
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+THRESHOLD = float(os.environ.get("GRADER_NEAR_DUP_THRESHOLD", 0.7))   # estimated Jaccard to report
+
+_PRIME = np.uint64(4294967311)   # smallest prime above 2**32
+_rng = np.random.default_rng(1729)
+_A = _rng.integers(1, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 2 ** 32, size=NUM_PERM, dtype=np.uint64)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# ==========================================================
+# SIGNATURES
+# ==========================================================
+
+def shingles(text):
+    tokens = _TOKEN.findall(str(text).lower())
+    if len(tokens) < SHINGLE_SIZE:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def minhash(text):
+    """NUM_PERM-long uint64 signature, or None for an empty answer."""
+    sh = shingles(text)
+    if not sh:
+        return None
+    x = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in sh), dtype=np.uint64, count=len(sh))
+    # (a*x + b) mod p for every permutation x shingle at once; a, x < 2**32 so no uint64 overflow
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return float(np.mean(sig_a == sig_b))
+
+def answer_text(answer_obj):
+    return " ".join(str(t) for t in answer_obj.get("text", []) or [])
+
+def digest(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+# ==========================================================
+# INDEX
+# ==========================================================
+
+class _QuestionIndex:
+    """LSH buckets for one (test, question)."""
+
+    def __init__(self):
+        self.signatures = {}
+        self.digests = {}            # student_id -> digest of the signed answer text
+        self.buckets = [defaultdict(set) for _ in range(BANDS)]
+
+    def _bands(self, sig):
+        return [sig[b * ROWS:(b + 1) * ROWS].tobytes() for b in range(BANDS)]
+
+    def add(self, student_id, sig, text_digest=None):
+        old = self.signatures.get(student_id)
+        if old is not None:
+            for b, key in enumerate(self._bands(old)):
+                self.buckets[b][key].discard(student_id)
+        self.signatures[student_id] = sig
+        self.digests[student_id] = text_digest
+        for b, key in enumerate(self._bands(sig)):
+            self.buckets[b][key].add(student_id)
+
+    def remove(self, student_id):
+        old = self.signatures.pop(student_id, None)
+        self.digests.pop(student_id, None)
+        if old is not None:
+            for b, key in enumerate(self._bands(old)):
+                self.buckets[b][key].discard(student_id)
+        return old is not None
+
+    def clusters(self, threshold=THRESHOLD):
+        parent = {}
+
+        def find(s):
+            while parent.get(s, s) != s:
+                parent[s] = parent.get(parent[s], parent[s])
+                s = parent[s]
+            return s
+
+        def union(a, b):
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[rb] = ra
+
+        # Identical signatures are one representative (similarity 1.0)
+        by_sig, edges = {}, []
+        for sid, sig in self.signatures.items():
+            rep = by_sig.setdefault(sig.tobytes(), sid)
+            if rep != sid:
+                union(rep, sid)
+                edges.append((rep, 1.0))
+        reps = set(by_sig.values())
+
+        # Verify bucket candidates, skipping pairs already in the same cluster
+        for band in self.buckets:
+            for members in band.values():
+                members = sorted(m for m in members if m in reps)
+                if len(members) < 2:
+                    continue
+                roots = np.array([find(m) for m in members], dtype=object)
+                if (roots == roots[0]).all():
+                    continue
+                S = np.stack([self.signatures[m] for m in members])
+                for i in range(len(members) - 1):
+                    roots[i + 1:] = [find(m) for m in members[i + 1:]]
+                    todo = np.flatnonzero(roots[i + 1:] != find(members[i])) + i + 1
+                    if not len(todo):
+                        continue
+                    sims = (S[todo] == S[i]).mean(axis=1)
+                    for j, sim in zip(todo[sims >= threshold], sims[sims >= threshold]):
+                        if find(members[i]) != find(members[j]):
+                            union(members[i], members[j])
+                            edges.append((members[i], float(sim)))
+
+        groups, sims = defaultdict(list), defaultdict(list)
+        for sid in self.signatures:
+            groups[find(sid)].append(sid)
+        for sid, sim in edges:
+            sims[find(sid)].append(sim)
+        result = [
+            {
+                "students": sorted(members),
+                "size": len(members),
+                # over the pairs that linked the cluster together
+                "min_similarity": round(min(sims[root]), 3),
+                "mean_similarity": round(sum(sims[root]) / len(sims[root]), 3),
+            }
+            for root, members in groups.items() if len(members) > 1
+        ]
+        return sorted(result, key=lambda c: (-c["size"], -c["mean_similarity"]))
+
+_indexes = {}                    # (test_id, question_id) -> _QuestionIndex
+_loaded_from = None
+_lock = threading.Lock()
+
+def index_path():
+    """JSONL signature log next to the DB file (follows db_handler.DB_FILE)."""
+    return os.path.splitext(db_handler.DB_FILE)[0] + ".near_dup.jsonl"
+
+def _encode(sig):
+    return base64.b64encode(sig.astype("<u8").tobytes()).decode("ascii")
+
+def _decode(raw):
+    return np.frombuffer(base64.b64decode(raw), dtype="<u8").astype(np.uint64)
+
+def _ensure_loaded():
+    """(Re)builds the in-memory index from the log when the DB file path changed."""
+    global _indexes, _loaded_from
+    path = index_path()
+    if _loaded_from == path:
+        return
+    _indexes = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    index = _indexes.setdefault((rec["test_id"], rec["question_id"]), _QuestionIndex())
+                    if rec["sig"] is None:
+                        index.remove(rec["student_id"])
+                    else:
+                        index.add(rec["student_id"], _decode(rec["sig"]), rec.get("digest"))
+                except (ValueError, KeyError):
+                    continue   # torn last line after a crash
+    _loaded_from = path
+
+def _record(test_id, qid, student_id, sig, text_digest=None):
+    rec = {"test_id": test_id, "question_id": qid, "student_id": student_id,
+           "sig": None if sig is None else _encode(sig)}
+    if text_digest is not None:
+        rec["digest"] = text_digest
+    return json.dumps(rec)
+
+def _remove(test_id, student_id, log, keep=()):
+    """Drops the student's signatures for this test, except for questions in `keep`."""
+    for (tid, qid), index in _indexes.items():
+        if tid == test_id and qid not in keep and index.remove(student_id):
+            log.append(_record(test_id, qid, student_id, None))
+
+def _add(test_id, student_id, answers, log):
+    # Questions the student no longer answers (removed / emptied) leave the index
+    answered = {ans.get("question_id") for ans in answers or [] if shingles(answer_text(ans))}
+    _remove(test_id, student_id, log, keep=answered)
+    for ans in answers or []:
+        qid = ans.get("question_id")
+        if qid not in answered:
+            continue
+        index = _indexes.setdefault((test_id, qid), _QuestionIndex())
+        text = answer_text(ans)
+        text_digest = digest(text)
+        if student_id in index.signatures and index.digests.get(student_id) == text_digest:
+            continue    # signed from this very text
+        sig = minhash(text)
+        index.add(student_id, sig, text_digest)
+        log.append(_record(test_id, qid, student_id, sig, text_digest))
+
+def _append_log(lines):
+    if lines:
+        with open(index_path(), "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+def index_submission(submission):
+    """Adds (or replaces) one submission's answers in the index and appends them to the log."""
+    with _lock:
+        _ensure_loaded()
+        log = []
+        _add(submission.get("test_id"), submission.get("student_id"), submission.get("answers"), log)
+        _append_log(log)
+
+def remove_submission(student_id, test_id):
+    """Drops a deleted submission's answers from the index (tombstoned in the log)."""
+    with _lock:
+        _ensure_loaded()
+        log = []
+        _remove(test_id, student_id, log)
+        _append_log(log)
+
+def find_clusters(test_id, submissions=None):
+    """
+    Near-duplicate clusters per question for `test_id`. When `submissions`
+    is given, answers not in the index yet (e.g. stored before it existed)
+    or changed since they were signed (e.g. saved with upsert_submission)
+    are indexed first, and students no longer in it are dropped.
+    """
+    with _lock:
+        _ensure_loaded()
+        log = []
+        if submissions is not None:
+            current = set()
+            for sub in submissions:
+                if sub.get("test_id") == test_id:
+                    current.add(sub.get("student_id"))
+                    _add(test_id, sub.get("student_id"), sub.get("answers"), log)
+            stale = {sid for (tid, _), index in _indexes.items() if tid == test_id
+                     for sid in index.signatures if sid not in current}
+            for sid in stale:
+                _remove(test_id, sid, log)
+        _append_log(log)
+        return {
+            qid: clusters
+            for (tid, qid), index in sorted(_indexes.items(), key=lambda kv: str(kv[0][1]))
+            if tid == test_id and (clusters := index.clusters())
+        }
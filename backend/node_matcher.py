@@ -0,0 +1,209 @@
+# ==========================================================
+# FLOWCHART NODE MATCHING
+# Scores every rule text (expected_text / from_text / to_text)
+# against every student node text in one vectorised pass, and
+# provides the optimal assignment used to seed graph matching.
+#
+#   similarity = token-set similarity (NumPy, so scores never depend
+#                on which optional packages are installed),
+#                optionally max'ed with embedding cosine
+#   a rule text is satisfied by a node when both share a known
+#   intent (anything but UNKNOWN) or when the similarity clears
+#   MATCH_THRESHOLD; similarity ranks candidates and breaks ties.
+#   Coarse intents (ASSIGNMENT / CONDITION / PROCESS) also need
+#   COARSE_MIN_SIMILARITY over words, numbers and operators, so
+#   "total = 0" still matches "sum = 0" but not "avg = a / n"
+# ==========================================================
+
+import os
+import re
+
+import numpy as np
+
+from backend.embedding_cache import encode_cached
+from backend.flowchart_pipeline import get_intent_classifier
+
+MATCH_THRESHOLD = float(os.environ.get("GRADER_NODE_MATCH_THRESHOLD", 0.6))
+USE_NODE_EMBEDDINGS = os.environ.get("GRADER_NODE_EMBEDDINGS", "0") == "1"
+COARSE_MIN_SIMILARITY = float(os.environ.get("GRADER_NODE_COARSE_MIN_SIMILARITY", 0.4))
+
+# Intents too broad to identify a node on their own
+COARSE_INTENTS = {"ASSIGNMENT", "CONDITION", "PROCESS"}
+
+# ==========================================================
+# SIMILARITY MATRICES
+# ==========================================================
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STATEMENT_TOKEN = re.compile(r"[a-z0-9]+|[=<>!+\-*/%^?]+")   # operators count too
+
+def _token_matrix_numpy(queries, choices, token=_TOKEN):
+    """Mean of overlap coefficient and Dice over token sets, as one matrix product."""
+    q_tokens = [set(token.findall(str(t).lower())) for t in queries]
+    c_tokens = [set(token.findall(str(t).lower())) for t in choices]
+    vocab = {tok: i for i, tok in enumerate(set().union(*q_tokens, *c_tokens))}
+    if not vocab:
+        return np.zeros((len(queries), len(choices)))
+
+    Q = np.zeros((len(queries), len(vocab)))
+    C = np.zeros((len(choices), len(vocab)))
+    for i, toks in enumerate(q_tokens):
+        Q[i, [vocab[t] for t in toks]] = 1.0
+    for j, toks in enumerate(c_tokens):
+        C[j, [vocab[t] for t in toks]] = 1.0
+
+    inter = Q @ C.T
+    q_len, c_len = Q.sum(1)[:, None], C.sum(1)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        overlap = np.nan_to_num(inter / np.minimum(q_len, c_len))
+        dice = np.nan_to_num(2 * inter / (q_len + c_len))
+    return (overlap + dice) / 2
+
+def token_similarity_matrix(queries, choices):
+    """len(queries) x len(choices) similarity in [0, 1]."""
+    if not queries or not choices:
+        return np.zeros((len(queries), len(choices)))
+    return _token_matrix_numpy(queries, choices)
+
+def _normalized_embeddings(embedder, texts):
+    vecs = encode_cached(embedder, list(texts))
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+# ==========================================================
+# OPTIMAL ASSIGNMENT
+# ==========================================================
+
+def _hungarian(cost):
+    """Min-cost assignment for a square matrix (O(n^3)); returns col index per row."""
+    n = cost.shape[0]
+    u, v = np.zeros(n + 1), np.zeros(n + 1)
+    p, way = np.zeros(n + 1, dtype=int), np.zeros(n + 1, dtype=int)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(n + 1, np.inf)
+        used = np.zeros(n + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            free = ~used[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while True:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+            if j0 == 0:
+                break
+    assignment = np.full(n, -1)
+    for j in range(1, n + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+def optimal_assignment(score):
+    """Maximum-score one-to-one matching of rows to columns; returns {row: col}."""
+    rows, cols = score.shape
+    if rows == 0 or cols == 0:
+        return {}
+    n = max(rows, cols)
+    padded = np.zeros((n, n))
+    padded[:rows, :cols] = score
+    assignment = _hungarian(padded.max() - padded)
+    return {r: int(assignment[r]) for r in range(rows) if assignment[r] < cols}
+
+# ==========================================================
+# MATCHER (one per compiled flowchart key point)
+# ==========================================================
+
+class NodeMatcher:
+    """
+    Built once per flowchart key point from its CompiledRules.
+
+    Rule texts become matching variables: one per node_check rule (these must
+    land on distinct nodes) and one per connection endpoint text that no
+    node_check rule already names (these may share nodes). `rule_vars[i]`
+    lists the variables rule i depends on. backend.graph_matcher searches the
+    variable -> node mapping.
+    """
+
+    def __init__(self, rules, subject=None):
+        self.rules = rules
+        self.classify = get_intent_classifier(subject)
+
+        # Every distinct rule text, with its intent, scored in one pass per graph
+        self.texts, self.intents, index = [], [], {}
+        for rule in rules:
+            for field, intent in (("expected_text", rule.expected_intent),
+                                  ("from_text", rule.from_intent), ("to_text", rule.to_intent)):
+                text = rule.raw.get(field)
+                if text is not None and text not in index:
+                    index[text] = len(self.texts)
+                    self.texts.append(text)
+                    self.intents.append(intent)
+        self.index = index
+
+        self.var_rows, self.var_injective = [], []
+        self.rule_vars = [()] * len(rules)
+
+        def new_var(text, injective):
+            self.var_rows.append(index[text])
+            self.var_injective.append(injective)
+            return len(self.var_rows) - 1
+
+        named = {}
+        for i, rule in enumerate(rules):
+            if rule.type == "node_check":
+                v = new_var(rule.raw["expected_text"], True)
+                named.setdefault(rule.raw["expected_text"], v)
+                self.rule_vars[i] = (v,)
+        for i, rule in enumerate(rules):
+            if rule.type == "connection_check":
+                ends = []
+                for text in (rule.raw["from_text"], rule.raw["to_text"]):
+                    if text not in named:
+                        named[text] = new_var(text, False)
+                    ends.append(named[text])
+                self.rule_vars[i] = tuple(ends)
+
+        self._text_embeddings = None
+
+    def _similarity(self, node_texts, embedder):
+        sim = token_similarity_matrix(self.texts, node_texts)
+        if embedder is not None and self.texts and node_texts:
+            if self._text_embeddings is None:
+                self._text_embeddings = _normalized_embeddings(embedder, self.texts)
+            node_emb = _normalized_embeddings(embedder, node_texts)
+            sim = np.maximum(sim, np.clip(self._text_embeddings @ node_emb.T, 0.0, 1.0))
+        return sim
+
+    def acceptance(self, node_texts, node_intents, embedder=None):
+        """(similarity, accepted) matrices of rule texts x nodes."""
+        if not self.texts or not node_texts:
+            empty = np.zeros((len(self.texts), len(node_texts)))
+            return empty, empty.astype(bool)
+        sim = self._similarity(node_texts, embedder)
+        rule_int = np.array(self.intents, dtype=object)[:, None]
+        node_int = np.array(node_intents, dtype=object)[None, :]
+        # Same intent counts whatever the wording; coarse intents also need the
+        # statements to resemble each other; UNKNOWN texts have to clear the threshold
+        intent_match = (rule_int == node_int) & (rule_int != "UNKNOWN")
+        coarse = np.array([i in COARSE_INTENTS for i in self.intents])
+        if coarse.any():
+            statement_sim = _token_matrix_numpy(self.texts, node_texts, _STATEMENT_TOKEN)
+            intent_match &= ~coarse[:, None] | (statement_sim >= COARSE_MIN_SIMILARITY)
+        accepted = intent_match | (sim >= MATCH_THRESHOLD)
+        return sim, accepted
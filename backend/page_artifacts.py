@@ -0,0 +1,101 @@
+# ==========================================================
+# PAGE ARTIFACTS
+# An uploaded script is rendered once per question crop and kept
+# as encoded image bytes (+ size and hash). Extraction (vision LLM),
+# the preview pane and the upload on submit all read the same
+# artifact, so reruns never re-render or re-encode a page.
+# One PageArtifactCache per uploaded file, kept in the session.
+# ==========================================================
+
+import hashlib
+import io
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+RENDER_DPI = 200
+
+class PageArtifact:
+    __slots__ = ("data", "mime", "width", "height", "sha1")
+
+    def __init__(self, data, mime, width, height):
+        self.data = data
+        self.mime = mime
+        self.width = width
+        self.height = height
+        self.sha1 = hashlib.sha1(data).hexdigest()
+
+    @classmethod
+    def from_image(cls, image):
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        return cls(buffer.getvalue(), "image/png", image.width, image.height)
+
+    @classmethod
+    def from_upload(cls, data, mime):
+        """An uploaded PNG/JPEG is already encoded: keep its bytes, read only the header for the size."""
+        width, height = Image.open(io.BytesIO(data)).size
+        return cls(data, mime, width, height)
+
+    def image(self):
+        return Image.open(io.BytesIO(self.data))
+
+    def __len__(self):
+        return len(self.data)
+
+def _pixmap_image(pix):
+    # Raw samples, no PNG round trip
+    mode = "RGBA" if pix.alpha else "RGB"
+    return Image.frombytes(mode, (pix.width, pix.height), pix.samples)
+
+class PageArtifactCache:
+    """Rendered question crops of one uploaded file."""
+
+    def __init__(self, file_bytes, file_type="application/pdf"):
+        self.file_sha1 = hashlib.sha1(file_bytes).hexdigest()
+        self.file_type = file_type
+        self._bytes = file_bytes
+        self._doc = None
+        self._regions = {}     # question_id -> [(page_no, clip)]
+        self._artifacts = {}   # question_id -> PageArtifact
+        self.uploads = {}      # artifact sha1 -> stored URL
+        self.renders = 0
+
+    @property
+    def doc(self):
+        if self._doc is None:
+            self._doc = fitz.open(stream=self._bytes, filetype="pdf")
+        return self._doc
+
+    def register(self, question_id, regions):
+        """Where a question is on the pages; rendered on first use."""
+        self._regions[question_id] = list(regions)
+
+    def put(self, question_id, artifact):
+        self._artifacts[question_id] = artifact
+
+    def get(self, question_id):
+        """The question's artifact, rendering its crops (stacked) the first time."""
+        artifact = self._artifacts.get(question_id)
+        if artifact is None and question_id in self._regions:
+            images = []
+            for pno, clip in self._regions[question_id]:
+                images.append(_pixmap_image(self.doc[pno].get_pixmap(dpi=RENDER_DPI, clip=clip)))
+                self.renders += 1
+            artifact = PageArtifact.from_image(_stack(images))
+            self._artifacts[question_id] = artifact
+        return artifact
+
+    def __contains__(self, question_id):
+        return question_id in self._artifacts or question_id in self._regions
+
+def _stack(images):
+    """Crops of one question → one image (a single vision call, a single upload)."""
+    if len(images) == 1:
+        return images[0]
+    out = Image.new("RGB", (max(i.width for i in images), sum(i.height for i in images)), "white")
+    y = 0
+    for img in images:
+        out.paste(img, (0, y))
+        y += img.height
+    return out
@@ -0,0 +1,36 @@
+# ==========================================================
+# ANSWER SEGMENTATION
+# Splits a student's text answer into sentences, and sentences
+# that are still too long into overlapping word windows, so
+# evidence can be retrieved per segment instead of truncating
+# the whole answer at the NLI model's 512-token limit.
+# ==========================================================
+
+import os
+import re
+
+MAX_WORDS = int(os.environ.get("GRADER_SEGMENT_MAX_WORDS", 60))   # longer sentences are windowed
+WINDOW_STRIDE = max(1, MAX_WORDS // 2)                           # MAX_WORDS=1 must still advance
+TOP_K = int(os.environ.get("GRADER_NLI_TOP_K", 3))               # segments sent to NLI per concept
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\n+")
+
+def _windows(words):
+    if len(words) <= MAX_WORDS:
+        return [" ".join(words)]
+    starts = range(0, len(words) - MAX_WORDS + WINDOW_STRIDE, WINDOW_STRIDE)
+    return [" ".join(words[s:s + MAX_WORDS]) for s in starts]
+
+def split_segments(student_texts):
+    """Ordered, de-duplicated segments of every text item in the answer."""
+    segments, seen = [], set()
+    for text in student_texts or []:
+        for sentence in _SENTENCE_END.split(str(text)):
+            words = sentence.split()
+            if not words:
+                continue
+            for seg in _windows(words):
+                if seg not in seen:
+                    seen.add(seg)
+                    segments.append(seg)
+    return segments
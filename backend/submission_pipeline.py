@@ -0,0 +1,346 @@
+# ==========================================================
+# SUBMISSION PIPELINE
+# A confirmed submission is saved to the DB before the student sees
+# "submitted" (an unreviewed upload is kept on disk next to it, under
+# <DB_FILE stem>.uploads/), then handed off:
+#
+#   extract  (vision LLM / PDF text layer, skipped if the student
+#             already reviewed the extraction)
+#     → store  (page images to blob storage, answers on the submission)
+#     → grade  (provisional auto-grade, saved on the submission)
+#
+# Uploads still waiting for extraction when the process stopped are
+# queued again when the pipeline starts (resume_pending). A job that
+# fails is recorded on its submission (pipeline_error; status
+# "Extraction Failed" if nothing could be read) for the teacher.
+#
+# Stages run as asyncio workers on one background event loop,
+# connected by bounded queues: a slow stage fills its queue and
+# holds back the stage before it instead of piling up work. The
+# blocking calls (LLM, upload, grading) run in a thread pool.
+#
+# Teachers then review papers that are already graded
+# (sub["auto_graded"] = True until a teacher updates a score).
+#
+#   GRADER_PIPELINE_QUEUE=16            jobs waiting per stage
+#   GRADER_PIPELINE_EXTRACT_WORKERS=4
+#   GRADER_PIPELINE_STORE_WORKERS=4
+#   GRADER_PIPELINE_GRADE_WORKERS=2
+# ==========================================================
+
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import db_handler
+from backend.page_artifacts import PageArtifact, PageArtifactCache
+
+QUEUE_SIZE = int(os.environ.get("GRADER_PIPELINE_QUEUE", 16))
+EXTRACT_WORKERS = int(os.environ.get("GRADER_PIPELINE_EXTRACT_WORKERS", 4))
+STORE_WORKERS = int(os.environ.get("GRADER_PIPELINE_STORE_WORKERS", 4))
+GRADE_WORKERS = int(os.environ.get("GRADER_PIPELINE_GRADE_WORKERS", 2))
+MAX_TRACKED_JOBS = 1000
+
+# Read-modify-write of the JSON DB from several stage workers
+_db_lock = threading.Lock()
+
+class SubmissionJob:
+    """One confirmed submission moving through the pipeline."""
+
+    def __init__(self, student_id, test_id, student_name=None, answers=None,
+                 file_bytes=None, file_type="application/pdf", question_id="Q1", artifacts=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.student_id = student_id
+        self.student_name = student_name or student_id
+        self.test_id = test_id
+        self.answers = answers           # None = not extracted yet
+        self.file_bytes = file_bytes
+        self.file_type = file_type
+        self.question_id = question_id   # single-image uploads
+        self.artifacts = artifacts
+        self.status = "queued"
+        self.error = None
+        self.timings = {}
+        self.created = time.time()
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id, "student_id": self.student_id, "test_id": self.test_id,
+            "status": self.status, "error": self.error,
+            "timings": {k: round(v, 3) for k, v in self.timings.items()},
+        }
+
+# ==========================================================
+# STAGES (blocking; run in the pipeline's thread pool)
+# ==========================================================
+
+def extract_stage(job):
+    if job.answers is not None:
+        return    # extracted (and reviewed) on the Student page
+    if job.artifacts is None:
+        job.artifacts = PageArtifactCache(job.file_bytes, job.file_type)
+
+    from backend.answer_extractor import extract_answer_obj, extract_pdf_answers
+    if job.file_type == "application/pdf":
+        answers, _ = extract_pdf_answers(job.file_bytes, artifacts=job.artifacts)
+    else:
+        artifact = PageArtifact.from_upload(job.file_bytes, job.file_type)
+        job.artifacts.put(job.question_id, artifact)
+        answers = [extract_answer_obj(artifact, job.question_id)]
+
+    if answers and all("error" in a for a in answers):
+        raise RuntimeError(answers[0]["error"])
+    job.answers = answers
+
+def store_stage(job):
+    from backend.blob_store import upload_image
+    if job.artifacts is None:
+        return    # no page images kept: nothing to upload, the answers were saved on confirm
+    artifacts = job.artifacts
+    for ans in job.answers:
+        qid = ans.get("question_id")
+        if ans.get("source_image") or artifacts is None or qid not in artifacts:
+            continue
+        artifact = artifacts.get(qid)
+        url = artifacts.uploads.get(artifact.sha1)
+        if not url:
+            url = upload_image(artifact.data)
+            if url:
+                artifacts.uploads[artifact.sha1] = url
+        if url:
+            ans["source_image"] = url
+
+    with _db_lock:
+        sub = db_handler.get_submission(job.student_id, job.test_id)
+        # Not if the student resubmitted meanwhile
+        if sub is not None and sub.get("pipeline_job") == job.job_id:
+            sub = db_handler.thaw(sub)
+            extracted = "pending_upload" in sub
+            sub.pop("pending_upload", None)
+            sub["answers"] = job.answers
+            sub["status"] = "Submitted"
+            if extracted:
+                db_handler.submit_student_answers(sub)    # indexes the new answers too
+            else:
+                db_handler.upsert_submission(sub)
+    _remove_upload(job.job_id)
+    job.file_bytes = None    # stored; the raw upload is no longer needed
+
+def grade_stage(job):
+    from backend.master_grader import auto_grade_submission
+    db = db_handler.load_db()
+    test = next((t for t in db.get("tests", []) if t.get("test_id") == job.test_id), None)
+    if test is None:
+        return    # no rubric yet: left for the teacher's grade button
+    results = auto_grade_submission(job.answers, test, job.student_id)
+
+    with _db_lock:
+        sub = db_handler.get_submission(job.student_id, job.test_id)
+        # Not if the student resubmitted meanwhile or a teacher already graded it
+        if sub is not None and sub.get("pipeline_job") == job.job_id and sub.get("graded_result") is None:
+            sub = db_handler.thaw(sub)
+            sub["graded_result"] = results
+            sub["auto_graded"] = True
+            sub["status"] = "Auto-Graded"
+            db_handler.upsert_submission(sub)
+
+def record_failure(job, stage):
+    """Saves a failed job's error on its submission, so it is not left 'Processing'."""
+    with _db_lock:
+        sub = db_handler.get_submission(job.student_id, job.test_id)
+        if sub is None or sub.get("pipeline_job") != job.job_id:
+            return
+        sub = db_handler.thaw(sub)
+        sub["pipeline_error"] = job.error
+        if stage == "extracting":
+            sub.pop("pending_upload", None)    # not queued again on restart
+            sub["status"] = "Extraction Failed"
+        db_handler.upsert_submission(sub)
+    if stage == "extracting":
+        _remove_upload(job.job_id)
+
+STAGES = [
+    ("extracting", extract_stage, EXTRACT_WORKERS),
+    ("storing", store_stage, STORE_WORKERS),
+    ("grading", grade_stage, GRADE_WORKERS),
+]
+
+# ==========================================================
+# PIPELINE (asyncio loop on a daemon thread)
+# ==========================================================
+
+class SubmissionPipeline:
+    def __init__(self, stages=STAGES, queue_size=QUEUE_SIZE, on_failure=record_failure):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.on_failure = on_failure    # (job, stage name), in the thread pool
+        self.jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=sum(n for _, _, n in stages),
+                                            thread_name_prefix="pipeline")
+        self._loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="submission-pipeline", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._main())
+
+    async def _main(self):
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._stop = asyncio.Event()
+        workers = []
+        for i, (name, fn, n) in enumerate(self.stages):
+            outbox = self._queues[i + 1] if i + 1 < len(self.stages) else None
+            workers += [asyncio.create_task(self._worker(name, fn, self._queues[i], outbox)) for _ in range(n)]
+        self._ready.set()
+        await self._stop.wait()
+        for w in workers:
+            w.cancel()
+
+    async def _worker(self, name, fn, inbox, outbox):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await inbox.get()
+            try:
+                job.status = name
+                t0 = time.perf_counter()
+                await loop.run_in_executor(self._executor, fn, job)
+                job.timings[name] = time.perf_counter() - t0
+                if outbox is None:
+                    job.status = "done"
+                else:
+                    job.status = f"queued after {name}"
+                    await outbox.put(job)    # waits while the next stage is full
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"{name}: {e}"
+                print(f"⚠️ Pipeline job {job.job_id} ({job.student_id}) failed while {job.error}")
+                if self.on_failure is not None:
+                    try:
+                        await loop.run_in_executor(self._executor, self.on_failure, job, name)
+                    except Exception as e:
+                        print(f"⚠️ Could not record the failure of job {job.job_id}: {e}")
+            finally:
+                inbox.task_done()
+
+    # --- public (any thread) ---
+    def submit(self, job, timeout=None):
+        """Queues a job; blocks only while the first stage's queue is full. Returns the job id."""
+        with self._jobs_lock:
+            self.jobs[job.job_id] = job
+            while len(self.jobs) > MAX_TRACKED_JOBS:
+                self.jobs.popitem(last=False)
+        asyncio.run_coroutine_threadsafe(self._queues[0].put(job), self._loop).result(timeout)
+        return job.job_id
+
+    def status(self, job_id):
+        job = self.jobs.get(job_id)
+        return job.to_dict() if job else None
+
+    def backlog(self):
+        """Jobs waiting per stage."""
+        return {name: q.qsize() for (name, _, _), q in zip(self.stages, self._queues)}
+
+    def join(self, timeout=None):
+        """Waits until every queued job has left the last stage."""
+        async def drain():
+            for q in self._queues:
+                await q.join()
+        asyncio.run_coroutine_threadsafe(drain(), self._loop).result(timeout)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._stop.set)
+        self._thread.join()
+        self._executor.shutdown(wait=False)
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def get_pipeline():
+    """The process-wide pipeline (shared by all Streamlit sessions)."""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = SubmissionPipeline()
+                try:
+                    resume_pending(_pipeline)
+                except Exception as e:
+                    print(f"⚠️ Could not resume pending submissions: {e}")
+    return _pipeline
+
+# ==========================================================
+# DURABLE HAND-OFF
+# ==========================================================
+
+def _uploads_dir():
+    return f"{os.path.splitext(db_handler.DB_FILE)[0]}.uploads"
+
+def _upload_path(job_id):
+    return os.path.join(_uploads_dir(), job_id)
+
+def _remove_upload(job_id):
+    try:
+        os.remove(_upload_path(job_id))
+    except FileNotFoundError:
+        pass
+
+def persist(job):
+    """Saves the submission (and an unreviewed upload) synchronously, before it is queued."""
+    sub = {
+        "student_name": job.student_name,
+        "student_id": job.student_id,
+        "test_id": job.test_id,
+        "answers": job.answers or [],
+        "status": "Submitted" if job.answers is not None else "Processing",
+        "graded_result": None,
+        "pipeline_job": job.job_id,
+    }
+    if job.answers is None:
+        os.makedirs(_uploads_dir(), exist_ok=True)
+        tmp = _upload_path(job.job_id) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(job.file_bytes)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, _upload_path(job.job_id))
+        sub["pending_upload"] = {"file_type": job.file_type, "question_id": job.question_id}
+    with _db_lock:
+        if job.answers is not None:
+            db_handler.submit_student_answers(sub)
+        else:
+            db_handler.upsert_submission(sub)
+
+def resume_pending(pipeline):
+    """Queues again the uploads that were saved but never extracted (e.g. before a restart)."""
+    resumed = 0
+    for sub in db_handler.load_db().get("submissions", []):
+        pending = sub.get("pending_upload")
+        if not pending or not os.path.exists(_upload_path(sub.get("pipeline_job", ""))):
+            continue
+        with open(_upload_path(sub["pipeline_job"]), "rb") as f:
+            job = SubmissionJob(sub["student_id"], sub["test_id"], student_name=sub.get("student_name"),
+                                file_bytes=f.read(), file_type=pending.get("file_type", "application/pdf"),
+                                question_id=pending.get("question_id", "Q1"))
+        job.job_id = sub["pipeline_job"]
+        pipeline.submit(job)
+        resumed += 1
+    if resumed:
+        print(f"↩️  Resumed {resumed} submission(s) awaiting extraction")
+    return resumed
+
+def submit_for_grading(student_id, test_id, **kwargs):
+    """
+    Saves a confirmed submission, then hands it to the background pipeline;
+    returns the job id. Raises if the submission could not be saved.
+    """
+    job = SubmissionJob(student_id, test_id, **kwargs)
+    persist(job)
+    return get_pipeline().submit(job)
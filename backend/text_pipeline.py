@@ -1,35 +1,33 @@
 import numpy as np
 import re
-import streamlit as st
-import json
+import threading
 import time
-from sympy import sympify, simplify, Eq, Symbol
-from sympy.core.sympify import SympifyError
 from sentence_transformers import SentenceTransformer, util
 from transformers import pipeline
 from fractions import Fraction
-from openai import OpenAI
-# from latex2sympy2 import latex2sympy
+from backend.llm_json import SCORE_SCHEMA, call_json, validate_score
+from backend.llm_router import complete
+from backend.tracing import stage, count
+from backend import math_service
+from backend.embedding_cache import encode_cached
+from backend.segmenter import TOP_K, split_segments
 # =========================================================
 # 1. SAFE IMPORTS & CONFIG
 # =========================================================
 
-# Attempt to import latex2sympy2 safely
-try:
-    from latex2sympy2 import latex2sympy
-except Exception as e:
-    print(f"⚠️ Warning: latex2sympy2 could not be imported ({e}).")
-    def latex2sympy(expr):
-        return Symbol("LatexParsingError")
+# SymPy / latex2sympy2 parsing lives in backend.math_service: it runs
+# sandboxed in a worker pool with a per-expression timeout and caching.
 
 # =========================================================
-# 2. CACHED MODEL LOADING (CRITICAL FOR STREAMLIT)
+# 2. CACHED MODEL LOADING (ONCE PER PROCESS)
 # =========================================================
+# No st.cache_resource: the module-level cache serves Streamlit sessions
+# and the headless CLI (backend.grade) alike, and the lock keeps parallel
+# grading workers from loading the models twice.
 
-@st.cache_resource
 def load_models():
     """
-    Loads heavy models only ONCE and caches them.
+    Loads heavy models. Use get_models() to load them only ONCE.
     """
     print("⏳ Loading AI Models... (This happens once)")
     
@@ -46,14 +44,28 @@ def load_models():
     print("✅ Models Loaded!")
     return embedder, nli_pipeline
 
-# Load models securely
-embedder, nli_pipeline = load_models()
+_models = None
+_models_lock = threading.Lock()
+
+def get_models():
+    """Returns (embedder, nli_pipeline), loading them on first use."""
+    global _models
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                _models = load_models()
+    return _models
+
+def install_models(embedder, nli_pipeline):
+    """Swaps in stand-in models (benchmarks / offline runs) instead of loading the real ones."""
+    global _models
+    _models = (embedder, nli_pipeline)
 
 # =========================================================
 # 3. TEXT EVALUATION LOGIC
 # =========================================================
 
-def evaluate_text_evidence(student_texts, key_point):
+def evaluate_text_evidence(student_texts, key_point, prepared=None):
     student_text = " ".join(student_texts).strip()
     concept = key_point["concept"]
     evidence_phrases = key_point.get("evidence_phrases", [])
@@ -62,31 +74,45 @@ def evaluate_text_evidence(student_texts, key_point):
     if not student_text:
         return {"matched": False, "awarded_marks": 0, "reason": "No text provided"}
 
+    embedder, nli_pipeline = get_models()
+
     # A. Coverage
     coverage_hits = sum(1 for p in evidence_phrases if p.lower() in student_text.lower())
     coverage_score = 1.0 if coverage_hits > 0 else 0.0
 
-    # B. NLI (Logic Check)
+    # B. Retrieval: embed every segment in one batch, rank by similarity to the concept
+    segments = split_segments(student_texts)
+    # (segments already embedded for another key point / student come from the cache)
+    with stage("embedding"):
+        emb_segments = encode_cached(embedder, segments)
+        if prepared is not None:
+            emb_concept = prepared.concept_embedding(embedder)
+        else:
+            emb_concept = encode_cached(embedder, [concept])[0]
+        sims = util.cos_sim(emb_concept, emb_segments)[0].tolist()
+    ranked = sorted(range(len(segments)), key=lambda i: -sims[i])[:TOP_K]
+
+    # C. NLI (Logic Check) on the top-k segments only, batched
     try:
-        pair = f"{student_text} </s></s> {concept}"
-        nli_result = nli_pipeline(pair)[0]
-        scores = {r["label"].lower(): r["score"] for r in nli_result}
-        
-        entail = scores.get("entailment", 0)
-        contra = scores.get("contradiction", 0)
+        pairs = [f"{segments[i]} </s></s> {concept}" for i in ranked]
+        with stage("nli"):
+            nli_results = nli_pipeline(pairs)
+        count("model_calls")
+        seg_scores = [{r["label"].lower(): r["score"] for r in res} for res in nli_results]
+
+        entail = max(sc.get("entailment", 0) for sc in seg_scores)
+        contra = max(sc.get("contradiction", 0) for sc in seg_scores)
 
-        if contra > 0.6:
+        # A contradicting segment only counts when no other segment supports the concept
+        if contra > 0.6 and entail <= 0.3:
             return {"matched": False, "awarded_marks": 0, "reason": "Contradiction detected"}
         
         entailment_score = 1.0 if entail > 0.7 else (0.5 if entail > 0.3 else 0.0)
     except:
         entailment_score = 0.5 # Fallback
 
-    # C. Semantic Similarity
-    emb_student = embedder.encode(student_text, convert_to_tensor=True)
-    emb_concept = embedder.encode(concept, convert_to_tensor=True)
-    similarity_score = util.cos_sim(emb_student, emb_concept).item()
-    similarity_score = max(0.0, min(similarity_score, 1.0))
+    # Semantic Similarity: best-matching segment
+    similarity_score = max(0.0, min(max(sims), 1.0))
 
     # D. Aggregation
     if entailment_score >= 0.8 and similarity_score >= 0.7:
@@ -107,19 +133,17 @@ def evaluate_text_evidence(student_texts, key_point):
 # 4. EQUATION & MATH LOGIC
 # =========================================================
 
-def parse_expression(expr):
-    """Converts string/latex to SymPy object"""
+def parse_expression(expr, simplified=True):
+    """Converts string/latex to SymPy object (None if unparseable or timed out)"""
     expr = str(expr).replace(" ", "")
     if "=" in expr:
         _, rhs = expr.split("=", 1)
         expr = rhs
-    try:
-        return simplify(sympify(expr))
-    except:
-        try:
-            return simplify(latex2sympy(expr))
-        except:
-            return None
+    with stage("sympy"):
+        if simplified:
+            return math_service.canonical(expr)
+        # Equivalence checks don't need simplify(); fall back to it only for LaTeX input
+        return math_service.parse_raw(expr) or math_service.canonical(expr)
 
 def parse_reaction(eq):
     """Simple parser for Chemical Equations"""
@@ -134,9 +158,8 @@ def parse_reaction(eq):
 def detect_equation_type(eq):
     if "->" in eq or "→" in eq: return "reaction"
     rhs = eq.split("=")[1] if "=" in eq else eq
-    try:
-        if sympify(rhs).is_number: return "computation"
-    except: pass
+    with stage("sympy"):
+        if math_service.is_number(rhs): return "computation"
     return "law"
 def normalize_chemical_equation(eq):
     """
@@ -160,30 +183,48 @@ def normalize_chemical_equation(eq):
     eq = eq.replace(" ", "")
     
     return eq
-def evaluate_equation_evidence(student_equations, key_point):
-    expected_eq = key_point.get("expected_equation")
-    if not expected_eq: return {"matched": False, "reason": "No expected equation"}
-
+def prepare_equation_key(expected_eq):
+    """
+    Teacher-side work for an equation key point: type detection, reaction
+    normalisation or expression parsing. Done once per rubric by CompiledRubric.
+    """
     eq_type = detect_equation_type(expected_eq)
+    key = {"eq_type": eq_type}
 
     # 1. Chemistry
     if eq_type == "reaction":
-        expected_eq = key_point.get("expected_equation")
-        if not expected_eq: return {"matched": False, "reason": "No expected equation"}
-
         # Normalize Teacher Key
         norm_expected = normalize_chemical_equation(expected_eq)
-        
+        key["norm_expected"] = norm_expected
+
         # Pre-calculate Teacher's Reactants/Products for comparison
         try:
             if "->" in norm_expected:
                 exp_lhs, exp_rhs = norm_expected.split("->")
                 # Sort to handle order difference (A+B vs B+A)
-                exp_reactants = sorted(exp_lhs.split("+"))
-                exp_products = sorted(exp_rhs.split("+"))
+                key["reactants"] = sorted(exp_lhs.split("+"))
+                key["products"] = sorted(exp_rhs.split("+"))
             else:
-                exp_reactants, exp_products = [norm_expected], []
+                key["reactants"], key["products"] = [norm_expected], []
         except:
+            key["reactants"] = key["products"] = None # Invalid Key Format
+        return key
+
+    # 2. Math/Physics
+    key["expr"] = parse_expression(expected_eq, simplified=False)
+    return key
+
+def evaluate_equation_evidence(student_equations, key_point, prepared=None):
+    expected_eq = key_point.get("expected_equation")
+    if not expected_eq: return {"matched": False, "reason": "No expected equation"}
+
+    expected = prepared.equation if prepared is not None else prepare_equation_key(expected_eq)
+
+    # 1. Chemistry
+    if expected["eq_type"] == "reaction":
+        norm_expected = expected["norm_expected"]
+        exp_reactants, exp_products = expected["reactants"], expected["products"]
+        if exp_reactants is None:
             return {"matched": False, "reason": "Invalid Key Format"}
 
         for eq in student_equations:
@@ -210,19 +251,19 @@ def evaluate_equation_evidence(student_equations, key_point):
         return {"matched": False, "reason": "Equation mismatch or unbalanced."}
 
     # 2. Math/Physics
-    expected = parse_expression(expected_eq)
+    expected = expected["expr"]
     for eq in student_equations:
-        student = parse_expression(eq)
+        student = parse_expression(eq, simplified=False)
         if student is not None and expected is not None:
-            try:
-                # Algebraically Equivalent (Difference is zero)
-                if simplify(student - expected) == 0:
-                     return {"matched": True, "reason": "Correct equation."}
-            except: pass
+            # Algebraically Equivalent (numeric probe, symbolic simplify if ambiguous)
+            with stage("sympy"):
+                equivalent = math_service.equivalent(student, expected)
+            if equivalent:
+                 return {"matched": True, "reason": "Correct equation."}
             
     return {"matched": False, "reason": "Equation mismatch."}
 
-def evaluate_final_answer(student_final, key_point):
+def evaluate_final_answer(student_final, key_point, prepared=None):
     expected_str = str(key_point.get("expected_final_answer")).strip()
     student_str = str(student_final).strip()
 
@@ -230,10 +271,11 @@ def evaluate_final_answer(student_final, key_point):
         return {"matched": False, "reason": "Missing answer"}
 
     # 1. Symbolic Match (Handles x^2+C == C+x^2)
-    try:
-        if simplify(sympify(student_str) - sympify(expected_str)) == 0:
-            return {"matched": True, "reason": "Correct value (Symbolic Match)"}
-    except: pass
+    with stage("sympy"):
+        expected_expr = prepared.final_expr if prepared is not None else math_service.parse_raw(expected_str)
+        equivalent = math_service.equivalent(math_service.parse_raw(student_str), expected_expr)
+    if equivalent:
+        return {"matched": True, "reason": "Correct value (Symbolic Match)"}
 
     # 2. Exact Match
     if student_str.lower() == expected_str.lower():
@@ -245,17 +287,9 @@ def evaluate_final_answer(student_final, key_point):
 # 5. LLM REFINEMENT (The "Smart" Layer)
 # =========================================================
 
-
-def get_openai_client():
-    """Lazy load client to avoid errors if key is missing initially"""
-    api_key = st.secrets.get("OPENROUTER_API_KEY") or st.secrets.get("OPENROUTER_LLAMA_API_KEY")
-    if not api_key: return None
-    return OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
+# Model, fallback endpoints, hedging and deadlines: backend.llm_router ("grader" route)
 
 def _classify_alignment_llm(student_context, concept, max_m):
-    client = get_openai_client()
-    if not client: return {"awarded_marks": 0, "reasoning": "API Key Missing"}
-
     prompt = f"""
 You are an academic grader.
     
@@ -280,28 +314,30 @@ You are an academic grader.
       "reasoning": "<short explanation>"
     }}
     """
+    def request():
+        # Rate-limited and retried by the gateway; hedged / failed over by the router
+        with stage("llm"):
+            return complete("grader", prompt, schema=("score", SCORE_SCHEMA))
+
     try:
-        response = client.chat.completions.create(
-            model="meta-llama/llama-3.3-70b-instruct:free",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
-        content = response.choices[0].message.content
-        # Clean JSON markdown
-        content = re.sub(r"```json|```", "", content).strip()
-        return json.loads(content)
+        # Fences / prose / truncation are repaired locally; re-asked only if that fails
+        result = call_json(request, validate_score)
+        result["awarded_marks"] = min(float(result["awarded_marks"]), float(max_m))
+        return result
     except Exception as e:
-        return {"awarded_marks": 0, "reasoning": f"LLM Error: {e}"}
+        # No marks here: the caller keeps the heuristic score instead of a silent 0
+        return {"awarded_marks": None, "reasoning": f"LLM Error: {e}"}
 
-def evaluate_key_point_llm(answer_obj, key_point):
+def evaluate_key_point_llm(answer_obj, key_point, prepared=None):
+    """`prepared` is the key point's CompiledKeyPoint when grading against a CompiledRubric."""
     # 1. Run Heuristics (Fast Checks)
     evidences = []
     if "text" in key_point["acceptable_modalities"]:
-        evidences.append(evaluate_text_evidence(answer_obj.get("text", []), key_point))
+        evidences.append(evaluate_text_evidence(answer_obj.get("text", []), key_point, prepared))
     if "equation" in key_point["acceptable_modalities"]:
-        evidences.append(evaluate_equation_evidence(answer_obj.get("equations", []), key_point))
+        evidences.append(evaluate_equation_evidence(answer_obj.get("equations", []), key_point, prepared))
     if "final_answer" in key_point["acceptable_modalities"]:
-        evidences.append(evaluate_final_answer(answer_obj.get("final_answer"), key_point))
+        evidences.append(evaluate_final_answer(answer_obj.get("final_answer"), key_point, prepared))
 
     # Pick best heuristic result
     best_res = max(evidences, key=lambda x: x.get("awarded_marks", 0)) if evidences else {"awarded_marks": 0, "reason": "No match"}
@@ -345,16 +381,27 @@ def evaluate_key_point_llm(answer_obj, key_point):
                 "reason": f"[LLM] {llm_res.get('reasoning')}"
             }
 
+        llm_error = llm_res.get("reasoning")
+    else:
+        llm_error = None
+
     # Default to heuristic result if LLM wasn't needed or failed
     if best_res.get("matched"):
         best_res["awarded_marks"] = max_score # Give full marks if matched strictly
-        
-    return {
+
+    reason = best_res.get("reason", "Criteria not met")
+    if llm_error:
+        reason = f"{reason} (LLM unavailable, heuristic score kept: {llm_error})"
+
+    result = {
         "key_id": key_point["id"],
         "awarded_marks": best_res.get("awarded_marks", 0),
         "max_marks": max_score,
-        "reason": best_res.get("reason", "Criteria not met")
+        "reason": reason
     }
+    if llm_error:
+        result["llm_error"] = True  # heuristic fallback: worth retrying, not worth reusing
+    return result
 
 def evaluate_answer_llm(answer_obj, rubric_obj):
     total = 0
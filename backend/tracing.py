@@ -0,0 +1,108 @@
+# ==========================================================
+# GRADING TRACE
+# Lightweight per-key-point timing & cost instrumentation.
+# Pipelines call `stage()` / `count()`; master_grader opens a
+# `trace_key_point()` around each key point and stores the result
+# as the breakdown entry's "perf" field.
+# ==========================================================
+
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar("grading_trace", default=None)
+
+class KeyPointTrace:
+    __slots__ = ("wall", "stages", "counters")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.stages = defaultdict(float)
+        self.counters = defaultdict(float)
+
+    def to_dict(self):
+        out = {
+            "wall_ms": round(self.wall * 1000, 2),
+            "stages_ms": {k: round(v * 1000, 2) for k, v in self.stages.items()},
+        }
+        for k, v in self.counters.items():
+            out[k] = round(v, 6) if isinstance(v, float) and not v.is_integer() else int(v)
+        return out
+
+@contextmanager
+def trace_key_point():
+    """Collects every stage/count recorded while grading one key point."""
+    trace = KeyPointTrace()
+    token = _current.set(trace)
+    t0 = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.wall = time.perf_counter() - t0
+        _current.reset(token)
+
+@contextmanager
+def stage(name):
+    """Adds the wall time of the `with` block to the current key point's `name` stage."""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stages[name] += time.perf_counter() - t0
+
+def count(name, n=1):
+    """Increments a counter (llm_calls, tokens, model_calls, cache_hits, ...) on the current key point."""
+    trace = _current.get()
+    if trace is not None:
+        trace.counters[name] += n
+
+# ==========================================================
+# AGGREGATION (Evaluator performance panel)
+# ==========================================================
+
+def summarize_perf(graded_results_list):
+    """
+    Aggregates the "perf" fields of many submissions' graded_result lists.
+    Returns (totals, per_stage, per_key_point).
+    """
+    totals = defaultdict(float)
+    per_stage = defaultdict(float)
+    per_kp = defaultdict(list)
+    papers = 0
+
+    for graded in graded_results_list:
+        if not graded:
+            continue
+        papers += 1
+        for q in graded:
+            for item in q.get("breakdown", []):
+                perf = item.get("perf")
+                if not isinstance(perf, dict):
+                    continue
+                totals["wall_ms"] += perf.get("wall_ms", 0)
+                for name, ms in perf.get("stages_ms", {}).items():
+                    per_stage[name] += ms
+                for name, value in perf.items():
+                    if name not in ("wall_ms", "stages_ms") and isinstance(value, (int, float)):
+                        totals[name] += value
+                per_kp[(q.get("question_id"), item.get("key_id"), item.get("criteria"))].append(perf.get("wall_ms", 0))
+
+    totals["papers"] = papers
+    kp_rows = []
+    for (qid, kid, criteria), walls in sorted(per_kp.items(), key=lambda kv: -sum(kv[1])):
+        ordered = sorted(walls)
+        kp_rows.append({
+            "question_id": qid,
+            "key_id": kid,
+            "criteria": criteria,
+            "papers": len(walls),
+            "mean_ms": round(sum(walls) / len(walls), 2),
+            "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 2),
+            "total_ms": round(sum(walls), 2),
+        })
+    return dict(totals), dict(per_stage), kp_rows
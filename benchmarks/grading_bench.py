@@ -0,0 +1,216 @@
+# ==========================================================
+# END-TO-END GRADING BENCHMARK
+#
+#   python -m benchmarks.grading_bench --students 200 --questions 5
+#   python -m benchmarks.grading_bench --compare benchmarks/results/<older>.json
+#
+# Grades a synthetic exam through `bulk_grade_test` (and therefore
+# `auto_grade_submission`) with stand-in models and a local LLM stub,
+# then writes throughput, per-key-point-type latency, peak RSS and
+# DB I/O to benchmarks/results/ as JSON.
+#
+#   python -m benchmarks.grading_bench --llm-latency 0.2 --llm-stall-rate 0.05 --llm-stall 30
+#
+# stalls a share of the primary stub's replies; the grader route
+# then hedges to a second stub (GRADER_LLM_MAX_HEDGES=0 to compare).
+# ==========================================================
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+# Stand-in LLM runs locally: lift the production rate limits before the gateway is built
+os.environ.setdefault("GRADER_OPENROUTER_REQUESTS_PER_MINUTE", "600000")
+os.environ.setdefault("GRADER_OPENROUTER_BURST", "1000")
+os.environ.setdefault("GRADER_OPENROUTER_MAX_CONCURRENCY", "64")
+os.environ.setdefault("GRADER_LLM_BASE_BACKOFF", "0.05")
+
+from benchmarks.stand_ins import StandInEmbedder, StandInNLI
+from benchmarks.synthetic import make_submissions, make_test
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+# ==========================================================
+# HELPERS
+# ==========================================================
+
+def kp_type(kp):
+    mods = kp.get("acceptable_modalities", [])
+    for kind in ("flowchart", "final_answer", "equation", "text"):
+        if kind in mods:
+            return kind
+    return "other"
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def _timed(fn, kind_of, samples):
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            samples[kind_of(*args)].append(time.perf_counter() - t0)
+    return wrapper
+
+# ==========================================================
+# RUN
+# ==========================================================
+
+def run_benchmark(args):
+    from backend import db_handler, master_grader, text_pipeline
+    from backend.llm_gateway import get_gateway
+    from backend.llm_router import GRADER_MODEL, ROUTER_STATS, VISION_MODEL, latency_snapshot
+    from backend.llm_stub_server import start_stub_server
+    from backend.tracing import summarize_perf
+
+    embedder = StandInEmbedder(latency_ms=args.embed_latency_ms)
+    nli = StandInNLI(latency_ms=args.nli_latency_ms)
+    text_pipeline.install_models(embedder, nli)
+
+    # Primary (with the injected stalls) and a clean fallback endpoint for hedges / failover
+    server, base_url = start_stub_server(latency=args.llm_latency, error_rate=args.llm_error_rate,
+                                         stall_rate=args.llm_stall_rate, stall=args.llm_stall, seed=args.seed)
+    fallback, fallback_url = start_stub_server(latency=args.llm_latency, seed=args.seed)
+    os.environ["OPENROUTER_API_KEY"] = "bench-key"
+    os.environ["GRADER_LLM_ROUTE_GRADER"] = (f"openrouter:{GRADER_MODEL}@{base_url}/api/v1, "
+                                            f"openrouter:{VISION_MODEL}@{fallback_url}/api/v1")
+
+    test = make_test(n_questions=args.questions, seed=args.seed)
+    subs = make_submissions(test, n_students=args.students, duplicate_rate=args.duplicate_rate,
+                            long_answer_rate=args.long_rate, seed=args.seed)
+
+    samples = defaultdict(list)
+    master_grader.evaluate_key_point_llm = _timed(
+        master_grader.evaluate_key_point_llm, lambda ans, kp, *a: kp_type(kp), samples)
+    master_grader.grade_flowchart_key_point = _timed(
+        master_grader.grade_flowchart_key_point, lambda kp, *a: "flowchart", samples)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_handler.DB_FILE = os.path.join(tmp, "bench_db.json")
+        db_handler.save_db({"tests": [test], "submissions": subs})
+        for k in db_handler.DB_STATS:
+            db_handler.DB_STATS[k] = 0
+
+        t0 = time.perf_counter()
+        graded = master_grader.bulk_grade_test(test["test_id"])
+        elapsed = time.perf_counter() - t0
+        db_stats = dict(db_handler.DB_STATS)
+        trace_totals, per_stage, _ = summarize_perf(
+            [s.get("graded_result") for s in db_handler.load_db()["submissions"]])
+
+    server.shutdown()
+    fallback.shutdown()
+
+    n_kps = sum(len(v) for v in samples.values())
+    return {
+        "benchmark": "grading_e2e",
+        "git_revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "papers_graded": graded,
+        "wall_seconds": round(elapsed, 4),
+        "throughput": {
+            "papers_per_second": round(graded / elapsed, 3) if elapsed else None,
+            "key_points_per_second": round(n_kps / elapsed, 3) if elapsed else None,
+        },
+        "latency_ms": {
+            kind: {
+                "count": len(vals),
+                "p50": round(percentile(vals, 50) * 1000, 3),
+                "p95": round(percentile(vals, 95) * 1000, 3),
+                "p99": round(percentile(vals, 99) * 1000, 3),
+                "total": round(sum(vals) * 1000, 3),
+            }
+            for kind, vals in sorted(samples.items())
+        },
+        "stages_ms": {k: round(v, 2) for k, v in sorted(per_stage.items())},
+        "trace_counters": {k: v for k, v in trace_totals.items() if k not in ("wall_ms", "papers")},
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "db_io": db_stats,
+        "models": {
+            "embed_calls": embedder.calls,
+            "texts_embedded": embedder.texts_encoded,
+            "nli_calls": nli.calls,
+            "nli_pairs": nli.pairs_scored,
+            "nli_tokens": nli.tokens_scored,
+        },
+        "llm": dict(get_gateway("openrouter").stats),
+        "llm_router": {**ROUTER_STATS, "endpoints": latency_snapshot()},
+    }
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        base = json.load(f)
+    print(f"\n📊 vs {base.get('git_revision')} ({os.path.basename(baseline_path)})")
+    b, c = base["throughput"]["papers_per_second"], current["throughput"]["papers_per_second"]
+    if b and c:
+        print(f"   papers/s      {b:>10.3f} → {c:>10.3f}  ({(c / b - 1) * 100:+.1f}%)")
+    for kind, cur in current["latency_ms"].items():
+        old = base["latency_ms"].get(kind)
+        if old:
+            print(f"   {kind:<13} p95 {old['p95']:>9.2f} → {cur['p95']:>9.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end grading benchmark on synthetic exams.")
+    parser.add_argument("--students", type=int, default=100)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--duplicate-rate", type=float, default=0.2)
+    parser.add_argument("--long-rate", type=float, default=0.1, help="Fraction of very long text answers")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Simulated cost per embedded text")
+    parser.add_argument("--nli-latency-ms", type=float, default=0.0, help="Simulated cost of a 128-token NLI pair (scales quadratically)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Stub LLM delay in seconds")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-stall-rate", type=float, default=0.0, help="Fraction of primary LLM replies that stall")
+    parser.add_argument("--llm-stall", type=float, default=30.0, help="Extra delay of a stalled reply in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="Previous result JSON to diff against")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"grading_e2e-{result['git_revision']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"✅ Graded {result['papers_graded']} papers in {result['wall_seconds']}s "
+          f"({result['throughput']['papers_per_second']} papers/s)")
+    for kind, lat in result["latency_ms"].items():
+        print(f"   {kind:<13} n={lat['count']:<6} p50={lat['p50']:.2f}ms p95={lat['p95']:.2f}ms p99={lat['p99']:.2f}ms")
+    print(f"   peak RSS {result['peak_rss_mb']} MB | DB {result['db_io']}")
+    router = {k: v for k, v in result["llm_router"].items() if k != "endpoints"}
+    print(f"   LLM router {router}")
+    print(f"💾 {path}")
+
+    if args.compare:
+        compare(result, args.compare)
+
+if __name__ == "__main__":
+    main()
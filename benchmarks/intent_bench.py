@@ -0,0 +1,118 @@
+# ==========================================================
+# INTENT CLASSIFIER BENCHMARK
+#
+#   python -m benchmarks.intent_bench --nodes 200000
+#
+# Compares the compiled single-pass classifier in
+# backend/flowchart_pipeline.py with the previous substring/regex
+# implementation on large synthetic flowcharts (cold and memoised),
+# and lists where the word-boundary semantics change the verdict.
+# ==========================================================
+
+import argparse
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+
+from backend.flowchart_pipeline import IntentClassifier, DEFAULT_INTENT_TABLE
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def legacy_classify_intent(text):
+    """The original classify_intent, kept here as the baseline."""
+    t = re.sub(r"\s+", " ", str(text).lower().strip())
+
+    if any(k in t for k in ["start", "begin", "init"]):
+        return "START"
+    if any(k in t for k in ["end", "stop", "exit", "finish"]):
+        return "END"
+    if any(k in t for k in ["print", "output", "display", "show", "write"]):
+        return "OUTPUT"
+    if any(k in t for k in ["input", "read", "get", "scan", "enter"]):
+        return "INPUT"
+
+    if "++" in t or re.search(r"\w+\s*=\s*\w+\s*\+\s*1", t):
+        return "INCREMENT"
+    if "--" in t or re.search(r"\w+\s*=\s*\w+\s*-\s*1", t):
+        return "DECREMENT"
+
+    if re.search(r"[<>]=?|==|!=", t):
+        return "CONDITION"
+    if "=" in t:
+        return "ASSIGNMENT"
+
+    return "UNKNOWN"
+
+NODE_TEMPLATES = [
+    "Start", "Begin program", "Initialize {v} = 0", "End", "Stop", "Exit loop",
+    "Print {v}", "Display result", "Output the sum", "Input {v}", "Read {v} from user",
+    "Get value of {v}", "{v} = {v} + 1", "{v}++", "{v} = {v} - 1", "Is {v} > {n}?",
+    "{v} <= {n}", "{v} == {n}", "{v} = {v} * {n}", "Calculate area of circle",
+    "Micelles form around the dirt", "Photosynthesis occurs in leaves", "Target weekend sales",
+    "Restart the engine", "Send signal to the sender", "Check whether the list is sorted",
+]
+
+def synthetic_nodes(n, seed=0, distinct=5000):
+    rng = random.Random(seed)
+    pool = [
+        rng.choice(NODE_TEMPLATES).format(v=rng.choice("abcnxyi"), n=rng.randint(0, 99)) + " " * rng.randint(0, 2)
+        for _ in range(distinct)
+    ]
+    return [rng.choice(pool) for _ in range(n)]
+
+def _time(fn, texts):
+    t0 = time.perf_counter()
+    out = [fn(t) for t in texts]
+    return time.perf_counter() - t0, out
+
+def main():
+    parser = argparse.ArgumentParser(description="Compiled vs legacy flowchart intent classification.")
+    parser.add_argument("--nodes", type=int, default=200000)
+    parser.add_argument("--distinct", type=int, default=5000, help="Distinct node texts in the pool")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=RESULTS_DIR)
+    args = parser.parse_args()
+
+    texts = synthetic_nodes(args.nodes, args.seed, args.distinct)
+
+    legacy_s, legacy = _time(legacy_classify_intent, texts)
+
+    uncached = IntentClassifier(DEFAULT_INTENT_TABLE)
+    cold_s, _ = _time(uncached._classify, texts)
+
+    memo = IntentClassifier(DEFAULT_INTENT_TABLE)
+    memo_s, compiled = _time(memo, texts)
+
+    diffs = Counter((t.strip(), a, b) for t, a, b in zip(texts, legacy, compiled) if a != b)
+    result = {
+        "benchmark": "intent_classifier",
+        "nodes": args.nodes,
+        "distinct_texts": len(set(texts)),
+        "legacy_us_per_node": round(legacy_s / args.nodes * 1e6, 3),
+        "compiled_uncached_us_per_node": round(cold_s / args.nodes * 1e6, 3),
+        "compiled_memoised_us_per_node": round(memo_s / args.nodes * 1e6, 3),
+        "speedup_memoised": round(legacy_s / memo_s, 1) if memo_s else None,
+        "agreement": round(1 - sum(diffs.values()) / args.nodes, 4),
+        "semantic_changes": [
+            {"text": t, "legacy": a, "compiled": b, "count": c} for (t, a, b), c in diffs.most_common(20)
+        ],
+    }
+
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"intent_classifier-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"legacy            {result['legacy_us_per_node']:>8.3f} µs/node")
+    print(f"compiled (cold)   {result['compiled_uncached_us_per_node']:>8.3f} µs/node")
+    print(f"compiled (memo)   {result['compiled_memoised_us_per_node']:>8.3f} µs/node  ({result['speedup_memoised']}x)")
+    print(f"agreement         {result['agreement'] * 100:.2f}%")
+    for row in result["semantic_changes"][:8]:
+        print(f"   {row['text']!r}: {row['legacy']} → {row['compiled']}")
+    print(f"💾 {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# ==========================================================
+# MODEL STAND-INS
+# Cheap, deterministic replacements for the sentence embedder and
+# the roberta-large-mnli pipeline, so benchmarks measure the grading
+# pipeline itself rather than model download / GPU availability.
+# ==========================================================
+
+import hashlib
+import re
+import time
+
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def _tokens(text):
+    return TOKEN_RE.findall(str(text).lower())
+
+class StandInEmbedder:
+    """Hashing-trick bag-of-words embedder with the SentenceTransformer.encode() signature."""
+
+    def __init__(self, dim=384, latency_ms=0.0):
+        self.dim = dim
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.texts_encoded = 0
+
+    def _vector(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for tok in _tokens(text):
+            h = int(hashlib.md5(tok.encode("utf-8")).hexdigest()[:8], 16)
+            vec[h % self.dim] += 1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def encode(self, sentences, convert_to_tensor=False, **kwargs):
+        self.calls += 1
+        single = isinstance(sentences, str)
+        batch = [sentences] if single else list(sentences)
+        self.texts_encoded += len(batch)
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0 * len(batch))
+        out = np.stack([self._vector(t) for t in batch]) if batch else np.zeros((0, self.dim), dtype=np.float32)
+        return out[0] if single else out
+
+class StandInNLI:
+    """
+    Token-overlap 'entailment' with the transformers text-classification (top_k=None) output shape.
+    Like roberta-large-mnli, a pair is truncated at MAX_TOKENS (premise first) and costs
+    quadratically in its length: `latency_ms` is the cost of a REF_TOKENS-token pair.
+    """
+    MAX_TOKENS = 512
+    REF_TOKENS = 128
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.pairs_scored = 0
+        self.tokens_scored = 0
+
+    def _score(self, pair):
+        premise, _, hypothesis = str(pair).partition("</s></s>")
+        h_tokens = _tokens(hypothesis)
+        p_tokens = _tokens(premise)[:max(0, self.MAX_TOKENS - len(h_tokens))]
+        self.tokens_scored += len(p_tokens) + len(h_tokens)
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0 * ((len(p_tokens) + len(h_tokens)) / self.REF_TOKENS) ** 2)
+
+        p, h = set(p_tokens), set(h_tokens)
+        overlap = len(p & h) / len(h) if h else 0.0
+        entail = 0.9 * overlap
+        contra = 0.05 if overlap else 0.3
+        return [
+            {"label": "ENTAILMENT", "score": entail},
+            {"label": "CONTRADICTION", "score": contra},
+            {"label": "NEUTRAL", "score": max(0.0, 1.0 - entail - contra)},
+        ]
+
+    def __call__(self, inputs, **kwargs):
+        self.calls += 1
+        batch = [inputs] if isinstance(inputs, str) else list(inputs)
+        self.pairs_scored += len(batch)
+        return [self._score(pair) for pair in batch]
@@ -0,0 +1,167 @@
+# ==========================================================
+# SYNTHETIC EXAMS
+# Generates tests and student submissions with the same schema the
+# Evaluator's rubric builder and the Student page produce.
+# ==========================================================
+
+import random
+import uuid
+
+CONCEPTS = [
+    ("Photosynthesis converts light energy into chemical energy stored in glucose",
+     ["light energy", "chemical energy", "glucose"]),
+    ("Newton's second law states that force equals mass times acceleration",
+     ["force", "mass", "acceleration"]),
+    ("Mitochondria are the site of aerobic respiration and ATP production",
+     ["mitochondria", "respiration", "ATP"]),
+    ("An acid donates protons while a base accepts protons",
+     ["donates protons", "accepts protons"]),
+    ("Binary search halves the search interval at each step giving logarithmic time",
+     ["halves", "logarithmic"]),
+]
+
+FILLER = [
+    "In this answer I will explain the idea step by step.",
+    "This is an important concept that appears in many chapters.",
+    "The teacher discussed it in class with several examples.",
+    "There are some exceptions which we did not cover in detail.",
+    "As shown in the diagram the process repeats several times.",
+]
+
+MATH_EQUATIONS = [
+    ("y = 2*x + 3", "y = 3 + 2*x", "y = 2*x - 3"),
+    ("v = u + a*t", "v = a*t + u", "v = u - a*t"),
+    ("E = m*c**2", "E = c**2*m", "E = m*c"),
+    ("A = (a + b)**2", "A = a**2 + 2*a*b + b**2", "A = a**2 + b**2"),
+    ("f = sin(x)**2 + cos(x)**2", "f = 1", "f = 2"),
+]
+
+CHEM_EQUATIONS = [
+    ("BaCl2 + Na2SO4 -> BaSO4 + 2NaCl", "Na2SO4 + BaCl2 -> 2NaCl + BaSO4", "BaCl2 + Na2SO4 -> BaSO4 + NaCl"),
+    ("2H2 + O2 -> 2H2O", "O2 + 2H2 -> 2H2O", "H2 + O2 -> H2O"),
+    ("CH4 + 2O2 -> CO2 + 2H2O", "2O2 + CH4 -> 2H2O + CO2", "CH4 + O2 -> CO2 + H2O"),
+]
+
+FINAL_ANSWERS = [("5", "5", "7"), ("x**2 + C", "C + x**2", "x**2"), ("12.5", "12.5", "25")]
+
+FLOW_STEPS = ["Start", "Input N", "Is N > 0?", "Print N", "N = N - 1", "End"]
+
+# ==========================================================
+# RUBRIC (TEST) GENERATION
+# ==========================================================
+
+def _flowchart_rules(marks):
+    rules = [
+        {"id": "k1", "concept": "Start Node", "type": "node_check", "expected_text": "Start", "marks": 1},
+        {"id": "k2", "concept": "Input Step", "type": "node_check", "expected_text": "Input N", "marks": 1},
+        {"id": "k3", "concept": "Decision", "type": "node_check", "expected_text": "Is N > 0?", "marks": 1},
+        {"id": "k4", "concept": "Input to decision", "type": "connection_check",
+         "from_text": "Input N", "to_text": "Is N > 0?", "marks": 1},
+        {"id": "k5", "concept": "Loop decrement", "type": "connection_check",
+         "from_text": "N = N - 1", "to_text": "Is N > 0?", "marks": 1},
+    ]
+    for r in rules:
+        r["marks"] = round(marks / len(rules), 3)
+    return rules
+
+def make_key_point(kind, idx, rng):
+    kp = {"id": f"k{idx}", "marks": 1.0}
+    if kind == "text":
+        concept, phrases = rng.choice(CONCEPTS)
+        kp.update(concept=concept, acceptable_modalities=["text"], evidence_phrases=phrases)
+    elif kind == "equation":
+        expected = rng.choice(MATH_EQUATIONS + CHEM_EQUATIONS)[0]
+        kp.update(concept="Correct governing equation", acceptable_modalities=["equation"], expected_equation=expected)
+    elif kind == "final_answer":
+        expected = rng.choice(FINAL_ANSWERS)[0]
+        kp.update(concept="Final result", acceptable_modalities=["final_answer", "equation"], expected_final_answer=expected)
+    else:
+        kp.update(concept="Algorithm flowchart", acceptable_modalities=["flowchart"],
+                  type="flowchart_analysis", evaluation_rules=_flowchart_rules(kp["marks"]))
+    return kp
+
+def make_test(n_questions=5, kinds=("text", "equation", "final_answer", "flowchart"), seed=0):
+    rng = random.Random(seed)
+    rubric = []
+    for q in range(1, n_questions + 1):
+        key_points = [make_key_point(kind, i + 1, rng) for i, kind in enumerate(kinds)]
+        rubric.append({
+            "question_id": f"Q{q}",
+            "max_marks": sum(kp["marks"] for kp in key_points),
+            "key_points": key_points,
+        })
+    return {
+        "test_id": "bench-" + uuid.UUID(int=rng.getrandbits(128)).hex[:8],
+        "test_name": f"Synthetic Benchmark ({n_questions} questions)",
+        "subject": "Benchmark",
+        "total_marks": sum(q["max_marks"] for q in rubric),
+        "rubric": rubric,
+    }
+
+# ==========================================================
+# SUBMISSION GENERATION
+# ==========================================================
+
+def _pick(options, quality, rng):
+    """options = (expected, equivalent, wrong)."""
+    roll = rng.random()
+    if roll < quality * 0.6:
+        return options[0]
+    if roll < quality:
+        return options[1]
+    return options[2]
+
+def _student_graph(quality, rng):
+    steps = list(FLOW_STEPS)
+    if rng.random() > quality:
+        steps.remove(rng.choice(steps[1:-1]))
+    nodes = [{"id": f"n{i}", "text": t, "shape": "rect"} for i, t in enumerate(steps)]
+    edges = [{"source": f"n{i}", "target": f"n{i + 1}", "label": ""} for i in range(len(steps) - 1)]
+    if "N = N - 1" in steps and "Is N > 0?" in steps:
+        edges.append({"source": f"n{steps.index('N = N - 1')}", "target": f"n{steps.index('Is N > 0?')}", "label": ""})
+    return {"nodes": nodes, "edges": edges}
+
+def make_answer(question, quality, long_answer, rng):
+    ans = {"question_id": question["question_id"], "text": [], "equations": [], "flowcharts": [], "final_answer": None}
+    for kp in question["key_points"]:
+        mods = kp["acceptable_modalities"]
+        if "flowchart" in mods:
+            ans["flowcharts"].append(_student_graph(quality, rng))
+        elif "final_answer" in mods:
+            options = next(o for o in FINAL_ANSWERS if o[0] == kp["expected_final_answer"])
+            ans["final_answer"] = _pick(options, quality, rng)
+        elif "equation" in mods:
+            options = next(o for o in MATH_EQUATIONS + CHEM_EQUATIONS if o[0] == kp["expected_equation"])
+            ans["equations"].append(_pick(options, quality, rng))
+        else:
+            sentences = rng.sample(FILLER, rng.randint(1, 3))
+            if rng.random() < quality:
+                sentences.append(kp["concept"] + ".")
+            if long_answer:
+                sentences = sentences * 8
+            ans["text"].extend(sentences)
+    return ans
+
+def make_submissions(test, n_students=100, duplicate_rate=0.2, long_answer_rate=0.1, seed=0):
+    """
+    Returns submissions for `test`. A `duplicate_rate` fraction of students copy
+    another student's answers verbatim (as happens with shared final answers).
+    """
+    rng = random.Random(seed + 1)
+    subs = []
+    for i in range(n_students):
+        if subs and rng.random() < duplicate_rate:
+            answers = [dict(a) for a in rng.choice(subs)["answers"]]
+        else:
+            quality = rng.random()
+            answers = [make_answer(q, quality, rng.random() < long_answer_rate, rng) for q in test["rubric"]]
+        subs.append({
+            "student_name": f"Student {i:04d}",
+            "student_id": f"ST-BENCH-{i:04d}",
+            "test_id": test["test_id"],
+            "answers": answers,
+            "status": "Assigned",
+            "assigned_teacher_id": "T-BENCH",
+            "graded_result": None,
+        })
+    return subs
@@ -1,5 +1,6 @@
 import base64
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
 import json
 import uuid
@@ -9,16 +10,31 @@ from backend.flowchart_pipeline import generate_json_from_image
 
 # --- IMPORT BACKEND HANDLERS ---
 try:
-    from backend.db_handler import get_submissions_for_teacher, load_db, save_db
-    from backend.master_grader import auto_grade_submission
+    from backend.db_handler import (archive_test, get_submission, get_submissions_for_teacher, get_submissions_for_test,
+                                    list_archived, load_db, restore_test, save_db, submit_student_answers, thaw,
+                                    upsert_submission)
+    from backend.master_grader import auto_grade_submission, bulk_grade_test
     from backend.flowchart_pipeline import extract_teacher_graph
+    from backend.tracing import summarize_perf
+    from backend.near_duplicates import find_clusters
 except ImportError as e:
     st.error(f"Backend Import Error: {e}")
     def get_submissions_for_teacher(): return []
+    def get_submission(student_id, test_id): return None
+    def get_submissions_for_test(test_id): return []
+    def list_archived(): return {}
+    def archive_test(test_id): return False
+    def restore_test(test_id): return False
     def load_db(): return {"tests": [], "submissions": []}
     def save_db(data): pass
-    def auto_grade_submission(ans, rubric): return []
+    def thaw(data): return data
+    def upsert_submission(submission): pass
+    def submit_student_answers(submission): pass
+    def auto_grade_submission(ans, rubric, student_id=None): return []
+    def bulk_grade_test(test_id): return 0
     def extract_teacher_graph(img, key): return {}
+    def summarize_perf(results): return {}, {}, []
+    def find_clusters(test_id, submissions=None): return {}
 
 # -----------------------------------------------------------------------------
 # 1. PAGE CONFIGURATION & STYLING
@@ -43,6 +59,7 @@ st.markdown("""
         border-color: #007bff;
     }
     .status-submitted { color: #28a745; font-weight: bold; background-color: #d4edda; padding: 2px 8px; border-radius: 4px; }
+    .status-failed { color: #dc3545; font-weight: bold; background-color: #f8d7da; padding: 2px 8px; border-radius: 4px; }
     .grade-badge { font-weight: bold; color: #333; }
 </style>
 """, unsafe_allow_html=True)
@@ -60,7 +77,7 @@ if 'teacher_profile' not in st.session_state:
 
 if 'all_tests' not in st.session_state:
     db_data = load_db()
-    st.session_state['all_tests'] = db_data.get("tests", [])
+    st.session_state['all_tests'] = list(db_data.get("tests", []))
 
 if 'current_test_builder' not in st.session_state:
     st.session_state['current_test_builder'] = {
@@ -74,24 +91,31 @@ if 'current_test_builder' not in st.session_state:
 # 3. HELPER FUNCTIONS (MODALS & DIALOGS)
 # -----------------------------------------------------------------------------
 
+def rerun_fragment():
+    """Reruns the calling fragment; the whole page if this click arrived in a full-app run."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
 # ✅ ADDED width="large" HERE
 @st.dialog("🔍 Review & Verify Submission", width="large")
 def review_submission_dialog(student_id, test_id):
     """
     Pop-up to view, grade, and edit a specific student's submission.
     """
-    db = load_db()
-
-    # 1. MOVE THIS TO THE TOP: Fetch Submission FIRST
-    submission = next((s for s in db.get("submissions", []) 
-                       if s["student_id"] == student_id and s["test_id"] == test_id), None)
-    
-    active_test = next((t for t in db.get("tests", []) if t["test_id"] == test_id), None)
+    # 1. Fetch Submission FIRST (indexed snapshot: no scan over the class)
+    submission = get_submission(student_id, test_id)
+    active_test = next((t for t in load_db().get("tests", []) if t["test_id"] == test_id), None)
 
     # 2. Safety Check: If not found, stop immediately
     if not submission:
         st.error("Submission data not found.")
         return
+    if active_test is None:
+        # Deleted or archived while this dialog was open
+        st.error("This assessment is no longer active.")
+        return
 
     # 3. NOW it is safe to use 'submission' for the image viewer
     with st.expander("📄 View Original Student Answer", expanded=False):
@@ -122,16 +146,15 @@ def review_submission_dialog(student_id, test_id):
         if st.button("⚡ Run Auto-Grader Now", key=f"dlg_grade_{student_id}"):
             with st.spinner("Running AI Analysis..."):
                 try:
-                    results = auto_grade_submission(submission['answers'], active_test)
+                    results = auto_grade_submission(submission['answers'], active_test, student_id)
                     
-                    # Update DB
-                    db = load_db()
-                    for i, s in enumerate(db["submissions"]):
-                        if s["student_id"] == student_id and s["test_id"] == test_id:
-                            db["submissions"][i]["graded_result"] = results
-                            break
-                    save_db(db)
-                    st.rerun()
+                    # Update DB (this submission only)
+                    updated = get_submission(student_id, test_id)
+                    if updated is not None:
+                        updated = thaw(updated)
+                        updated["graded_result"] = results
+                        upsert_submission(updated)
+                    rerun_fragment()  # redraw this dialog with the grades
                 except Exception as e:
                     st.error(f"Grading Failed: {e}")
 
@@ -144,42 +167,55 @@ def review_submission_dialog(student_id, test_id):
         c1, c2 = st.columns(2)
         c1.metric("Total Grade", f"{total_score} / {max_total}")
         c2.progress(min(total_score / max_total, 1.0) if max_total > 0 else 0)
+
+        if submission.get("auto_graded"):
+            st.info("🤖 Provisional auto-grade, computed on submission. Review and update the scores below.")
         
         st.divider()
         
-        # Display Breakdown per Question
-        for q_idx, q_res in enumerate(submission['graded_result']):
-            with st.container(border=True):
-                st.markdown(f"#### 📄 {q_res['question_id']} (Score: {q_res['score']})")
-                
-                # Editable Table
-                breakdown_df = pd.DataFrame(q_res['breakdown'])
-                edited_df = st.data_editor(
-                    breakdown_df,
-                    column_config={
-                        "awarded_marks": st.column_config.NumberColumn("Marks", min_value=0, max_value=10, step=0.5),
-                        "reason": st.column_config.TextColumn("Feedback", width="large"),
-                        "key_id": st.column_config.TextColumn("ID", disabled=True),
-                        "criteria": st.column_config.TextColumn("Criteria", disabled=True)
-                    },
-                    key=f"dlg_edit_{student_id}_{q_idx}",
-                    use_container_width=True
-                )
-                
-                if st.button("💾 Update Score", key=f"dlg_save_{student_id}_{q_idx}"):
-                    new_breakdown = edited_df.to_dict('records')
-                    new_score = sum(item['awarded_marks'] for item in new_breakdown)
-                    
-                    # Update DB
-                    db = load_db()
-                    for i, s in enumerate(db["submissions"]):
-                        if s["student_id"] == student_id and s["test_id"] == test_id:
-                            db["submissions"][i]["graded_result"][q_idx]['breakdown'] = new_breakdown
-                            db["submissions"][i]["graded_result"][q_idx]['score'] = new_score
-                            break
-                    save_db(db)
-                    st.toast("Score Updated Successfully!", icon="✅")
-                    st.rerun()
+        # Display Breakdown per Question (each editor reruns on its own)
+        for q_idx in range(len(submission['graded_result'])):
+            score_editor(student_id, test_id, q_idx)
+
+@st.fragment
+def score_editor(student_id, test_id, q_idx):
+    """One question's editable breakdown: edits and saves rerun only this editor."""
+    submission = get_submission(student_id, test_id)
+    if submission is None or not submission.get('graded_result') or q_idx >= len(submission['graded_result']):
+        st.info("This score is no longer available.")
+        return
+    q_res = submission['graded_result'][q_idx]
+    with st.container(border=True):
+        st.markdown(f"#### 📄 {q_res['question_id']} (Score: {q_res['score']} / {q_res['max_score']})")
+        
+        # Editable Table
+        breakdown_df = pd.DataFrame(q_res['breakdown'])
+        edited_df = st.data_editor(
+            breakdown_df,
+            column_config={
+                "awarded_marks": st.column_config.NumberColumn("Marks", min_value=0, max_value=10, step=0.5),
+                "reason": st.column_config.TextColumn("Feedback", width="large"),
+                "key_id": st.column_config.TextColumn("ID", disabled=True),
+                "criteria": st.column_config.TextColumn("Criteria", disabled=True),
+                "provenance": st.column_config.TextColumn("Source", disabled=True, help="'reused:<student>' = identical answer graded once"),
+                "perf": None  # grading timings, kept but not shown
+            },
+            key=f"dlg_edit_{student_id}_{q_idx}",
+            use_container_width=True
+        )
+        
+        if st.button("💾 Update Score", key=f"dlg_save_{student_id}_{q_idx}"):
+            new_breakdown = edited_df.to_dict('records')
+            new_score = sum(item['awarded_marks'] for item in new_breakdown)
+            
+            # Update DB (this submission only, re-read so other editors' saves are kept)
+            updated = thaw(get_submission(student_id, test_id))
+            updated["graded_result"][q_idx]['breakdown'] = new_breakdown
+            updated["graded_result"][q_idx]['score'] = new_score
+            updated["auto_graded"] = False  # reviewed by a teacher
+            upsert_submission(updated)
+            st.toast("Score Updated Successfully!", icon="✅")
+            rerun_fragment()
 
 @st.dialog("✅ Assessment Published")
 def publish_success_modal():
@@ -221,11 +257,7 @@ def upload_for_student_dialog(student_id, test_id):
                     "student_name": student_id # Fallback name
                 }
                 
-                db = load_db()
-                db["submissions"] = [s for s in db.get("submissions", []) 
-                                   if not (s["student_id"] == student_id and s.get("test_id") == test_id)]
-                db["submissions"].append(submission)
-                save_db(db)
+                submit_student_answers(submission)  # new answers: keep the near-duplicate index current
                 
                 st.success("✅ Submission uploaded, extracted, and saved!")
                 st.rerun()
@@ -248,13 +280,12 @@ def edit_json_dialog(test_index):
         if st.button("💾 Save Changes", type="primary"):
             try:
                 new_rubric = json.loads(edited_json_str)
-                db = load_db()
+                db = thaw(load_db())
                 for t in db.get("tests", []):
                     if t["test_id"] == test_id:
                         t["rubric"] = new_rubric
                         break
                 save_db(db)
-                st.session_state['all_tests'][test_index]['rubric'] = new_rubric
                 st.success("Saved!")
                 st.rerun()
             except json.JSONDecodeError as e:
@@ -262,29 +293,28 @@ def edit_json_dialog(test_index):
 
 def delete_test_from_db(test_index):
     target_id = st.session_state['all_tests'][test_index]['test_id']
-    db = load_db()
+    db = thaw(load_db())
     db["tests"] = [t for t in db["tests"] if t["test_id"] != target_id]
     save_db(db)
     st.session_state['all_tests'].pop(test_index)
     st.toast("Deleted!", icon="🗑️")
-    st.rerun()
+    rerun_fragment()  # called from assessment_list
+
+def archive_test_in_db(test_id):
+    # Moves the test and its papers out of the active set into a read-only segment
+    if archive_test(test_id):
+        st.toast("Archived! Students can still see their results.", icon="🗄️")
+    rerun_fragment()  # called from assessment_list
+
+def restore_test_in_db(test_id):
+    if restore_test(test_id):
+        st.toast("Restored!", icon="♻️")
+    rerun_fragment()  # called from assessment_list
 
 def bulk_grade_exam(test_id):
-    db = load_db()
-    active_test = next((t for t in db["tests"] if t["test_id"] == test_id), None)
-    if not active_test: return
-    
-    count = 0
     with st.spinner("Batch Grading in Progress..."):
-        for sub in db.get("submissions", []):
-            if sub.get("test_id") == test_id and not sub.get("graded_result"):
-                try:
-                    sub["graded_result"] = auto_grade_submission(sub.get("answers", []), active_test)
-                    count += 1
-                except Exception as e:
-                    print(f"Error grading {sub['student_id']}: {e}")
-    
-    save_db(db)
+        count = bulk_grade_test(test_id)
+
     if count > 0:
         st.toast(f"✅ Graded {count} papers.", icon="🚀")
     else:
@@ -292,7 +322,7 @@ def bulk_grade_exam(test_id):
     st.rerun()
 
 def toggle_publish_status(test_id):
-    db = load_db()
+    db = thaw(load_db())
     status = False
     for t in db["tests"]:
         if t["test_id"] == test_id:
@@ -303,6 +333,187 @@ def toggle_publish_status(test_id):
     st.toast("Status updated!", icon="📢")
     st.rerun()
 
+@st.fragment
+def submission_row(student_id, test_id):
+    """
+    One row of the submission table. Its buttons rerun only this row
+    (re-read from the DB snapshot), not the whole class list.
+    """
+    sub = get_submission(student_id, test_id)
+    if sub is None:
+        return
+    sid = student_id
+    name = sub.get("student_name", "Unknown")
+    is_graded = sub.get("graded_result") is not None
+    
+    grade_str = "-"
+    if is_graded:
+        score = sum(q['score'] for q in sub['graded_result'])
+        max_score = sum(q['max_score'] for q in sub['graded_result'])
+        grade_str = f"{score} / {max_score}"
+
+    c1, c2, c3, c4, c5 = st.columns([1, 2, 1, 1, 2])
+    c1.write(sid)
+    c2.write(name)
+    
+    with c3:
+        if sub.get("pipeline_error") and not is_graded:
+            # Background extraction / grading failed: upload the paper again for the student
+            label = sub.get("status") if sub.get("status") == "Extraction Failed" else "Grading Failed"
+            st.markdown(f'<span class="status-failed">{label}</span>', unsafe_allow_html=True)
+            st.caption(sub["pipeline_error"])
+        else:
+            label = "Auto-Graded" if sub.get("auto_graded") else "Submitted"
+            st.markdown(f'<span class="status-submitted">{label}</span>', unsafe_allow_html=True)
+    
+    with c4:
+        st.markdown(f'<span class="grade-badge">{grade_str}</span>', unsafe_allow_html=True)
+    
+    with c5:
+        b1, b2 = st.columns(2)
+        with b1:
+            if st.button("Upload", key=f"up_{sid}_{test_id}"): 
+                upload_for_student_dialog(sid, test_id)
+        with b2:
+            # --- VERIFY BUTTON OPENS REVIEW DIALOG ---
+            if st.button("Review", key=f"ver_{sid}_{test_id}"):
+                review_submission_dialog(sid, test_id)
+    
+    st.markdown("---")
+
+@st.fragment
+def rubric_builder(current_q_id):
+    """Key points of the question being edited: adding/deleting one reruns only this panel."""
+    st.subheader(f"3. Rubric for {current_q_id}")
+    curr_q_data = st.session_state['current_test_builder']['questions'][current_q_id]
+    
+    with st.expander("➕ Add New Key Point", expanded=True):
+        c_a, c_b = st.columns([2, 1])
+        with c_a:
+            kp_concept = st.text_input("Concept / Description", key=f"con_{current_q_id}")
+        with c_b:
+            kp_marks = st.number_input("Marks", min_value=0.5, step=0.5, value=1.0, key=f"mk_{current_q_id}")
+
+        kp_type = st.selectbox("Response Type", ["Text / Theory", "Equation / Math", "Flowchart / Diagram", "Final Answer"], key=f"type_{current_q_id}")
+        
+        uploaded_flowchart = None
+        evidence_phrases = ""
+        expected_eq = ""
+        expected_final = ""
+
+        if kp_type == "Text / Theory":
+            evidence_phrases = st.text_area("Evidence Phrases", key=f"evi_{current_q_id}")
+        elif kp_type == "Equation / Math":
+            expected_eq = st.text_input("Expected Equation", key=f"eqn_{current_q_id}")
+        elif kp_type == "Final Answer":
+            expected_final = st.text_input("Expected Final Value", key=f"fin_{current_q_id}")
+        elif kp_type == "Flowchart / Diagram":
+            st.info("ℹ️ Upload Answer Key")
+            uploaded_flowchart = st.file_uploader("Upload Solution", type=['png', 'jpg'], key=f"file_{current_q_id}")
+        
+        if st.button("Add Key Point", type="primary", key=f"btn_{current_q_id}"):
+            if not kp_concept:
+                st.error("Concept required")
+            else:
+                new_kp = {
+                    "id": f"k{len(curr_q_data['key_points']) + 1}",
+                    "concept": kp_concept,
+                    "marks": kp_marks,
+                    "acceptable_modalities": []
+                }
+
+                if kp_type == "Text / Theory":
+                    new_kp["acceptable_modalities"] = ["text"]
+                    new_kp["evidence_phrases"] = [p.strip() for p in evidence_phrases.split(",") if p.strip()]
+                elif kp_type == "Equation / Math":
+                    new_kp["acceptable_modalities"] = ["equation"]
+                    new_kp["expected_equation"] = expected_eq
+                elif kp_type == "Final Answer":
+                    new_kp["acceptable_modalities"] = ["final_answer", "equation"]
+                    new_kp["expected_final_answer"] = expected_final
+                
+                # --- FLOWCHART LOGIC (WITH SCALING) ---
+                elif kp_type == "Flowchart / Diagram":
+                    if not uploaded_flowchart:
+                        st.error("Upload a file first.")
+                        st.stop()
+                    
+                    with st.spinner("🧠 Analyzing diagram..."):
+                        try:
+                            api_key = st.secrets.get("GEMINI_API_KEY", "")
+                            teacher_response = extract_teacher_graph(uploaded_flowchart, api_key)
+                            rules = teacher_response.get("key_points", [])
+                            
+                            if rules:
+                                # Marks Scaling Logic
+                                raw_total = sum(r.get("marks", 1) for r in rules)
+                                if raw_total > 0 and kp_marks > 0:
+                                    factor = kp_marks / raw_total
+                                    running = 0
+                                    for i, r in enumerate(rules):
+                                        if i == len(rules) - 1:
+                                            r["marks"] = round(kp_marks - running, 3)
+                                        else:
+                                            val = round(r.get("marks", 1) * factor, 3)
+                                            r["marks"] = val
+                                            running += val
+                                    st.toast(f"Scaled rules to match {kp_marks} marks.", icon="⚖️")
+                            
+                            new_kp["acceptable_modalities"] = ["flowchart"]
+                            new_kp["type"] = "flowchart_analysis"
+                            new_kp["evaluation_rules"] = rules
+                        except Exception as e:
+                            st.error(str(e)); st.stop()
+
+                curr_q_data['key_points'].append(new_kp)
+                st.success("Added!")
+                rerun_fragment()
+
+    if curr_q_data['key_points']:
+        total_kp = sum(kp['marks'] for kp in curr_q_data['key_points'])
+        for idx, kp in enumerate(curr_q_data['key_points']):
+            with st.container():
+                c_info, c_del = st.columns([0.9, 0.1])
+                with c_info:
+                    st.markdown(f"""
+                    <div class="keypoint-card">
+                        <div class="keypoint-header">{kp['id']}: {kp['concept']} ({kp['marks']})</div>
+                        <div class="keypoint-meta">{kp['acceptable_modalities']}</div>
+                    </div>""", unsafe_allow_html=True)
+                with c_del:
+                    if st.button("Delete", key=f"del_{current_q_id}_{idx}"):
+                        curr_q_data['key_points'].pop(idx); rerun_fragment()
+        
+        if abs(total_kp - curr_q_data['max_marks']) > 0.01:
+            st.warning(f"⚠️ Mismatch: Key points total **{total_kp}**, but Question Marks set to **{curr_q_data['max_marks']}**.")
+        else:
+            st.success("✅ Marks Matched")
+
+@st.fragment
+def assessment_list():
+    """Tests with their Edit / Archive / Delete actions; each reruns only this list."""
+    db = load_db()
+    st.session_state['all_tests'] = list(db.get("tests", []))
+    if not st.session_state['all_tests']: st.info("Empty")
+    else:
+        for idx, t in enumerate(st.session_state['all_tests']):
+            with st.container(border=True):
+                c1, c2, c3, c4, c5 = st.columns([3, 1, 1, 1, 1])
+                c1.markdown(f"**{t['test_name']}**"); c2.markdown(f"{t['total_marks']} marks")
+                if c3.button("📝 Edit", key=f"v_{idx}"): edit_json_dialog(idx)
+                if c4.button("🗄️ Archive", key=f"a_{idx}", help="Close the exam: results stay visible to students, read-only"):
+                    archive_test_in_db(t['test_id'])
+                if c5.button("🗑️ Delete", key=f"d_{idx}"): delete_test_from_db(idx)
+
+    archived = list_archived()
+    if archived:
+        with st.expander(f"🗄️ Archived ({len(archived)})"):
+            for tid, meta in archived.items():
+                c1, c2, c3 = st.columns([3, 2, 1])
+                c1.markdown(f"**{meta.get('test_name') or tid}**")
+                c2.caption(f"{meta.get('submissions', 0)} papers · archived {meta.get('archived_at', '')[:10]}")
+                if c3.button("♻️ Restore", key=f"r_{tid}"): restore_test_in_db(tid)
+
 # -----------------------------------------------------------------------------
 # 4. MAIN LAYOUT
 # -----------------------------------------------------------------------------
@@ -361,110 +572,7 @@ with tab_create:
             st.session_state['current_test_builder']['questions'][current_q_id]["max_marks"] = q_marks
 
     with col2:
-        st.subheader(f"3. Rubric for {current_q_id}")
-        curr_q_data = st.session_state['current_test_builder']['questions'][current_q_id]
-        
-        with st.expander("➕ Add New Key Point", expanded=True):
-            c_a, c_b = st.columns([2, 1])
-            with c_a:
-                kp_concept = st.text_input("Concept / Description", key=f"con_{current_q_id}")
-            with c_b:
-                kp_marks = st.number_input("Marks", min_value=0.5, step=0.5, value=1.0, key=f"mk_{current_q_id}")
-
-            kp_type = st.selectbox("Response Type", ["Text / Theory", "Equation / Math", "Flowchart / Diagram", "Final Answer"], key=f"type_{current_q_id}")
-            
-            uploaded_flowchart = None
-            evidence_phrases = ""
-            expected_eq = ""
-            expected_final = ""
-
-            if kp_type == "Text / Theory":
-                evidence_phrases = st.text_area("Evidence Phrases", key=f"evi_{current_q_id}")
-            elif kp_type == "Equation / Math":
-                expected_eq = st.text_input("Expected Equation", key=f"eqn_{current_q_id}")
-            elif kp_type == "Final Answer":
-                expected_final = st.text_input("Expected Final Value", key=f"fin_{current_q_id}")
-            elif kp_type == "Flowchart / Diagram":
-                st.info("ℹ️ Upload Answer Key")
-                uploaded_flowchart = st.file_uploader("Upload Solution", type=['png', 'jpg'], key=f"file_{current_q_id}")
-            
-            if st.button("Add Key Point", type="primary", key=f"btn_{current_q_id}"):
-                if not kp_concept:
-                    st.error("Concept required")
-                else:
-                    new_kp = {
-                        "id": f"k{len(curr_q_data['key_points']) + 1}",
-                        "concept": kp_concept,
-                        "marks": kp_marks,
-                        "acceptable_modalities": []
-                    }
-
-                    if kp_type == "Text / Theory":
-                        new_kp["acceptable_modalities"] = ["text"]
-                        new_kp["evidence_phrases"] = [p.strip() for p in evidence_phrases.split(",") if p.strip()]
-                    elif kp_type == "Equation / Math":
-                        new_kp["acceptable_modalities"] = ["equation"]
-                        new_kp["expected_equation"] = expected_eq
-                    elif kp_type == "Final Answer":
-                        new_kp["acceptable_modalities"] = ["final_answer", "equation"]
-                        new_kp["expected_final_answer"] = expected_final
-                    
-                    # --- FLOWCHART LOGIC (WITH SCALING) ---
-                    elif kp_type == "Flowchart / Diagram":
-                        if not uploaded_flowchart:
-                            st.error("Upload a file first.")
-                            st.stop()
-                        
-                        with st.spinner("🧠 Analyzing diagram..."):
-                            try:
-                                api_key = st.secrets.get("GEMINI_API_KEY", "")
-                                teacher_response = extract_teacher_graph(uploaded_flowchart, api_key)
-                                rules = teacher_response.get("key_points", [])
-                                
-                                if rules:
-                                    # Marks Scaling Logic
-                                    raw_total = sum(r.get("marks", 1) for r in rules)
-                                    if raw_total > 0 and kp_marks > 0:
-                                        factor = kp_marks / raw_total
-                                        running = 0
-                                        for i, r in enumerate(rules):
-                                            if i == len(rules) - 1:
-                                                r["marks"] = round(kp_marks - running, 3)
-                                            else:
-                                                val = round(r.get("marks", 1) * factor, 3)
-                                                r["marks"] = val
-                                                running += val
-                                        st.toast(f"Scaled rules to match {kp_marks} marks.", icon="⚖️")
-                                
-                                new_kp["acceptable_modalities"] = ["flowchart"]
-                                new_kp["type"] = "flowchart_analysis"
-                                new_kp["evaluation_rules"] = rules
-                            except Exception as e:
-                                st.error(str(e)); st.stop()
-
-                    curr_q_data['key_points'].append(new_kp)
-                    st.success("Added!")
-                    st.rerun()
-
-        if curr_q_data['key_points']:
-            total_kp = sum(kp['marks'] for kp in curr_q_data['key_points'])
-            for idx, kp in enumerate(curr_q_data['key_points']):
-                with st.container():
-                    c_info, c_del = st.columns([0.9, 0.1])
-                    with c_info:
-                        st.markdown(f"""
-                        <div class="keypoint-card">
-                            <div class="keypoint-header">{kp['id']}: {kp['concept']} ({kp['marks']})</div>
-                            <div class="keypoint-meta">{kp['acceptable_modalities']}</div>
-                        </div>""", unsafe_allow_html=True)
-                    with c_del:
-                        if st.button("Delete", key=f"del_{current_q_id}_{idx}"):
-                            curr_q_data['key_points'].pop(idx); st.rerun()
-            
-            if abs(total_kp - curr_q_data['max_marks']) > 0.01:
-                st.warning(f"⚠️ Mismatch: Key points total **{total_kp}**, but Question Marks set to **{curr_q_data['max_marks']}**.")
-            else:
-                st.success("✅ Marks Matched")
+        rubric_builder(current_q_id)
 
     st.divider()
     if st.button("💾 Save & Publish Test", type="primary", use_container_width=True):
@@ -480,7 +588,7 @@ with tab_create:
             }
             
             st.session_state['all_tests'].append(final_obj)
-            db = load_db()
+            db = thaw(load_db())
             db['tests'].append(final_obj)
             save_db(db)
             
@@ -499,16 +607,7 @@ with tab_create:
 # =============================================================================
 with tab_manage:
     st.subheader("📂 Assessments")
-    db = load_db()
-    st.session_state['all_tests'] = db.get("tests", [])
-    if not st.session_state['all_tests']: st.info("Empty")
-    else:
-        for idx, t in enumerate(st.session_state['all_tests']):
-            with st.container(border=True):
-                c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
-                c1.markdown(f"**{t['test_name']}**"); c2.markdown(f"{t['total_marks']} marks")
-                if c3.button("📝 Edit", key=f"v_{idx}"): edit_json_dialog(idx)
-                if c4.button("🗑️ Delete", key=f"d_{idx}"): delete_test_from_db(idx)
+    assessment_list()
 
 # =============================================================================
 # TAB 3: GRADE / EXAM CONTROL (Merged Logic)
@@ -518,7 +617,7 @@ with tab_control:
     
     # 1. Load Data from Real DB
     db = load_db()
-    st.session_state['all_tests'] = db.get("tests", [])
+    st.session_state['all_tests'] = list(db.get("tests", []))
     
     if not st.session_state['all_tests']:
         st.info("No exams created yet.")
@@ -546,19 +645,60 @@ with tab_control:
             else:
                 st.warning("🔒 **Status: Hidden** (Grading in progress)")
 
+        # --- GRADING PERFORMANCE ---
+        with st.expander("⏱️ Grading Performance"):
+            totals, per_stage, kp_rows = summarize_perf(
+                [s.get("graded_result") for s in get_submissions_for_test(active_tid)]
+            )
+            if not totals.get("papers") or not kp_rows:
+                st.info("No timing data yet. Grade some papers to see where the time goes.")
+            else:
+                m1, m2, m3, m4 = st.columns(4)
+                m1.metric("Papers Timed", totals["papers"])
+                m2.metric("Avg / Paper", f"{totals['wall_ms'] / totals['papers'] / 1000:.2f} s")
+                m3.metric("LLM Calls", int(totals.get("llm_calls", 0)))
+                m4.metric("Tokens", int(totals.get("tokens", 0)))
+                if totals.get("cache_hits"):
+                    st.caption(f"Cache hits: {int(totals['cache_hits'])}")
+
+                stage_df = pd.DataFrame(
+                    [{"stage": k, "total_s": round(v / 1000, 2)} for k, v in sorted(per_stage.items(), key=lambda kv: -kv[1])]
+                )
+                if not stage_df.empty:
+                    stage_df["share_%"] = (stage_df["total_s"] / (totals["wall_ms"] / 1000) * 100).round(1)
+                    st.markdown("**Time by stage**")
+                    st.dataframe(stage_df, use_container_width=True, hide_index=True)
+
+                st.markdown("**Time by key point**")
+                st.dataframe(pd.DataFrame(kp_rows), use_container_width=True, hide_index=True)
+
+        # --- NEAR-DUPLICATE ANSWERS ---
+        with st.expander("🧬 Near-Duplicate Answers"):
+            exam_subs = get_submissions_for_test(active_tid)
+            clusters_by_q = find_clusters(active_tid, exam_subs)
+            if not clusters_by_q:
+                st.info("No near-identical text answers found for this exam.")
+            else:
+                names = {s.get("student_id"): s.get("student_name", s.get("student_id")) for s in exam_subs}
+                for qid, clusters in clusters_by_q.items():
+                    st.markdown(f"**{qid}** — {len(clusters)} cluster(s)")
+                    st.dataframe(pd.DataFrame([{
+                        "students": ", ".join(f"{names.get(sid, sid)} ({sid})" for sid in c["students"]),
+                        "size": c["size"],
+                        "min_similarity": c["min_similarity"],
+                        "mean_similarity": c["mean_similarity"],
+                    } for c in clusters]), use_container_width=True, hide_index=True)
+
         st.divider()
 
         # --- STUDENT LIST ---
         current_teacher_id = st.session_state.get('teacher_id', '').strip()
         
-        all_subs = db.get("submissions", [])
-        
-        # Filter 1: By Test ID
+        # Filter 1: By Test ID (its partition only)
         # Filter 2: By Assigned Teacher ID (Must match current user)
         test_submissions = [
-            s for s in all_subs 
-            if s.get("test_id") == active_tid 
-            and s.get("assigned_teacher_id") == current_teacher_id
+            s for s in get_submissions_for_test(active_tid)
+            if s.get("assigned_teacher_id") == current_teacher_id
         ]
         
         if not current_teacher_id:
@@ -572,34 +712,4 @@ with tab_control:
             st.markdown("---")
 
             for sub in test_submissions:
-                sid = sub.get("student_id", "Unknown")
-                name = sub.get("student_name", "Unknown")
-                is_graded = sub.get("graded_result") is not None
-                
-                grade_str = "-"
-                if is_graded:
-                    score = sum(q['score'] for q in sub['graded_result'])
-                    max_score = sum(q['max_score'] for q in sub['graded_result'])
-                    grade_str = f"{score} / {max_score}"
-
-                c1, c2, c3, c4, c5 = st.columns([1, 2, 1, 1, 2])
-                c1.write(sid)
-                c2.write(name)
-                
-                with c3:
-                    st.markdown('<span class="status-submitted">Submitted</span>', unsafe_allow_html=True)
-                
-                with c4:
-                    st.markdown(f'<span class="grade-badge">{grade_str}</span>', unsafe_allow_html=True)
-                
-                with c5:
-                    b1, b2 = st.columns(2)
-                    with b1:
-                        if st.button("Upload", key=f"up_{sid}_{active_tid}"): 
-                            upload_for_student_dialog(sid, active_tid)
-                    with b2:
-                        # --- VERIFY BUTTON OPENS REVIEW DIALOG ---
-                        if st.button("Review", key=f"ver_{sid}_{active_tid}"):
-                            review_submission_dialog(sid, active_tid)
-                
-                st.markdown("---")
\ No newline at end of file
+                submission_row(sub.get("student_id", "Unknown"), active_tid)
\ No newline at end of file
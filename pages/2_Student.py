@@ -1,17 +1,16 @@
 import streamlit as st
-from PIL import Image
-import io
-import fitz  # PyMuPDF
-import base64
-import re
+import copy
+import os
 import json
 import pandas as pd
-from openai import OpenAI
 
 # IMPORT THE DATABASE HANDLER
 try:
     # Added load_db here 
-    from backend.db_handler import submit_student_answers, load_db
+    from backend.db_handler import get_submissions_for_student, get_test, load_db
+    from backend.submission_pipeline import get_pipeline, submit_for_grading
+    from backend.answer_extractor import extract_answer_obj, extract_pdf_answers
+    from backend.page_artifacts import PageArtifact, PageArtifactCache
 except ImportError:
     st.error("⚠️ Error: Could not import 'backend/db_handler.py'. Make sure the file exists.")
     st.stop()
@@ -20,149 +19,21 @@ except ImportError:
 # 1. BACKEND LOGIC
 # -----------------------------------------------------------------------------
 
-def get_openai_client():
-    api_key = st.secrets.get("OPENROUTER_API_KEY")
-    if not api_key:
-        st.error("⚠️ OpenRouter API Key missing in secrets.toml")
-        st.stop()
-    
-    return OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=api_key,
-    )
-
-def pdf_to_images(pdf_file, dpi=200):
-    """Converts uploaded PDF file (bytes) to PIL Images."""
-    doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-    images = []
-    for page in doc:
-        pix = page.get_pixmap(dpi=dpi)
-        img = Image.open(io.BytesIO(pix.tobytes("png")))
-        images.append(img)
-    return images
-import requests # Make sure to pip install requests
-
-def upload_to_imgbb(image_file):
-    """Uploads image to ImgBB and returns the public URL."""
-    api_key = st.secrets["IMGBB_API_KEY"]
-    url = "https://api.imgbb.com/1/upload"
-    
-    # Prepare payload
-    payload = {
-        "key": api_key,
-        "expiration": 0 # 0 = Never expire
-    }
-    
-    # Send image file
-    files = {
-        "image": image_file.getvalue()
-    }
-    
-    try:
-        response = requests.post(url, data=payload, files=files)
-        if response.status_code == 200:
-            return response.json()["data"]["url"]
-        else:
-            st.error(f"Upload failed: {response.text}")
-            return None
-    except Exception as e:
-        st.error(f"Error uploading: {e}")
-        return None
-def image_to_base64(image: Image.Image):
-    """Converts PIL Image to Base64 string."""
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-def clean_json_text(text):
-    """Cleans Markdown code blocks from LLM response."""
-    text = re.sub(r"```json\s*", "", text, flags=re.IGNORECASE)
-    text = re.sub(r"```", "", text)
-    return text.strip()
-
-def extract_answer_obj_from_image(image: Image.Image, question_id: str):
-    """Sends image to LLM to extract student answer as JSON."""
-    client = get_openai_client()
-    img_base64 = image_to_base64(image)
-
-    prompt = f"""
-    You are an academic answer extractor.
-    The image contains a QUESTION and its ANSWER.
-
-    TASK:
-    1. Extract ONLY the student's answer for Question ID: {question_id}.
-    2. Separate content into:
-       "text": ["List all and any sentences or text explanations written by the student.",
-            "Split distinct points into separate strings."],
-       "equations": [" - Write ALL chemical formulas and equations in STANDARD ASCII TEXT.
-        - DO NOT use Unicode subscripts or superscripts.
-        - Convert subscripts explicitly to numbers.
-
-      Examples:
-        H₂SO₄ → H2SO4
-        CH₃COOH → CH3COOH
-        C₂H₅OH → C2H5OH
-        H₂O → H2O
-      Use standard text representation (e.g., 'x^2 + 2x = 5', 'H2 + O2 -> H2O').
-      - Use '->' for reactions (do NOT use →).
-      - If a catalyst is written above the arrow, format as:
-          Reactants -(<catalyst that is written above arrow in equation>)-> Products
-      - Write ions as:
-          Fe3+, Fe2+, e-, Fe3e+
-      - Preserve equation structure, but normalize symbols.
-
-      If the student writes unclear chemistry, make the closest reasonable interpretation."],
-       "flowcharts/graph": [" Analyze the flowchart carefully.
-          If some text is unclear, make your best reasonable guess. " return in format:
-            {{
-                "nodes": [{{"id": "n1", "text": "Start", "shape": "oval/rect/diamond"}}],
-                "edges": [{{"source": "n1", "target": "n2", "label": "Yes/No"}}]
-            }}
-       ],
-       "final_answer": "Extract final result (e.g., 'x=5'). Return null if not found."
-
-    3. Do NOT hallucinate. If section is empty, return empty list [].
-    4. OUTPUT STRICT JSON ONLY.
-
-    {{
-      "question_id": "{question_id}",
-      "text": [],
-      "equations": [],
-      "flowcharts": [],
-      "final_answer": null
-    }}
-    """
-
-    try:
-        response = client.chat.completions.create(
-            model="google/gemini-2.0-flash-001",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{img_base64}"}}
-                    ]
-                }
-            ],
-            temperature=0
-        )
-       # --- DEBUGGING & SAFETY CHECKS ---
-        if not response or not response.choices:
-            return {"error": "API returned an empty response. Try again.", "question_id": question_id}
-        
-        message_content = response.choices[0].message.content
-        
-        if not message_content:
-             return {"error": "Model generated empty text.", "question_id": question_id}
-
-        cleaned = clean_json_text(message_content)
-        return json.loads(cleaned)
-
-    except Exception as e:
-        # This prints the specific error to your terminal for debugging
-        print(f"Extraction Error: {e}")
-        return {"error": str(e), "question_id": question_id}
+# Upload, storage and auto-grading of confirmed submissions run in
+# backend/submission_pipeline.py; this page only extracts for review.
+
+def show_pipeline_status():
+    """Progress of this session's last confirmed submission."""
+    job_id = st.session_state.get('pipeline_job')
+    job = get_pipeline().status(job_id) if job_id else None
+    if not job:
+        return
+    if job["status"] == "done":
+        st.success("✅ Saved and provisionally graded. Your teacher will review it.")
+    elif job["status"] == "failed":
+        st.error(f"Submission failed ({job['error']}). Please submit again.")
+    else:
+        st.info(f"⏳ Processing in the background: {job['status']}...")
 
 # -----------------------------------------------------------------------------
 # 2. PAGE CONFIGURATION & STYLING
@@ -213,7 +84,7 @@ with tab_submit:
 
     if not available_tests:
         st.warning("⚠️ No active exams found. Please ask your teacher to publish a test.")
-        st.stop()
+        # No st.stop(): results of archived exams are still shown in the next tab
     else:
         # Create a dictionary: "Test Name" -> "Test ID"
         test_options = {f"{t['test_name']}": t['test_id'] for t in available_tests}
@@ -239,9 +110,10 @@ with tab_submit:
 
                 if uploaded_file:
                     if st.button("🚀 Process & Extract Answers", type="primary"):
-                        st.session_state['file_bytes'] = uploaded_file.getvalue()   # <--- NEW
-                        st.session_state['file_type'] = uploaded_file.type         # <--- NEW
-                        
+                        # Rendered pages / crops of this file, reused by preview and submit
+                        artifacts = PageArtifactCache(uploaded_file.getvalue(), uploaded_file.type)
+                        st.session_state['page_artifacts'] = artifacts
+
                         st.session_state['extracted_data'] = [] # Clear previous
 
                         with st.spinner("🤖 Reading handwriting, diagrams, and equations..."):
@@ -250,24 +122,27 @@ with tab_submit:
                                 
                                 # CASE A: PDF Processing (Multi-page)
                                 if uploaded_file.type == "application/pdf":
-                                    images = pdf_to_images(uploaded_file)
                                     progress_bar = st.progress(0)
-                                    
-                                    for i, img in enumerate(images):
-                                        # Assumption: Page 1 = Q1, Page 2 = Q2, etc.
-                                        current_qid = f"Q{i+1}"
-                                        st.toast(f"Processing Page {i+1} ({current_qid})...")
-                                        
-                                        data = extract_answer_obj_from_image(img, current_qid)
-                                        extracted_results.append(data)
-                                        progress_bar.progress((i + 1) / len(images))
-                                        
+
+                                    def on_question(i, n, qid, route):
+                                        how = "text layer" if route == "text_layer" else "vision model"
+                                        st.toast(f"Processing {qid} via {how}...")
+                                        progress_bar.progress((i + 1) / n)
+
+                                    # Questions are found from their headers (Q3 / 3. / Ans 3), so an
+                                    # answer may span pages or share one. Typed answers are parsed from
+                                    # the PDF text; only scanned / handwritten ones go to the vision model.
+                                    extracted_results, routing = extract_pdf_answers(
+                                        uploaded_file.getvalue(), on_question=on_question, artifacts=artifacts)
+                                    st.session_state['routing_stats'] = routing
                                     progress_bar.empty()
-                                
+
                                 # CASE B: Image Processing (Single Question)
                                 else:
-                                    image = Image.open(uploaded_file)
-                                    data = extract_answer_obj_from_image(image, q_id_input)
+                                    artifact = PageArtifact.from_upload(uploaded_file.getvalue(), uploaded_file.type)
+                                    artifacts.put(q_id_input, artifact)
+                                    data = extract_answer_obj(artifact, q_id_input)
+                                    st.session_state['routing_stats'] = None
                                     extracted_results.append(data)
                                 
                                 # Save to session
@@ -278,6 +153,23 @@ with tab_submit:
                             except Exception as e:
                                 st.error(f"Error during processing: {e}")
 
+                    # Skip the review: extraction runs in the background pipeline too
+                    if st.button("📨 Submit without reviewing", help="Extraction, upload and grading happen in the background"):
+                        try:
+                            st.session_state['pipeline_job'] = submit_for_grading(
+                                st.session_state['student_id'], selected_test_id,
+                                student_name=st.session_state['student_name'],
+                                file_bytes=uploaded_file.getvalue(),
+                                file_type=uploaded_file.type,
+                                question_id=q_id_input,
+                            )
+                        except Exception as e:
+                            st.error(f"Your submission could not be saved ({e}). Please try again.")
+                        else:
+                            st.success(f"Submitted to {selected_test_name}! Your answers are being read in the background.")
+
+                show_pipeline_status()
+
         # --- RIGHT COLUMN: PREVIEW & RESULTS ---
         # --- RIGHT COLUMN: PREVIEW & EDIT ---
         with col2:
@@ -299,6 +191,12 @@ with tab_submit:
                 """, unsafe_allow_html=True)
 
             else:
+                routing = st.session_state.get('routing_stats')
+                if routing:
+                    st.caption(f"⚡ {routing['questions']} question(s) found on {routing['pages']} page(s): "
+                               f"{routing['text_layer']} read directly from the PDF text, {routing['vision']} vision call(s) "
+                               f"({routing['vision_calls_avoided']} avoided).")
+
                 # TABS for multiple extracted answers (e.g. Q1, Q2 from PDF)
                 tabs = st.tabs([f"📄 {item.get('question_id', 'Unknown')}" for item in st.session_state['extracted_data']])
                 
@@ -317,6 +215,15 @@ with tab_submit:
                                 with st.container(border=True):
                                     st.caption("Values below are Read-Only. Toggle 'Enable Editing' above to fix mistakes.")
                                     st.markdown(f"**Question ID:** `{data.get('question_id')}`")
+                                    if data.get("extraction") == "text_layer":
+                                        st.caption("📄 Read from the PDF's text layer (no AI call).")
+
+                                    artifacts = st.session_state.get('page_artifacts')
+                                    if artifacts is not None and data.get("question_id") in artifacts:
+                                        with st.expander("🖼️ Source", expanded=False):
+                                            # Cached crop: rendered at most once per session
+                                            artifact = artifacts.get(data["question_id"])
+                                            st.image(artifact.data, caption=f"{artifact.width}×{artifact.height}px")
                                     
                                     # Text
                                     if data.get("text"):
@@ -413,72 +320,21 @@ with tab_submit:
                 # Ensure we are submitting the LATEST session state data (which includes edits)
                 # Ensure we are submitting the LATEST session state data
                 if st.button("✅ Confirm & Submit for Grading", type="primary", use_container_width=True, key=f"submit_btn_{i}"):            
-                    # --- STEP 1: RESTORE IMAGE FROM SESSION STATE ---
-                    img = None
+                    # The answers are saved before this returns; image upload and a provisional
+                    # auto-grade run in the background pipeline.
                     try:
-                        # Check if we have the file in memory
-                        if 'file_bytes' not in st.session_state:
-                            st.error("⚠️ File session expired. Please re-upload and click Process again.")
-                            st.stop()
-
-                        # Reconstruct the file from bytes
-                        file_bytes = st.session_state['file_bytes']
-                        file_type = st.session_state['file_type']
-                        reconstructed_file = io.BytesIO(file_bytes)
-
-                        # Handle PDF vs Image
-                        if file_type == "application/pdf":
-                            doc = fitz.open(stream=reconstructed_file.read(), filetype="pdf")
-                            if i < len(doc):
-                                pix = doc[i].get_pixmap(dpi=200)
-                                img = Image.open(io.BytesIO(pix.tobytes("png")))
-                            else:
-                                st.error(f"Page {i+1} not found in PDF.")
-                                st.stop()
-                        else:
-                            img = Image.open(reconstructed_file)
-
+                        job_id = submit_for_grading(
+                            st.session_state['student_id'], selected_test_id,
+                            student_name=st.session_state['student_name'],
+                            answers=copy.deepcopy(st.session_state['extracted_data']),
+                            artifacts=st.session_state.get('page_artifacts'),
+                        )
                     except Exception as e:
-                        st.error(f"Error restoring image: {e}")
-                        st.stop()
-                    
-                    # --- STEP 2: UPLOAD TO IMGBB FIRST ---
-                    image_url = None
-                    with st.spinner("☁️ Uploading image to cloud..."):
-                        try:
-                            buf = io.BytesIO()
-                            img.save(buf, format="PNG")
-                            image_url = upload_to_imgbb(buf)
-                            
-                            if not image_url:
-                                st.error("Failed to upload image. Please check API key.")
-                                st.stop()
-                                
-                            # CRITICAL FIX: Update the session state data with the URL *BEFORE* submitting
-                            st.session_state['extracted_data'][i]["source_image"] = image_url
-                            
-                        except Exception as e:
-                            st.error(f"Upload Error: {e}")
-                            st.stop()
-
-                    # --- STEP 3: CREATE PACKAGE & SUBMIT TO DB ---
-                    submission_package = {
-                        "student_name": st.session_state['student_name'],
-                        "student_id": st.session_state['student_id'],
-                        "test_id": selected_test_id,
-                        "answers": st.session_state['extracted_data'], # This now contains the URL!
-                        "status": "Submitted",
-                        "graded_result": None 
-                    }
-                    
-                    if submit_student_answers(submission_package):
+                        st.error(f"Your submission could not be saved ({e}). Please try again.")
+                    else:
+                        st.session_state['pipeline_job'] = job_id
                         st.balloons()
                         st.success(f"Submitted to {selected_test_name} successfully!")
-                        # Optional: Clear state to prevent double submission
-                        # st.session_state['extracted_data'] = []
-                        # st.rerun()
-                    else:
-                        st.error("Failed to save submission to database.")
 
 # =============================================================================
 # TAB 2: VIEW RESULTS (NEW FEATURE)
@@ -486,12 +342,10 @@ with tab_submit:
 with tab_results:
     st.subheader("🏆 Your Graded Results")
     
-    # Load latest DB data
-    db = load_db()
     current_student_id = st.session_state['student_id']
     
-    # 1. Filter submissions for this specific student
-    my_submissions = [s for s in db.get("submissions", []) if s.get("student_id") == current_student_id]
+    # 1. This student's submissions (keyed lookup; archived exams load only if the student sat them)
+    my_submissions = get_submissions_for_student(current_student_id, include_archived=True)
     
     if not my_submissions:
         st.info("You haven't submitted any assignments yet.")
@@ -499,7 +353,7 @@ with tab_results:
         for sub in my_submissions:
             # 2. Get Test Info (Name & Published Status)
             test_id = sub.get("test_id")
-            test_meta = next((t for t in db.get("tests", []) if t["test_id"] == test_id), None)
+            test_meta = get_test(test_id)
             
             if test_meta:
                 test_name = test_meta.get("test_name", "Unknown Assessment")
@@ -511,7 +365,8 @@ with tab_results:
                     
                     # 3. Check Publishing Status
                     if is_published:
-                        if sub.get("graded_result"):
+                        # Auto-grades are provisional until a teacher has reviewed them
+                        if sub.get("graded_result") and not sub.get("auto_graded"):
                             # Calculate Total Score
                             user_score = sum(q['score'] for q in sub['graded_result'])
                             total_max = sum(q['max_score'] for q in sub['graded_result'])
@@ -531,6 +386,10 @@ with tab_results:
                                             if rule.get('reason'):
                                                 st.caption(f"&nbsp;&nbsp;&nbsp;&nbsp;*Feedback: {rule['reason']}*")
                                     st.divider()
+                        elif sub.get("status") == "Extraction Failed":
+                            c2.error("⚠️ Upload Unreadable")
+                            c3.write("-- / --")
+                            st.caption("Your answers could not be read. Please ask your teacher to upload your paper again.")
                         else:
                             c2.warning("⏳ Grading in Progress")
                             c3.write("-- / --")
@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
-from backend.db_handler import load_db, assign_paper_to_teacher
+from streamlit.errors import StreamlitAPIException
+from backend.db_handler import load_db, get_submission, assign_paper_to_teacher
 
 st.set_page_config(page_title="Admin Console", page_icon="🛡️", layout="wide")
 
@@ -13,6 +14,51 @@ submissions = db.get("submissions", [])
 tests = db.get("tests", [])
 test_map = {t['test_id']: t['test_name'] for t in tests}
 
+# --- ASSIGNMENT ROW ---
+def rerun_fragment():
+    """Reruns the calling fragment; the whole page if this click arrived in a full-app run."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+@st.fragment
+def assignment_row(student_id, test_id):
+    """One unassigned paper; assigning it reruns only this row, not the whole inbox."""
+    sub = get_submission(student_id, test_id)
+    if sub is None:
+        return
+    with st.container(border=True):
+        if sub.get("assigned_teacher_id"):
+            st.success(f"✅ {sub.get('student_name', student_id)} → **{sub['assigned_teacher_id']}**")
+            return
+
+        c1, c2, c3, c4 = st.columns([2, 2, 2, 1])
+        
+        test_name = test_map.get(test_id, "Unknown Test")
+        
+        with c1:
+            st.markdown(f"**Student:** {sub.get('student_name', 'Unknown')}")
+            st.caption(f"ID: `{student_id}`")
+        
+        with c2:
+            st.markdown(f"**Exam:** {test_name}")
+            st.caption(f"Status: {sub.get('status', 'Submitted')}")
+
+        with c3:
+            # Input for Teacher ID (Teacher must use this same ID in their dashboard)
+            t_id = st.text_input("Assign to Teacher ID:", placeholder="e.g. T-MATH-01", key=f"tid_{student_id}_{test_id}")
+
+        with c4:
+            st.write("") # Spacer
+            if st.button("👉 Assign", key=f"btn_{student_id}_{test_id}", type="primary"):
+                if t_id:
+                    assign_paper_to_teacher(student_id, test_id, t_id)
+                    st.toast(f"Assigned to {t_id}!", icon="🚀")
+                    rerun_fragment()
+                else:
+                    st.error("Enter ID")
+
 # --- TABS ---
 tab_inbox, tab_status = st.tabs(["📥 Pending Assignment", "📊 Global Status"])
 
@@ -26,33 +72,8 @@ with tab_inbox:
     if not unassigned_subs:
         st.success("✅ All submission have been assigned!", icon="🎉")
     else:
-        for idx, sub in enumerate(unassigned_subs):
-            with st.container(border=True):
-                c1, c2, c3, c4 = st.columns([2, 2, 2, 1])
-                
-                test_name = test_map.get(sub['test_id'], "Unknown Test")
-                
-                with c1:
-                    st.markdown(f"**Student:** {sub.get('student_name', 'Unknown')}")
-                    st.caption(f"ID: `{sub['student_id']}`")
-                
-                with c2:
-                    st.markdown(f"**Exam:** {test_name}")
-                    st.caption(f"Status: {sub.get('status', 'Submitted')}")
-
-                with c3:
-                    # Input for Teacher ID (Teacher must use this same ID in their dashboard)
-                    t_id = st.text_input("Assign to Teacher ID:", placeholder="e.g. T-MATH-01", key=f"tid_{idx}")
-
-                with c4:
-                    st.write("") # Spacer
-                    if st.button("👉 Assign", key=f"btn_{idx}", type="primary"):
-                        if t_id:
-                            assign_paper_to_teacher(sub['student_id'], sub['test_id'], t_id)
-                            st.toast(f"Assigned to {t_id}!", icon="🚀")
-                            st.rerun()
-                        else:
-                            st.error("Enter ID")
+        for sub in unassigned_subs:
+            assignment_row(sub['student_id'], sub['test_id'])
 
 # --- TAB 2: MONITOR PROGRESS ---
 with tab_status:
@@ -63,7 +84,8 @@ with tab_status:
         for s in submissions:
             # Determine Status
             status = "Pending Admin"
-            if s.get("graded_result"): status = "✅ Graded"
+            if s.get("auto_graded"): status = "🤖 Auto-Graded (review pending)"
+            elif s.get("graded_result"): status = "✅ Graded"
             elif s.get("assigned_teacher_id"): status = "⏳ With Teacher"
 
             # Calculate Score if graded
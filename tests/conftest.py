@@ -0,0 +1,9 @@
+import pytest
+
+from backend import db_handler
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """An empty DB (and its sidecar files) under a temporary directory."""
+    monkeypatch.setattr(db_handler, "DB_FILE", str(tmp_path / "school_data.json"))
+    return tmp_path
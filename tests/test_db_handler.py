@@ -0,0 +1,89 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from backend import db_handler
+
+LEGACY = {
+    "tests": [{"test_id": "t1", "test_name": "Algebra"}, {"test_id": "t2", "test_name": "Cells"}],
+    "submissions": [
+        {"student_id": "s1", "test_id": "t1", "answers": [], "graded_result": None},
+        {"student_id": "s2", "test_id": "t1", "answers": [], "graded_result": None},
+        {"student_id": "s1", "test_id": "t2", "answers": [], "graded_result": None},
+    ],
+}
+
+def test_monolithic_file_is_split_into_partitions(tmp_db):
+    with open(db_handler.DB_FILE, "w") as f:
+        json.dump(LEGACY, f)
+
+    db = db_handler.load_db()
+    assert db_handler.thaw(db) == LEGACY
+    with open(db_handler.DB_FILE) as f:
+        manifest = json.load(f)
+    assert manifest == {"format": db_handler.MANIFEST_FORMAT, "active": ["t1", "t2"], "archived": {}}
+    assert os.path.exists(db_handler._part_path("t1")) and os.path.exists(db_handler._part_path("t2"))
+    with open(f"{db_handler.DB_FILE}.monolithic.bak") as f:
+        assert json.load(f) == LEGACY
+
+    assert [s["test_id"] for s in db_handler.get_submissions_for_student("s1")] == ["t1", "t2"]
+    assert db_handler.get_submission("s2", "t1")["student_id"] == "s2"
+
+def test_empty_legacy_file_becomes_a_manifest(tmp_db):
+    with open(db_handler.DB_FILE, "w") as f:
+        json.dump({"tests": [], "submissions": []}, f)
+    assert db_handler.thaw(db_handler.load_db()) == {"tests": [], "submissions": []}
+    with open(db_handler.DB_FILE) as f:
+        assert json.load(f) == db_handler._empty_manifest()
+
+def test_shipped_db_file_is_used_as_is(tmp_db):
+    shipped = os.path.join(os.path.dirname(__file__), os.pardir, "school_data.json")
+    shutil.copy(shipped, db_handler.DB_FILE)
+    with open(db_handler.DB_FILE, "rb") as f:
+        before = f.read()
+    db_handler.load_db()
+    with open(db_handler.DB_FILE, "rb") as f:
+        assert f.read() == before
+    assert not os.path.exists(f"{db_handler.DB_FILE}.monolithic.bak")
+
+def test_archived_test_round_trip(tmp_db):
+    db_handler.save_db(LEGACY)
+    assert db_handler.archive_test("t1")
+    assert [t["test_id"] for t in db_handler.load_db()["tests"]] == ["t2"]
+    assert len(db_handler.get_submissions_for_student("s1", include_archived=True)) == 2
+    assert db_handler.restore_test("t1")
+    assert {t["test_id"] for t in db_handler.load_db()["tests"]} == {"t1", "t2"}
+
+def test_snapshots_are_read_only(tmp_db):
+    db_handler.save_db(LEGACY)
+    db = db_handler.load_db()
+    with pytest.raises(db_handler.ReadOnlyError):
+        db["submissions"][0]["graded_result"] = []
+    with pytest.raises(db_handler.ReadOnlyError):
+        db["tests"].append({})
+    editable = db_handler.thaw(db)
+    editable["submissions"][0]["graded_result"] = []
+    assert db_handler.load_db()["submissions"][0]["graded_result"] is None
+
+def test_keyed_writes_touch_one_submission(tmp_db):
+    db_handler.save_db(LEGACY)
+    db_handler.upsert_submission({"student_id": "s1", "test_id": "t1", "answers": ["new"], "graded_result": None})
+    assert [s["student_id"] for s in db_handler.get_submissions_for_test("t1")] == ["s1", "s2"]
+    assert db_handler.get_submission("s1", "t1")["answers"] == ["new"]
+    assert db_handler.get_submission("s1", "t2")["answers"] == []
+
+    assert db_handler.delete_submission("s2", "t1")
+    assert db_handler.get_submission("s2", "t1") is None
+    assert not db_handler.delete_submission("s2", "t1")
+
+def test_deleted_submission_leaves_the_near_duplicate_index(tmp_db):
+    from backend import near_duplicates
+
+    answers = [{"question_id": "Q1", "text": ["water evaporates from the sea and condenses into clouds"]}]
+    for sid in ("s1", "s2"):
+        db_handler.submit_student_answers({"student_id": sid, "test_id": "t1", "answers": answers, "graded_result": None})
+    assert near_duplicates.find_clusters("t1")["Q1"][0]["students"] == ["s1", "s2"]
+    db_handler.delete_submission("s2", "t1")
+    assert near_duplicates.find_clusters("t1") == {}
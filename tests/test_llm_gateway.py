@@ -0,0 +1,52 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from backend import llm_gateway
+from backend.llm_gateway import ProviderGateway
+
+class Unavailable(Exception):
+    status_code = 503
+
+    def __init__(self, retry_after=None):
+        super().__init__("unavailable")
+        self.response = SimpleNamespace(headers={"retry-after": retry_after} if retry_after else {})
+
+def _gateway():
+    return ProviderGateway("test", requests_per_minute=6000, burst=10, max_concurrency=1)
+
+def test_backoff_does_not_hold_the_concurrency_slot(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "BASE_BACKOFF", 0.5)
+    monkeypatch.setattr(llm_gateway, "MAX_BACKOFF", 0.5)
+    gateway = _gateway()
+    failed_once, in_backoff = threading.Event(), threading.Event()
+
+    def flaky():
+        if not failed_once.is_set():
+            failed_once.set()
+            in_backoff.set()
+            raise Unavailable(retry_after="0.5")
+        return "retried"
+
+    t = threading.Thread(target=lambda: gateway.call("k", flaky))
+    t.start()
+    in_backoff.wait(5)
+    time.sleep(0.05)
+    t0 = time.monotonic()
+    assert gateway.call("k", lambda: "other", deadline=time.monotonic() + 0.3) == "other"
+    assert time.monotonic() - t0 < 0.3    # not queued behind the retrying call
+    t.join(5)
+    assert gateway.stats["retries"] == 1
+
+def test_retry_after_is_capped_at_the_backoff_maximum(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "MAX_BACKOFF", 0.1)
+    calls = []
+
+    def unavailable_then_ok():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise Unavailable(retry_after="3600")
+        return "ok"
+
+    assert _gateway().call("k", unavailable_then_ok, deadline=time.monotonic() + 5) == "ok"
+    assert calls[1] - calls[0] < 1
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from backend.llm_replay import Cassette, CassetteMiss, make_response, request_fingerprint
+
+def _request(i):
+    return {"model": "m", "messages": [{"role": "user", "content": f"question {i}"}]}
+
+def test_recording_appends_one_line_per_interaction(tmp_path):
+    path = tmp_path / "run.jsonl"
+    cassette = Cassette(str(path), "record")
+    for i in range(3):
+        cassette.record("openrouter", _request(i), make_response(f"answer {i}", tokens=i))
+    assert len(path.read_text().splitlines()) == 3
+
+    replay = Cassette(str(path))
+    assert replay.replay("openrouter", _request(2)).text == "answer 2"
+    with pytest.raises(CassetteMiss):
+        replay.replay("openrouter", _request(3))
+
+def test_torn_last_line_is_skipped(tmp_path):
+    path = tmp_path / "run.jsonl"
+    Cassette(str(path), "record").record("gemini", _request(0), make_response("ok"))
+    with open(path, "a") as f:
+        f.write('{"key": "trunc')
+    assert Cassette(str(path)).replay("gemini", _request(0)).text == "ok"
+
+def test_version_1_cassette_is_read_and_converted(tmp_path):
+    path = tmp_path / "run.json"
+    item = {"key": request_fingerprint("gemini", _request(0)), "provider": "gemini", "model": "m",
+            "response": {"text": "old", "tokens": 1}}
+    path.write_text(json.dumps({"version": 1, "interactions": [item]}, indent=2))
+    assert Cassette(str(path)).replay("gemini", _request(0)).text == "old"
+
+    Cassette(str(path), "record").record("gemini", _request(1), make_response("new"))
+    assert [json.loads(line)["response"]["text"] for line in path.read_text().splitlines()] == ["old", "new"]
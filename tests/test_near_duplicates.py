@@ -0,0 +1,34 @@
+from backend import near_duplicates as nd
+
+ESSAY = "photosynthesis turns light energy into chemical energy stored in glucose inside the chloroplast"
+OTHER = "the mitochondria releases energy from glucose during respiration which every living cell needs"
+
+def _sub(student_id, text):
+    return {"student_id": student_id, "test_id": "t1", "answers": [{"question_id": "Q1", "text": [text]}]}
+
+def _clustered(subs):
+    return [c["students"] for c in nd.find_clusters("t1", subs).get("Q1", [])]
+
+def test_changed_answers_are_signed_again(tmp_db):
+    subs = [_sub("s1", ESSAY), _sub("s2", ESSAY), _sub("s3", OTHER)]
+    for sub in subs:
+        nd.index_submission(sub)
+    assert _clustered(subs) == [["s1", "s2"]]
+
+    # Saved without the index hook (e.g. a plain upsert_submission)
+    subs[1] = _sub("s2", OTHER + " and plants")
+    assert _clustered(subs) == [["s2", "s3"]]
+
+    # The digests survive a reload of the log
+    nd._loaded_from = None
+    assert _clustered(subs) == [["s2", "s3"]]
+    assert nd._indexes[("t1", "Q1")].digests["s2"] == nd.digest(OTHER + " and plants")
+
+def test_unchanged_answers_are_not_logged_again(tmp_db):
+    subs = [_sub("s1", ESSAY), _sub("s2", ESSAY)]
+    nd.find_clusters("t1", subs)
+    with open(nd.index_path()) as f:
+        lines = f.readlines()
+    nd.find_clusters("t1", subs)
+    with open(nd.index_path()) as f:
+        assert f.readlines() == lines
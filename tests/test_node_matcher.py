@@ -0,0 +1,35 @@
+from types import SimpleNamespace
+
+from backend.flowchart_pipeline import classify_intent
+from backend.master_grader import grade_flowchart_key_point
+from backend.node_matcher import NodeMatcher
+
+def _matcher(texts):
+    rules = [SimpleNamespace(type="node_check", raw={"expected_text": t}, expected_intent=classify_intent(t),
+                             from_intent=None, to_intent=None) for t in texts]
+    return NodeMatcher(rules)
+
+def _accepted(rule_text, node_text):
+    m = _matcher([rule_text])
+    _, accepted = m.acceptance([node_text], [m.classify(node_text)])
+    return bool(accepted[0, 0])
+
+def test_assignments_of_different_variables_do_not_match():
+    assert classify_intent("total = price * qty") == classify_intent("count = 0") == "ASSIGNMENT"
+    assert not _accepted("total = price * qty", "count = 0")
+    assert not _accepted("i = 0", "total = 1")
+
+def test_renamed_statements_still_match():
+    assert _accepted("sum = 0", "total = 0")
+    assert _accepted("Is N > 0?", "count > 10 ?")
+    assert _accepted("Start", "Begin")   # specific intents need no similar wording
+
+def test_renamed_flowchart_keeps_full_marks():
+    kp = {"id": "k1", "concept": "loop", "marks": 4, "acceptable_modalities": ["flowchart"], "evaluation_rules": [
+        {"id": "r1", "type": "node_check", "expected_text": "sum = 0", "marks": 1},
+        {"id": "r2", "type": "node_check", "expected_text": "Is N > 0?", "marks": 1},
+        {"id": "r3", "type": "connection_check", "from_text": "Input N", "to_text": "Is N > 0?", "marks": 1},
+        {"id": "r4", "type": "connection_check", "from_text": "sum = 0", "to_text": "Is N > 0?", "marks": 1}]}
+    graph = {"nodes": [{"id": "a", "text": "Read count"}, {"id": "b", "text": "total = 0"}, {"id": "c", "text": "count > 10 ?"}],
+             "edges": [{"source": "a", "target": "b"}, {"source": "b", "target": "c"}]}
+    assert grade_flowchart_key_point(kp, [graph])[0] == 4
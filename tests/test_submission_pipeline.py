@@ -0,0 +1,74 @@
+import os
+
+from backend import db_handler, submission_pipeline as sp
+
+def _unreadable(job):
+    raise RuntimeError("no answers found")
+
+def test_failed_extraction_is_recorded_on_the_submission(tmp_db):
+    job = sp.SubmissionJob("s1", "t1", file_bytes=b"%PDF-1.4", file_type="application/pdf")
+    sp.persist(job)
+    assert os.path.exists(sp._upload_path(job.job_id))
+
+    pipeline = sp.SubmissionPipeline(stages=[("extracting", _unreadable, 1)])
+    try:
+        pipeline.submit(job)
+        pipeline.join(timeout=10)
+    finally:
+        pipeline.close()
+
+    sub = db_handler.get_submission("s1", "t1")
+    assert job.status == "failed"
+    assert sub["status"] == "Extraction Failed"
+    assert "no answers found" in sub["pipeline_error"]
+    assert "pending_upload" not in sub
+    assert not os.path.exists(sp._upload_path(job.job_id))
+    assert sp.resume_pending(pipeline) == 0    # not queued again on restart
+
+def test_failure_of_a_replaced_job_leaves_the_resubmission_alone(tmp_db):
+    old = sp.SubmissionJob("s1", "t1", answers=[{"question_id": "Q1", "text": "a"}])
+    sp.persist(old)
+    new = sp.SubmissionJob("s1", "t1", answers=[{"question_id": "Q1", "text": "b"}])
+    sp.persist(new)
+
+    old.error = "grading: boom"
+    sp.record_failure(old, "grading")
+    assert "pipeline_error" not in db_handler.get_submission("s1", "t1")
+
+def _graded(answers, test, student_id):
+    return [{"question_id": "Q1", "score": 1, "max_score": 2, "breakdown": []}]
+
+def test_reviewed_answers_are_auto_graded(tmp_db, monkeypatch):
+    from backend import master_grader
+    monkeypatch.setattr(master_grader, "auto_grade_submission", _graded)
+    db_handler.publish_test({"test_id": "t1", "test_name": "Algebra", "rubric": {}})
+
+    job = sp.SubmissionJob("s1", "t1", answers=[{"question_id": "Q1", "text": ["x = 2"]}])
+    sp.persist(job)
+    assert db_handler.get_submission("s1", "t1")["status"] == "Submitted"
+
+    pipeline = sp.SubmissionPipeline()
+    try:
+        pipeline.submit(job)
+        pipeline.join(timeout=10)
+    finally:
+        pipeline.close()
+
+    sub = db_handler.get_submission("s1", "t1")
+    assert job.status == "done"
+    assert sub["status"] == "Auto-Graded" and sub["auto_graded"]
+    assert sub["graded_result"][0]["score"] == 1
+
+def test_auto_grade_never_overwrites_a_teacher_grade(tmp_db, monkeypatch):
+    from backend import master_grader
+    monkeypatch.setattr(master_grader, "auto_grade_submission", _graded)
+    db_handler.publish_test({"test_id": "t1", "test_name": "Algebra", "rubric": {}})
+    job = sp.SubmissionJob("s1", "t1", answers=[])
+    sp.persist(job)
+
+    sub = db_handler.thaw(db_handler.get_submission("s1", "t1"))
+    sub["graded_result"] = [{"question_id": "Q1", "score": 2, "max_score": 2}]
+    db_handler.upsert_submission(sub)
+    sp.grade_stage(job)
+    sub = db_handler.get_submission("s1", "t1")
+    assert sub["graded_result"][0]["score"] == 2 and not sub.get("auto_graded")